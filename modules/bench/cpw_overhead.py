@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Overhead of the Execution Scan Trigger (modules/cpw) against an
+uninstrumented run of the same program.
+
+  python3 modules/bench/cpw_overhead.py
+  python3 modules/bench/cpw_overhead.py --modules 500 --loops 2000000 --repeat 21 --out cpw.json
+
+A throwaway warehouse gets --modules generated modules and a main script that
+imports all of them and then runs a CPU loop; a fresh registry is created
+next to it. Three variants run interleaved, --repeat times each, as separate
+processes:
+
+  baseline       python main.py
+  cpw_run        python -m cpw.run --db ... --root ... main.py
+  sitecustomize  PYTHONPATH=modules/cpw/site python main.py
+
+Each run records wall time and the child's CPU time (user + sys, which
+includes the trigger's writer thread); both include interpreter start-up and
+the exit spool. Overhead is the median over repeats of traced / baseline for
+runs made back to back: on a shared machine identical runs differ by far more
+than 2%, and pairing cancels most of the drift. --target is checked on CPU
+time; exit status is 1 when either variant exceeds it.
+
+The fixed part of the cost is reported separately as startup_ms (best-of-N
+wall time of an empty script, minus the baseline's): for `python -m cpw.run`
+it is mostly runpy, which any `python -m` pays, so its share shrinks as runs
+get longer.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import pathlib
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = pathlib.Path(__file__).resolve().parent
+MODULES = HERE.parent
+REGISTRY = MODULES / "registry" / "registry.py"
+
+MODULE_SRC = '''
+"""generated module {i}"""
+import math
+
+TABLE = [math.sqrt(k) for k in range(64)]
+
+def f{i}(x):
+    return sum(TABLE[(x + k) % 64] for k in range(8))
+
+class C{i}:
+    def run(self, x):
+        return f{i}(x) * 2
+'''
+
+MAIN_SRC = '''
+import importlib
+import sys
+
+mods = [importlib.import_module(f"wh_mods.m{{i:04d}}") for i in range({modules})]
+acc = 0
+for n in range({loops}):
+    acc += n % 7
+print(acc, len(mods), file=sys.stderr)
+'''
+
+def build(root: pathlib.Path, modules: int, loops: int) -> pathlib.Path:
+    pkg = root / "wh_mods"
+    pkg.mkdir(parents=True)
+    (pkg / "__init__.py").write_text("", encoding="utf-8")
+    for i in range(modules):
+        (pkg / f"m{i:04d}.py").write_text(MODULE_SRC.format(i=i), encoding="utf-8")
+    main = root / "main.py"
+    main.write_text(MAIN_SRC.format(modules=modules, loops=loops), encoding="utf-8")
+    (root / "empty.py").write_text("", encoding="utf-8")
+    return main
+
+def timed(argv: list[str], env: dict, cwd: pathlib.Path) -> tuple[float, float]:
+    """(wall seconds, child CPU seconds) for one run."""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    t0 = time.perf_counter()
+    subprocess.run(argv, env=env, cwd=cwd, check=True, stderr=subprocess.DEVNULL)
+    wall = time.perf_counter() - t0
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return wall, (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(description="Measure Execution Scan Trigger overhead.")
+    p.add_argument("--modules", type=int, default=200, help="generated warehouse modules imported per run")
+    p.add_argument("--loops", type=int, default=10_000_000, help="iterations of the CPU loop after the imports")
+    p.add_argument("--repeat", type=int, default=15)
+    p.add_argument("--target", type=float, default=0.02, help="allowed slowdown ratio")
+    p.add_argument("--out", help="write results JSON here")
+    args = p.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="cpw-overhead-") as tmp:
+        root = pathlib.Path(tmp) / "warehouse"
+        main_py = build(root, args.modules, args.loops)
+        db = pathlib.Path(tmp) / "registry.sqlite"
+        subprocess.run([sys.executable, str(REGISTRY), "--db", str(db), "init"], check=True)
+
+        base_env = {k: v for k, v in os.environ.items() if not k.startswith("CPW_") and k != "PYTHONPATH"}
+        traced_env = dict(base_env, CPW_REGISTRY=str(db), CPW_ROOTS=str(root))
+        variants = {
+            "baseline": ([sys.executable, "main.py"], base_env),
+            "cpw_run": (
+                [sys.executable, "-m", "cpw.run", "--db", str(db), "--root", str(root), "main.py"],
+                dict(base_env, PYTHONPATH=str(MODULES)),
+            ),
+            "sitecustomize": ([sys.executable, "main.py"], dict(traced_env, PYTHONPATH=str(MODULES / "cpw" / "site"))),
+        }
+        for cmd, env in variants.values():  # warm the page cache and __pycache__
+            timed(cmd, env, root)
+        times: dict[str, list[tuple[float, float]]] = {name: [] for name in variants}
+        empty: dict[str, list[float]] = {name: [] for name in variants}
+        for _ in range(args.repeat):
+            for name, (cmd, env) in variants.items():
+                times[name].append(timed(cmd, env, root))
+                empty[name].append(timed([*cmd[:-1], "empty.py"], env, root)[0])
+
+        # Runs shorter than the writer interval leave their referrals spooled.
+        subprocess.run([sys.executable, str(REGISTRY), "--db", str(db), "referrals", "--limit", "0"], check=True)
+        conn = sqlite3.connect(str(db))
+        referred = conn.execute("SELECT COUNT(*), COUNT(DISTINCT run_id) FROM execution_referrals").fetchone()
+        conn.close()
+
+    results, failed = {}, False
+    for name, ts in times.items():
+        r = {}
+        for i, k in enumerate(("wall", "cpu")):
+            vals = [t[i] for t in ts]
+            ratios = [t[i] / base[i] for t, base in zip(ts, times["baseline"])]
+            r.update({
+                f"{k}_median_s": round(statistics.median(vals), 4), f"{k}_min_s": round(min(vals), 4),
+                f"{k}_overhead": round(statistics.median(ratios) - 1, 4),
+            })
+        r["startup_ms"] = round((min(empty[name]) - min(empty["baseline"])) * 1000, 2)
+        results[name] = r
+        flag = ""
+        if name != "baseline" and r["cpu_overhead"] > args.target:
+            failed, flag = True, "  OVER TARGET"
+        print(f"{name:14} cpu {r['cpu_median_s']:.4f}s {r['cpu_overhead']:+7.2%}   "
+              f"wall {r['wall_median_s']:.4f}s {r['wall_overhead']:+7.2%}   "
+              f"start-up {r['startup_ms']:+.1f} ms{flag}")
+    print(f"{referred[0]} referrals from {referred[1]} traced runs", file=sys.stderr)
+
+    if args.out:
+        report = {"args": vars(args), "python": sys.version.split()[0], "results": results,
+                  "referrals": referred[0], "traced_runs": referred[1]}
+        pathlib.Path(args.out).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Registry benchmarks at several sizes, results as JSON.
+
+  python3 modules/bench/run.py --sizes 10k,100k,1m --out bench-2026-10-17.json
+  python3 modules/bench/run.py --sizes 100k --compare bench-2026-10-17.json
+
+For each size a fresh registry is filled by synth.generate (itself timed as
+bulk_generate), then:
+
+  indexer_full     modules/indexer/main.py into empty outputs (writes every file)
+  indexer_stats    the same run again with --stats-out: unchanged signature, stats CSV only
+  indexer_noop     a third run with nothing appended: watermark check only
+  lineage          ancestors / descendants / gen0-root / current-head on sampled artifacts
+  scan_id_alloc    registry.next_scan_id, one BEGIN IMMEDIATE each
+  single_append    Registry.append: allocation + validation + one commit per row
+  batched_append   ScanSession.append_many, 1000-row scans
+
+Every result carries n, total_s and ms_per_op; latency benches add p50/p95/max.
+--compare prints ms_per_op against an earlier results file and flags
+anything more than --threshold slower. Both indexer runs are subprocesses and
+include interpreter start-up (reported once as python_startup_s).
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import os
+import pathlib
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent / "registry"))
+
+import lineage  # noqa: E402
+import registry  # noqa: E402
+import synth  # noqa: E402
+
+INDEXER = HERE.parent / "indexer" / "main.py"
+
+def parse_size(s: str) -> int:
+    s = s.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(s[-1:], 1)
+    return int(float(s.rstrip("km")) * mult)
+
+def result(times: list[float], total: float | None = None) -> dict:
+    """Latency summary for per-op timings in seconds."""
+    total = sum(times) if total is None else total
+    out = {"n": len(times), "total_s": round(total, 6), "ms_per_op": round(total / len(times) * 1000, 4)}
+    if len(times) > 1:
+        ms = sorted(t * 1000 for t in times)
+        out.update({
+            "p50_ms": round(statistics.median(ms), 4),
+            "p95_ms": round(ms[int(len(ms) * 0.95) - 1], 4),
+            "max_ms": round(ms[-1], 4),
+        })
+    return out
+
+def run_indexer(db: pathlib.Path, out_dir: pathlib.Path, stats: bool) -> float:
+    argv = [
+        sys.executable, str(INDEXER), "--db", str(db),
+        "--json-out", str(out_dir / "index-manifest.json"),
+        "--txt-out", str(out_dir / "index.txt"),
+        "--md-out", str(out_dir / "index.md"),
+    ]
+    if stats:
+        argv += ["--stats-out", str(out_dir / "stats.csv")]
+    t0 = time.perf_counter()
+    subprocess.run(argv, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+# --- benches
+
+def bench_indexer(db: pathlib.Path, work: pathlib.Path) -> dict:
+    out_dir = work / "index"
+    out_dir.mkdir()
+    full = run_indexer(db, out_dir, stats=False)
+    stats = run_indexer(db, out_dir, stats=True)
+    noop = run_indexer(db, out_dir, stats=True)
+    return {"indexer_full": result([full]), "indexer_stats": result([stats]), "indexer_noop": result([noop])}
+
+def bench_lineage(conn: sqlite3.Connection, rng: random.Random, n: int) -> dict:
+    def sample(kind: str) -> list[str]:
+        ids = [r[0] for r in conn.execute(
+            "SELECT artifact_id FROM artifacts_current WHERE artifact_type = ?", (kind,)
+        )]
+        return [rng.choice(ids) for _ in range(n)] if ids else []
+
+    cids, pyns = sample("CID"), sample("PYN")
+    # Supersedes chains live on PYNs; start from the oldest so the walk is long.
+    roots = [r[0] for r in conn.execute("""
+        SELECT ancestor FROM lineage_closure WHERE kind = 'supersedes'
+        GROUP BY ancestor ORDER BY MAX(depth) DESC LIMIT ?
+    """, (n,))] or pyns
+    cases = {
+        "ancestors_parent": (lambda a: lineage.ancestors(conn, a, "parent"), cids),
+        "descendants_parent": (lambda a: lineage.descendants(conn, a, "parent"), pyns),
+        "gen0_root": (lambda a: lineage.gen0_root(conn, a), pyns),
+        "current_head": (lambda a: lineage.current_head(conn, a), roots),
+    }
+    out = {}
+    for name, (fn, ids) in cases.items():
+        times = []
+        for aid in ids:
+            t0 = time.perf_counter()
+            fn(aid)
+            times.append(time.perf_counter() - t0)
+        if times:
+            out[f"lineage_{name}"] = result(times)
+    return out
+
+def bench_scan_ids(conn: sqlite3.Connection, n: int) -> dict:
+    times = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        registry.next_scan_id(conn, registry.now_utc())
+        times.append(time.perf_counter() - t0)
+    return {"scan_id_alloc": result(times)}
+
+def bench_appends(db: pathlib.Path, rng: random.Random, singles: int, batches: int, batch_rows: int) -> dict:
+    ids = iter(range(10**9))
+
+    def row() -> dict:
+        i = next(ids)
+        return {
+            "artifact_type": "CID", "artifact_id": f"CID-B{i:08d}", "pyn_id": f"PYN-B{i // 50:06d}",
+            "parent_id": f"SID-B{i // 5:07d}", "capability": rng.choice(synth.CAPABILITIES),
+            "metadata_json": {"code_hash_full": synth.code_hash("bench", i), "use_env_last": rng.choice(synth.ENVS)},
+        }
+
+    with registry.Registry(db) as reg:
+        times = []
+        for _ in range(singles):
+            r = row()
+            t0 = time.perf_counter()
+            reg.append(r)
+            times.append(time.perf_counter() - t0)
+        out = {"single_append": result(times)}
+
+        times = []
+        for _ in range(batches):
+            rows = [row() for _ in range(batch_rows)]
+            t0 = time.perf_counter()
+            with reg.scan() as s:
+                s.append_many(rows)
+            times.append(time.perf_counter() - t0)
+    b = result(times)
+    b["rows_per_s"] = round(batches * batch_rows / b["total_s"], 1)
+    b["batch_rows"] = batch_rows
+    out["batched_append"] = b
+    return out
+
+def run_size(rows: int, work: pathlib.Path, args: argparse.Namespace) -> dict:
+    db = work / "registry.sqlite"
+    rng = random.Random(args.seed)
+    out: dict = {}
+    with registry.connect(db) as conn:
+        registry.init_db(conn)
+        g = synth.generate(conn, rows, seed=args.seed)
+    out["bulk_generate"] = {
+        "n": g["rows"], "total_s": round(g["total_s"], 3), "ms_per_op": round(g["total_s"] / g["rows"] * 1000, 4),
+        "rows_per_s": round(g["rows_per_s"], 1), "scans": g["scans"], "artifacts": g["artifacts"],
+    }
+    print(f"  generated {g['rows']:,} rows in {g['total_s']:.1f}s", file=sys.stderr)
+
+    out.update(bench_indexer(db, work))
+    print(f"  indexer {out['indexer_full']['total_s']:.2f}s full, "
+          f"{out['indexer_stats']['total_s']:.2f}s stats, {out['indexer_noop']['total_s']:.3f}s no-op", file=sys.stderr)
+
+    conn = registry.connect(db)
+    try:
+        registry.init_db(conn)
+        out.update(bench_lineage(conn, rng, args.lineage_n))
+        out.update(bench_scan_ids(conn, args.alloc_n))
+    finally:
+        conn.close()
+    out.update(bench_appends(db, rng, args.singles, args.batches, args.batch_rows))
+
+    conn = sqlite3.connect(str(db))
+    out["db"] = {
+        "bytes": db.stat().st_size,
+        "page_count": conn.execute("PRAGMA page_count").fetchone()[0],
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+        "scan_events": conn.execute("SELECT COUNT(*) FROM scan_events").fetchone()[0],
+        "artifacts_current": conn.execute("SELECT COUNT(*) FROM artifacts_current").fetchone()[0],
+    }
+    conn.close()
+    return out
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def python_startup() -> float:
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return round(time.perf_counter() - t0, 4)
+
+def compare(prev: dict, cur: dict, threshold: float) -> int:
+    """Print ms_per_op old -> new per size/bench; returns the number of regressions."""
+    regressions = 0
+    for size, benches in cur["results"].items():
+        old = prev.get("results", {}).get(size)
+        if not old:
+            continue
+        for name, r in benches.items():
+            o = old.get(name)
+            if not o or "ms_per_op" not in r or "ms_per_op" not in o:
+                continue
+            ratio = r["ms_per_op"] / o["ms_per_op"] if o["ms_per_op"] else float("inf")
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  SLOWER"
+                regressions += 1
+            elif ratio < 1 - threshold:
+                flag = "  faster"
+            print(f"{size:>8} {name:28} {o['ms_per_op']:>12.4f} -> {r['ms_per_op']:>12.4f} ms/op  {ratio:6.2f}x{flag}")
+    return regressions
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(description="Benchmark the registry and indexer on synthetic data.")
+    p.add_argument("--sizes", default="10k,100k,1m", help="comma-separated row counts (k/m suffixes)")
+    p.add_argument("--out", help="results JSON (default: bench-<UTC time>.json)")
+    p.add_argument("--compare", help="earlier results JSON to compare against")
+    p.add_argument("--threshold", type=float, default=0.10, help="slowdown ratio flagged by --compare")
+    p.add_argument("--work-dir", help="keep the generated registries here instead of a temp dir")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--singles", type=int, default=200, help="single appends per size")
+    p.add_argument("--batches", type=int, default=10, help="batched-append scans per size")
+    p.add_argument("--batch-rows", type=int, default=1000)
+    p.add_argument("--alloc-n", type=int, default=1000, help="scan_id allocations per size")
+    p.add_argument("--lineage-n", type=int, default=200, help="queries per lineage case")
+    args = p.parse_args(argv)
+
+    try:
+        sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    except ValueError:
+        raise SystemExit(f"ERROR: bad --sizes {args.sizes!r}")
+    started = dt.datetime.now(dt.timezone.utc)
+    report = {
+        "meta": {
+            "started_utc": registry.iso_utc_ms(started),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "python_startup_s": python_startup(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+
+    tmp = None
+    if args.work_dir:
+        base = pathlib.Path(args.work_dir)
+        base.mkdir(parents=True, exist_ok=True)
+    else:
+        tmp = tempfile.TemporaryDirectory(prefix="registry-bench-")
+        base = pathlib.Path(tmp.name)
+    try:
+        for rows in sizes:
+            print(f"{rows:,} rows", file=sys.stderr)
+            work = base / f"rows-{rows}"
+            if work.exists():
+                raise SystemExit(f"ERROR: {work} already exists")
+            work.mkdir()
+            report["results"][str(rows)] = run_size(rows, work, args)
+    finally:
+        if tmp:
+            tmp.cleanup()
+
+    out = pathlib.Path(args.out or f"bench-{started.strftime('%Y%m%dT%H%M%SZ')}.json")
+    out.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"wrote {out}", file=sys.stderr)
+
+    if args.compare:
+        prev = json.loads(pathlib.Path(args.compare).read_text(encoding="utf-8"))
+        return 1 if compare(prev, report, args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
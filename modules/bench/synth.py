@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Synthetic scan_events data shaped like a real warehouse, for benchmarks.
+
+  python3 modules/bench/synth.py --db /tmp/bench.sqlite --rows 100000
+
+Artifacts come in families: a PYN, its SIDs (3-8) and their CIDs (1-5
+each). A scan re-reports one family's current generation, so a scan is
+~20-60 rows and the same artifacts recur across many scans and days.
+Scans favour a few hot families (Zipf-like), and now and then a family is
+rewritten: the new PYN supersedes the old one (and the old one is
+re-reported as superseded_by it) with fresh SIDs and mostly fresh CIDs, so
+hot families grow long supersedes chains next to the parent edges, and
+carried-over CIDs end up owned by several PYNs (merge candidates). SIDs
+also churn their code hash occasionally.
+
+Rows go through registry.row_params and write_rows like any other append,
+so every trigger (artifacts_current, lineage, reports, search) does its
+usual work. Output is deterministic for a given seed.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import hashlib
+import pathlib
+import random
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "registry"))
+
+import registry  # noqa: E402
+
+START = dt.datetime(2025, 1, 1, tzinfo=dt.timezone.utc)
+
+ENVS = ["py311-linux", "py312-linux", "py311-win", "py310-mac", "colab", "lambda"]
+WORDS = (
+    "parse load save config retry backoff cache index schema token auth order trade signal "
+    "entry exit risk report fetch merge split render export import queue worker batch stream "
+    "window filter score rank encode decode hash verify session client server route"
+).split()
+CAPABILITIES = [f"{a}_{b}" for a in WORDS[:12] for b in WORDS[12:24]]
+
+def words(rng: random.Random, n: int) -> str:
+    return " ".join(rng.sample(WORDS, n))
+
+def code_hash(*parts) -> str:
+    return hashlib.sha1("/".join(map(str, parts)).encode()).hexdigest()
+
+class Family:
+    """One PYN lineage: the current generation's SIDs and CIDs."""
+
+    def __init__(self, synth: "Synth", n: int):
+        self.synth = synth
+        self.n = n
+        self.gen = 0
+        self.prev_pyn: str | None = None
+        self.new_generation()
+
+    def new_generation(self) -> None:
+        s, rng = self.synth, self.synth.rng
+        self.prev_pyn = getattr(self, "pyn", None)
+        self.gen += 1
+        self.pyn = s.new_id("PYN")
+        self.path = f"src/{rng.choice(WORDS)}/{rng.choice(WORDS)}_{self.n}.py"
+        self.env = rng.choice(ENVS)
+        # A rewrite keeps some CIDs: the new PYN then co-owns them (merge candidates).
+        kept = [c for sid in getattr(self, "sids", []) for c in sid["cids"] if rng.random() < 0.3]
+        self.sids = []
+        for _ in range(rng.randint(3, 8)):
+            sid = s.new_id("SID")
+            cids = [kept.pop() if kept else (s.new_id("CID"), rng.choice(CAPABILITIES))
+                    for _ in range(rng.randint(1, 5))]
+            self.sids.append({"id": sid, "rev": 0, "desc": words(rng, 5), "cids": cids})
+
+    def scan_rows(self) -> list[dict]:
+        rng = self.synth.rng
+        if rng.random() < 0.05:
+            self.env = rng.choice(ENVS)
+        for sid in self.sids:
+            if rng.random() < 0.03:
+                sid["rev"] += 1  # code change without a rewrite
+        cid_total = sum(len(s["cids"]) for s in self.sids)
+        rows = [{
+            "artifact_type": "PYN", "artifact_id": self.pyn, "pyn_id": self.pyn,
+            "supersedes_id": self.prev_pyn,
+            "sid_count": len(self.sids), "cid_count": cid_total,
+            "metadata_json": {
+                "description": f"module {self.n} gen {self.gen}", "source_path": self.path,
+                "code_hash_full": code_hash(self.pyn, *(s["rev"] for s in self.sids)),
+                "use_env_last": self.env,
+            },
+        }]
+        if self.prev_pyn and self.synth.rng.random() < 0.5:
+            rows.append({
+                "artifact_type": "PYN", "artifact_id": self.prev_pyn, "pyn_id": self.prev_pyn,
+                "superseded_by_id": self.pyn,
+            })
+        for sid in self.sids:
+            rows.append({
+                "artifact_type": "SID", "artifact_id": sid["id"], "parent_id": self.pyn, "pyn_id": self.pyn,
+                "cid_count": len(sid["cids"]),
+                "metadata_json": {
+                    "description": sid["desc"], "source_path": self.path,
+                    "code_hash_full": code_hash(sid["id"], sid["rev"]),
+                    "cid_sequence": ",".join(c for c, _ in sid["cids"]),
+                    "use_env_last": self.env,
+                },
+            })
+            for cid, cap in sid["cids"]:
+                rows.append({
+                    "artifact_type": "CID", "artifact_id": cid, "parent_id": sid["id"], "pyn_id": self.pyn,
+                    "capability": cap, "standalone_status": "inventory",
+                    "metadata_json": {"code_hash_full": code_hash(cid, sid["rev"]), "use_env_last": self.env},
+                })
+        return rows
+
+class Synth:
+    def __init__(self, seed: int = 0, families: int = 100, scans_per_day: int = 200, rewrite_rate: float = 0.05):
+        self.rng = random.Random(seed)
+        self.counters = {"PYN": 0, "SID": 0, "CID": 0}
+        self.families = [Family(self, n) for n in range(families)]
+        self.weights = [1.0 / (n + 1) ** 0.8 for n in range(families)]
+        self.scans_per_day = scans_per_day
+        self.rewrite_rate = rewrite_rate
+        self.scans = 0
+        self.clock = START
+        self.day = ""
+        self.day_n = 0
+
+    def new_id(self, kind: str) -> str:
+        self.counters[kind] += 1
+        return f"{kind}-{self.counters[kind]:07d}"
+
+    def next_scan(self) -> tuple[str, str, list[dict]]:
+        """(timestamp_utc, scan_id, rows) for the next scan."""
+        self.scans += 1
+        self.clock += dt.timedelta(seconds=86400 / self.scans_per_day)
+        day = self.clock.strftime("%Y%m%d")
+        self.day_n = self.day_n + 1 if day == self.day else 1
+        self.day = day
+        fam = self.rng.choices(self.families, self.weights)[0]
+        if self.rng.random() < self.rewrite_rate:
+            fam.new_generation()
+        return registry.iso_utc_ms(self.clock), f"{day}-{self.day_n:05d}", fam.scan_rows()
+
+def generate(conn, rows: int, seed: int = 0, scans_per_day: int = 200, batch_rows: int = 5000) -> dict:
+    """Append ~`rows` synthetic rows (whole scans) to an initialized registry."""
+    # ~30 rows per scan and ~50 scans per family keeps artifacts recurring.
+    synth = Synth(seed, families=max(10, rows // 1500), scans_per_day=scans_per_day)
+    t0 = time.perf_counter()
+    written = 0
+    while written < rows:
+        batch = []
+        while len(batch) < batch_rows and written + len(batch) < rows:
+            ts, scan_id, scan_rows = synth.next_scan()
+            for r in scan_rows:
+                registry.validate_row(r)  # same guardrails as a real append
+                batch.append(registry.row_params(r, ts, scan_id))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            registry.write_rows(conn, batch)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        written += len(batch)
+    elapsed = time.perf_counter() - t0
+    return {
+        "rows": written, "scans": synth.scans, "families": len(synth.families),
+        "artifacts": sum(synth.counters.values()), "total_s": elapsed, "rows_per_s": written / elapsed,
+        "first_utc": registry.iso_utc_ms(START), "last_utc": registry.iso_utc_ms(synth.clock),
+    }
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(description="Fill a registry with synthetic scan_events rows.")
+    p.add_argument("--db", required=True)
+    p.add_argument("--rows", type=int, default=100_000)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--scans-per-day", type=int, default=200)
+    args = p.parse_args(argv)
+
+    with registry.connect(pathlib.Path(args.db)) as conn:
+        registry.init_db(conn)
+        r = generate(conn, args.rows, args.seed, args.scans_per_day)
+    print(f"{r['rows']} rows, {r['scans']} scans, {r['artifacts']} artifacts in {r['families']} families, "
+          f"{r['first_utc'][:10]}..{r['last_utc'][:10]} ({r['rows_per_s']:,.0f} rows/s)")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,94 @@
+"""
+Run a Python program with the Execution Scan Trigger installed.
+
+  PYTHONPATH=modules python -m cpw.run Scripts/new_script.py --flag
+  PYTHONPATH=modules python -m cpw.run --db registry/registry.sqlite --root Scripts -m my_tool.cli
+
+Behaves like `python script.py` / `python -m module`: same sys.argv,
+sys.path[0], __main__ and exit status. --db and --root are exported as
+CPW_REGISTRY / CPW_ROOTS, so child processes started with
+modules/cpw/site on PYTHONPATH refer into the same registry.
+
+Options are parsed by hand and a script runs the way the interpreter runs
+one (compile, exec in a fresh __main__) rather than through argparse and
+runpy.run_path: together they cost more start-up than the trigger itself.
+"""
+from __future__ import annotations
+
+import os
+import sys
+
+from cpw import trigger
+
+USAGE = "usage: python -m cpw.run [--db DB] [--root DIR]... (script.py | -m module) [args ...]"
+
+def parse(argv: list[str]) -> tuple[dict, str | None, list[str]]:
+    """-> ({"db": ..., "roots": [...]}, module or None, remaining argv)"""
+    opts: dict = {"db": None, "roots": []}
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ("-h", "--help"):
+            print(USAGE)
+            raise SystemExit(0)
+        if arg == "-m":
+            if i + 1 >= len(argv):
+                raise SystemExit(f"{USAGE}\nERROR: -m needs a module name")
+            return opts, argv[i + 1], argv[i + 2:]
+        name, eq, value = arg.partition("=")
+        if name in ("--db", "--root"):
+            if not eq:
+                if i + 1 >= len(argv):
+                    raise SystemExit(f"{USAGE}\nERROR: {name} needs a value")
+                i += 1
+                value = argv[i]
+            if name == "--db":
+                opts["db"] = value
+            else:
+                opts["roots"].append(value)
+            i += 1
+            continue
+        if arg == "--":
+            i += 1
+        elif arg.startswith("-"):
+            raise SystemExit(f"{USAGE}\nERROR: unknown option {arg}")
+        break
+    if i >= len(argv):
+        raise SystemExit(f"{USAGE}\nERROR: a script or -m module is required")
+    return opts, None, argv[i:]
+
+def run_script(path: str, argv: list[str]) -> None:
+    path = os.path.abspath(path)  # co_filename as `python script.py` would set it
+    with open(path, "rb") as f:
+        code = compile(f.read(), path, "exec")
+    main = type(sys)("__main__")
+    main.__file__ = path
+    main.__builtins__ = __builtins__
+    sys.modules["__main__"] = main
+    sys.argv = list(argv)
+    sys.path[0] = os.path.dirname(path)
+    exec(code, main.__dict__)
+
+def main(argv: list[str]) -> int:
+    opts, module, rest = parse(argv)
+    if opts["db"]:
+        os.environ["CPW_REGISTRY"] = os.path.abspath(opts["db"])
+    if opts["roots"]:
+        os.environ["CPW_ROOTS"] = os.pathsep.join(os.path.abspath(r) for r in opts["roots"])
+    trigger.install()
+
+    if module:
+        import runpy  # already loaded by `python -m`
+
+        sys.argv = [module, *rest]  # run_module replaces argv[0] with the file
+        runpy.run_module(module, run_name="__main__", alter_sys=True)
+    else:
+        run_script(rest[0], rest)
+    return 0
+
+if __name__ == "__main__":
+    # Run from the imported module, not this __main__: run_script replaces
+    # sys.modules["__main__"] while main() is still executing.
+    from cpw import run
+
+    raise SystemExit(run.main(sys.argv[1:]))
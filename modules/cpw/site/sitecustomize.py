@@ -0,0 +1,27 @@
+"""
+Install the Execution Scan Trigger in every interpreter that has this
+directory on PYTHONPATH:
+
+  PYTHONPATH=modules/cpw/site python Scripts/new_script.py
+
+Configuration comes from the CPW_* environment variables (see cpw/trigger.py).
+modules/ is put on sys.path only for the import of cpw and removed again, so
+the traced program sees the sys.path it would have had anyway.
+"""
+import os
+import sys
+
+def _install() -> None:
+    modules = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    sys.path.insert(0, modules)
+    try:
+        from cpw import trigger
+
+        trigger.install()
+    except Exception as e:  # never stop the program from starting
+        sys.stderr.write(f"cpw: trigger not installed: {e}\n")
+    finally:
+        sys.path.remove(modules)
+
+_install()
+del _install
@@ -0,0 +1,210 @@
+"""
+Execution Scan Trigger (constitution section 13): refer warehouse files that
+actually ran to the registry's execution_referrals table.
+
+  PYTHONPATH=modules python -m cpw.run [--db DB] [--root DIR] script.py [args]
+  PYTHONPATH=modules/cpw/site python script.py          every python process
+
+An audit hook (sys.addaudithook) sees every code object executed as a module
+body: the main script, imported modules, runpy targets. The hook compares the
+event name, looks the filename up in a dict, and on the first sighting of a
+file under a warehouse root appends (path, time, kind) to a list. Nothing
+else happens on the program's threads.
+
+A writer thread, started with the first referral, wakes every
+FLUSH_INTERVAL seconds and hands what accumulated to referrals.py, which
+hashes lazily (an unchanged file reuses an earlier run's hash) and inserts
+one batch. Whatever it has not committed when the program exits is written
+to <db>.spool/ as one small TSV file for the next writer or
+`registry.py referrals` to ingest, so a traced program never waits on
+SQLite, not even at exit, and short runs never import sqlite3 at all. (A
+forked child that leaves through os._exit, like a multiprocessing worker,
+skips atexit and keeps only what its writer committed.)
+
+The trigger refers, it does not judge: it never blocks execution, never
+raises into the traced program, and turns itself off with one warning on
+stderr when the registry is unavailable. Start-up stays cheap on purpose:
+only modules the interpreter has already loaded, plus _thread.
+
+Environment (cpw.run sets these from its options, so child processes that
+load the sitecustomize agree with the parent):
+  CPW_REGISTRY  registry database (default: <warehouse>/registry/registry.sqlite)
+  CPW_ROOTS     os.pathsep-separated directories whose files are referred
+                (default: the warehouse checkout)
+  CPW_DISABLE   set to 1 to turn the trigger off
+"""
+from __future__ import annotations
+
+import _thread
+import atexit
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+WAREHOUSE = os.path.dirname(os.path.dirname(HERE))
+REFERRALS_PY = os.path.join(WAREHOUSE, "modules", "registry", "referrals.py")
+
+FLUSH_INTERVAL = 1.0  # seconds between writer batches
+
+def default_db() -> str:
+    return os.path.join(WAREHOUSE, "registry", "registry.sqlite")
+
+def warn(msg: str) -> None:
+    try:
+        sys.stderr.write(f"cpw: {msg}\n")
+    except Exception:
+        pass
+
+def iso_utc_ms(t: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(t)) + f".{int(t * 1000) % 1000:03d}Z"
+
+def load_referrals():
+    """registry/referrals.py by path, so the traced program's sys.path is left alone."""
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location("_cpw_referrals", REFERRALS_PY)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def path_variants(d: str) -> set[str]:
+    # co_filename is whatever sys.path held, so match the directory as given
+    # and symlink-resolved; the trailing separator keeps /wh/a from matching /wh/ab.
+    return {os.path.join(os.path.abspath(d), ""), os.path.join(os.path.realpath(d), "")}
+
+class Trigger:
+    def __init__(self, db: str, roots: list[str]):
+        self.db = os.path.abspath(db)
+        self.roots = tuple(sorted({v for r in roots for v in path_variants(r)}, key=len, reverse=True))
+        self.exclude = tuple(path_variants(HERE))
+        self.python = ".".join(map(str, sys.version_info[:3]))
+        self.run_id = os.urandom(8).hex()
+        self.seen: dict[str, bool] = {REFERRALS_PY: False}  # the writer loads it
+        self.pending: list[tuple] = []
+        self.inflight: list[tuple] = []  # taken by the writer, not yet committed
+        self.lock = _thread.allocate_lock()
+        self.writer_started = False
+        self.disabled = False
+        self.argv0 = self.main = None
+
+    # --- traced-program side: keep it cheap, never raise
+
+    def hook(self, event: str, args: tuple) -> None:
+        if event != "exec" or self.disabled:
+            return
+        try:
+            filename = args[0].co_filename
+            if filename in self.seen:
+                return
+            self.seen[filename] = False
+            if not filename.startswith(self.roots) or filename.startswith(self.exclude):
+                return  # also <string>, <frozen ...>
+            self.seen[filename] = True
+            root = next(r for r in self.roots if filename.startswith(r))
+            argv0 = sys.argv[0] if sys.argv else ""
+            if argv0 != self.argv0:  # runpy rewrites argv[0] before running __main__
+                self.argv0, self.main = argv0, os.path.abspath(argv0) if argv0 else None
+            kind = "main" if filename == self.main else "import"
+            with self.lock:
+                self.pending.append((filename, filename[len(root):], time.time(), kind))
+                if not self.writer_started:
+                    self.writer_started = True
+                    _thread.start_new_thread(self.writer, ())
+        except Exception:
+            pass
+
+    def spool(self) -> None:
+        """atexit: leave uncommitted referrals for the next writer; no SQLite here."""
+        with self.lock:
+            items, self.pending = self.inflight + self.pending, []
+        if not items:
+            return
+        lines = []
+        for path, rel, t, kind in items:
+            if "\t" in path or "\n" in path:
+                continue
+            try:
+                st = os.stat(path)
+                size, mtime_ns = str(st.st_size), str(st.st_mtime_ns)
+            except OSError:
+                size = mtime_ns = ""
+            lines.append("\t".join((self.run_id, iso_utc_ms(t), path, rel, kind, size, mtime_ns,
+                                    self.python, sys.platform)) + "\n")
+        d = f"{self.db}.spool"
+        try:
+            if not os.path.exists(self.db):
+                return
+            os.makedirs(d, exist_ok=True)
+            name = f"{int(time.time() * 1000)}-{self.run_id}"  # ingested in exit order
+            tmp = os.path.join(d, f"{name}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+            os.replace(tmp, os.path.join(d, f"{name}.tsv"))
+        except OSError as e:
+            warn(f"could not spool {len(lines)} execution referrals: {e}")
+
+    def after_fork(self) -> None:
+        # The child keeps the hook but not the writer thread; it is a new run.
+        self.run_id = os.urandom(8).hex()
+        self.lock = _thread.allocate_lock()
+        self.pending, self.inflight = [], []
+        self.writer_started = False
+
+    # --- writer thread
+
+    def writer(self) -> None:
+        conn = None
+        try:
+            while True:
+                time.sleep(FLUSH_INTERVAL)
+                with self.lock:
+                    self.inflight, self.pending = self.inflight + self.pending, []
+                if not self.inflight:
+                    continue
+                if conn is None:
+                    conn = self.connect()
+                    if conn is None:
+                        return
+                self.referrals.insert_referrals(conn, [
+                    (self.run_id, iso_utc_ms(t), path, rel, kind, None, None, self.python, sys.platform)
+                    for path, rel, t, kind in self.inflight
+                ])
+                with self.lock:
+                    self.inflight = []
+        except Exception as e:
+            self.disabled = True
+            warn(f"execution referrals disabled: {e}")
+
+    def connect(self):
+        import sqlite3
+
+        if not os.path.exists(self.db):
+            # Never create a registry from inside someone's program.
+            self.disabled = True
+            warn(f"no registry at {self.db}; execution referrals disabled")
+            return None
+        self.referrals = load_referrals()
+        conn = sqlite3.connect(self.db, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.referrals.SCHEMA_SQL)  # IF NOT EXISTS; migration step 12 does the same
+        self.referrals.ingest_spool(conn, self.db)  # earlier runs' leftovers
+        return conn
+
+_trigger: Trigger | None = None
+
+def install(db: str | None = None, roots: list[str] | None = None) -> Trigger | None:
+    """Start referring executed warehouse files; idempotent per process."""
+    global _trigger
+    if _trigger is not None or os.environ.get("CPW_DISABLE") == "1":
+        return _trigger
+    db = db or os.environ.get("CPW_REGISTRY") or default_db()
+    if roots is None:
+        roots = [r for r in os.environ.get("CPW_ROOTS", "").split(os.pathsep) if r] or [WAREHOUSE]
+    t = Trigger(db, roots)
+    sys.addaudithook(t.hook)  # cannot be removed again; `disabled` turns it into a no-op
+    atexit.register(t.spool)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=t.after_fork)
+    _trigger = t
+    return t
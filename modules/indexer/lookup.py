@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Look artifacts up in the indexer's binary index without parsing the manifest.
+
+  python modules/indexer/lookup.py Artifacts/index-manifest.idx --id CID-0000090
+  python modules/indexer/lookup.py Artifacts/index-manifest.idx --hash d7d39bd7
+  python modules/indexer/lookup.py Artifacts/index-manifest.idx --capability save_report
+
+  from lookup import LookupIndex
+
+  with LookupIndex("Artifacts/index-manifest.idx") as idx:
+      idx.find("CID-0000090")        # [{"artifact_type": ..., "artifact_id": ..., ...}]
+
+main.py writes the index next to the manifest, one record per (artifact_type,
+artifact_id), from the artifact's newest row. The file is mmapped and every
+lookup is a binary search over fixed-width tables, so its cost grows with
+log2(artifacts) and nothing is read besides the pages it touches.
+
+Layout, little-endian, sections 8-byte aligned:
+
+  header          HEADER below: counts, section offsets from the start of the
+                  file, two reserved zeros, and the manifest's structural
+                  signature
+  string table    string_count + 1 u64 offsets into the string heap, then the
+                  heap: every artifact_type, use_env_last and capability value
+                  as UTF-8, sorted bytewise
+  id table        record_count + 1 u64 offsets into the id heap, then the heap:
+                  artifact_ids as UTF-8, in record order
+  records         RECORD per artifact, sorted by (artifact_id, artifact_type):
+                  the first 8 bytes of code_hash_full, how many hex digits of
+                  it those hold (0: none), string numbers for type, env and
+                  capability (NONE: null), and the artifact's row count
+  by hash         hashed_count u32 record numbers, sorted by hash prefix
+  by capability   capable_count u32 record numbers, sorted by capability
+
+Values are stored as text; lookups raise nothing for unknown keys, they
+return an empty list.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import struct
+import sys
+
+MAGIC = b"ARTLKUP\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sII11Q32s")
+RECORD = struct.Struct("<8sIIIII")
+HASH_BYTES = 8
+NONE = 0xFFFFFFFF
+_SPAN = struct.Struct("<2Q")
+_U32 = struct.Struct("<I")
+
+def hash_prefix(value) -> tuple:
+    """(8 bytes, hex digits held) for a code_hash_full value; (zeros, 0) if it is not hex."""
+    h = str(value)[:HASH_BYTES * 2].lower() if value is not None else ""
+    try:
+        return bytes.fromhex(h.ljust(HASH_BYTES * 2, "0")), len(h)
+    except ValueError:
+        return bytes(HASH_BYTES), 0
+
+class LookupIndex:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self.mm) < HEADER.size:
+                raise ValueError(f"{path}: not a lookup index")
+            (magic, version, record_size, self.record_count, self.string_count, self.hashed_count,
+             self.capable_count, self.string_table, self.id_table, self.records, self.hash_order,
+             self.capability_order, _, _, sig) = HEADER.unpack_from(self.mm)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                raise ValueError(f"{path}: not a version {VERSION} lookup index")
+        except BaseException:
+            self.mm.close()
+            raise
+        self.signature = sig.hex()
+        self.string_heap = self.string_table + (self.string_count + 1) * 8
+        self.id_heap = self.id_table + (self.record_count + 1) * 8
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.mm.close()
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def _bytes(self, table: int, heap: int, i: int) -> bytes:
+        start, end = _SPAN.unpack_from(self.mm, table + i * 8)
+        return self.mm[heap + start:heap + end]
+
+    def _string(self, i: int):
+        return None if i == NONE else self._bytes(self.string_table, self.string_heap, i).decode("utf-8")
+
+    def _id(self, n: int) -> bytes:
+        return self._bytes(self.id_table, self.id_heap, n)
+
+    def _record(self, n: int) -> tuple:
+        return RECORD.unpack_from(self.mm, self.records + n * RECORD.size)
+
+    def _perm(self, base: int, i: int) -> int:
+        return _U32.unpack_from(self.mm, base + i * 4)[0]
+
+    @staticmethod
+    def _bound(key, target, lo: int, hi: int, upper: bool = False) -> int:
+        """First i in [lo, hi) with key(i) >= target (> target if upper), keys ascending."""
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k = key(mid)
+            if k < target or (upper and k == target):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def record(self, n: int) -> dict:
+        h, digits, t, env, cap, rows = self._record(n)
+        return {
+            "artifact_type": self._string(t),
+            "artifact_id": self._id(n).decode("utf-8"),
+            "use_env_last": self._string(env),
+            "capability": self._string(cap),
+            "code_hash_prefix": h.hex()[:digits] or None,
+            "rows": rows,
+        }
+
+    def _string_number(self, value: str):
+        target = value.encode("utf-8")
+        i = self._bound(lambda i: self._bytes(self.string_table, self.string_heap, i), target, 0, self.string_count)
+        if i < self.string_count and self._bytes(self.string_table, self.string_heap, i) == target:
+            return i
+        return None
+
+    def find(self, artifact_id, artifact_type=None) -> list:
+        """Records for this artifact_id (one per type that uses it), or only the given type."""
+        target = str(artifact_id).encode("utf-8")
+        lo = self._bound(self._id, target, 0, self.record_count)
+        hi = self._bound(self._id, target, lo, self.record_count, upper=True)
+        out = [self.record(n) for n in range(lo, hi)]
+        if artifact_type is not None:
+            out = [r for r in out if r["artifact_type"] == str(artifact_type)]
+        return out
+
+    def by_hash_prefix(self, prefix: str) -> list:
+        """Records whose code_hash_full starts with this hex prefix (only its first 16 digits are compared)."""
+        prefix = prefix.lower()[:HASH_BYTES * 2]
+        try:
+            lo_key = bytes.fromhex(prefix.ljust(HASH_BYTES * 2, "0"))
+            hi_key = bytes.fromhex(prefix.ljust(HASH_BYTES * 2, "f"))
+        except ValueError:
+            return []
+        key = lambda i: self._record(self._perm(self.hash_order, i))[0]
+        lo = self._bound(key, lo_key, 0, self.hashed_count)
+        hi = self._bound(key, hi_key, lo, self.hashed_count, upper=True)
+        out = []
+        for i in range(lo, hi):
+            n = self._perm(self.hash_order, i)
+            if self._record(n)[1] >= len(prefix):
+                out.append(self.record(n))
+        return out
+
+    def by_capability(self, capability: str) -> list:
+        s = self._string_number(str(capability))
+        if s is None:
+            return []
+        key = lambda i: self._record(self._perm(self.capability_order, i))[4]
+        lo = self._bound(key, s, 0, self.capable_count)
+        hi = self._bound(key, s, lo, self.capable_count, upper=True)
+        return [self.record(self._perm(self.capability_order, i)) for i in range(lo, hi)]
+
+def main(argv: list) -> int:
+    ap = argparse.ArgumentParser(description="Look artifacts up in the indexer's binary index.")
+    ap.add_argument("index", help="Index file written by the indexer (<manifest>.idx)")
+    q = ap.add_mutually_exclusive_group(required=True)
+    q.add_argument("--id", help="artifact_id")
+    q.add_argument("--hash", help="code_hash_full prefix (hex)")
+    q.add_argument("--capability")
+    ap.add_argument("--type", default=None, help="With --id: only this artifact_type")
+    args = ap.parse_args(argv)
+
+    with LookupIndex(args.index) as idx:
+        if args.id is not None:
+            found = idx.find(args.id, args.type)
+        elif args.hash is not None:
+            found = idx.by_hash_prefix(args.hash)
+        else:
+            found = idx.by_capability(args.capability)
+        for r in found:
+            print(json.dumps(r))
+    return 0 if found else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
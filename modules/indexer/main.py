@@ -1,84 +1,202 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
 import csv
-import hashlib
+import itertools
 import json
 import os
+import re
+import shutil
 import sqlite3
+import struct
+import sys
+import tempfile
+import time
 from datetime import datetime, timezone
 
+import lookup
+from manifest import READ_CHUNK, ManifestReader, compute_paths, manifest_head, sha256_hex, short8
+
 def utc_now_iso():
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
 
-def safe_json_loads(s):
-    if not s or not isinstance(s, str):
-        return {}
-    try:
-        return json.loads(s)
-    except Exception:
-        return {}
+def get_cols(cur, table: str):
+    # table_xinfo, not table_info: SELECT * includes generated columns, so the
+    # positions only line up if they are listed too (hidden=1 is vtab-internal).
+    cur.execute(f"PRAGMA table_xinfo({table})")
+    return [r[1] for r in cur.fetchall() if r[6] != 1]
 
-def sha256_hex(s: str) -> str:
-    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+def get_generated_cols(cur, table: str) -> set:
+    cur.execute(f"PRAGMA table_xinfo({table})")
+    return {r[1] for r in cur.fetchall() if r[6] in (2, 3)}
 
-def short8(hexstr: str) -> str:
-    return (hexstr or "")[:8]
+# Registries at this PRAGMA user_version (modules/registry/migrations.py) all
+# carry these columns, real or generated, so rows can be read by position with
+# no per-row probing or metadata fallback.
+FIXED_SCHEMA_VERSION = 3
+FIXED_TABLES = ("scan_events", "artifacts_current")
+FIXED_COLS = [
+    "artifact_type", "artifact_id", "use_env_last", "capability",
+    "sid_count", "cid_count", "cid_sequence", "code_hash_full", "description",
+]
 
-def get_cols(cur, table: str):
-    cur.execute(f"PRAGMA table_info({table})")
-    return [r[1] for r in cur.fetchall()]
+# Rows are pulled from cursors this many at a time, never with fetchall(), so
+# memory stays flat however large the registry is.
+FETCH_BATCH = 5000
+
+def iter_rows(cur):
+    while True:
+        rows = cur.fetchmany(FETCH_BATCH)
+        if not rows:
+            return
+        yield from rows
+
+def schema_version(cur) -> int:
+    cur.execute("PRAGMA user_version")
+    return cur.fetchone()[0]
+
+# --- item query
+#
+# Each item field is resolved in SQLite: real or generated columns where the
+# table has them, else json_extract on the metadata, with the same fallbacks
+# (first non-empty of column, then metadata keys) the indexer used to apply
+# row by row. Python only adds the derived paths.
+#
+# Nothing here json-parses metadata in Python any more, so the per-blob
+# memoization on v2's metadata_id is gone with the old probing path: SQLite
+# evaluates json_extract once per row read (v2's scan_events view does too
+# for the promoted keys). A Python reader that does parse metadata_json on a
+# v2 registry should still key a cache on metadata_id.
+
+VIEWS = ("history", "latest")
+# Tables that already hold one row per artifact: latest is the table itself.
+LATEST_TABLES = ("artifacts_current",)
 
-def compute_paths(item: dict) -> dict:
+def meta_expr(meta: str, *keys: str) -> str:
+    # json_extract raises on malformed JSON; such rows have no metadata.
+    picks = [f"NULLIF(json_extract({meta}, '$.{k}'), '')" for k in keys]
+    picks = picks[0] if len(picks) == 1 else f"COALESCE({', '.join(picks)})"
+    return f"CASE WHEN json_valid({meta}) THEN {picks} END"
+
+def item_exprs(cur, table: str, cols: list) -> list:
+    """SQL expressions for FIXED_COLS, in order, from what `table` has."""
+    if table in FIXED_TABLES and schema_version(cur) >= FIXED_SCHEMA_VERSION:
+        return [c if c in ("artifact_type", "artifact_id", "sid_count", "cid_count") else f"NULLIF({c}, '')"
+                for c in FIXED_COLS]
+
+    # Unmigrated registries and other tables. Generated columns already are
+    # the json_extract of metadata_json, so a NULL there means the key is
+    # absent and there is nothing to fall back to.
+    have, generated = set(cols), get_generated_cols(cur, table)
+    metas = [c for c in ("metadata_json", "meta_json") if c in have]
+    meta = None
+    if metas:
+        meta = metas[0] if len(metas) == 1 else f"COALESCE(NULLIF({metas[0]}, ''), {metas[1]})"
+
+    def first(names, meta_keys):
+        picks = [f"NULLIF({n}, '')" for n in names if n in have]
+        if meta and not (names[0] in generated):
+            picks.append(meta_expr(meta, *meta_keys))
+        if not picks:
+            return "NULL"
+        return picks[0] if len(picks) == 1 else f"COALESCE({', '.join(picks)})"
+
+    def count(name):
+        if name in have:
+            return name
+        return f"CASE WHEN json_valid({meta}) THEN json_extract({meta}, '$.{name}') END" if meta else "NULL"
+
+    return [
+        first(["artifact_type", "type"], ["artifact_type", "type"]),
+        first(["artifact_id", "id"], ["artifact_id", "id"]),
+        first(["use_env_last"], ["use_env_last"]),
+        first(["capability"], ["capability"]),
+        count("sid_count"),
+        count("cid_count"),
+        first(["cid_sequence"], ["cid_sequence", "cid_seq"]),
+        first(["code_hash_full"], ["code_hash_full"]),
+        first(["description"], ["description"]),
+    ]
+
+def item_query(cur, table: str, cols: list, view: str = "history", after_rowid=None) -> tuple:
     """
-    Compute deterministic paths based on artifact type, env, counts, and sequence.
-    This is just the view. Registry stays the truth.
+    (sql, params) returning FIXED_COLS. history: one item per row, in rowid
+    order. latest: one item per (artifact_type, artifact_id), the row with
+    the newest timestamp_utc (ties: the later rowid), in type/id order.
     """
-    t = (item.get("artifact_type") or "UNKNOWN").upper()
-    aid = item.get("artifact_id") or "UNKNOWN_ID"
-    env = item.get("use_env_last") or "unknown"
-    capability = item.get("capability") or "unknown"
-    sid_count = item.get("sid_count")
-    cid_count = item.get("cid_count")
-    cid_sequence = item.get("cid_sequence") or ""
-
-    source_path = f"Raw/{t}/{aid}.py"
-    explainer_path = f"Raw/{t}/{aid}.explainer.md"
-
-    if t == "PYN":
-        sc = int(sid_count or 0)
-        artifacts_path = f"Artifacts/PY/{env}/SID-count_{sc:03d}/{aid}/"
-    elif t == "SID":
-        cc = int(cid_count or 0)
-        seq_sig = short8(sha256_hex(cid_sequence)) if cid_sequence else "NOSEQ"
-        artifacts_path = f"Artifacts/SID/{env}/CID-count_{cc:03d}/SEQ_{seq_sig}/{aid}/"
-    elif t == "CID":
-        artifacts_path = f"Artifacts/CID/{aid}/CAP_{capability}/"
-    else:
-        artifacts_path = f"Artifacts/UNKNOWN/{env}/{aid}/"
+    exprs = item_exprs(cur, table, cols)
+    projection = ", ".join(f"{e} AS {c}" for e, c in zip(exprs, FIXED_COLS))
+    names = ", ".join(FIXED_COLS)
+    if view == "latest" and table not in LATEST_TABLES:
+        if "timestamp_utc" not in cols:
+            raise SystemExit(f"--view latest needs a timestamp_utc column in {table}")
+        return f"""
+            SELECT {names} FROM (
+              SELECT {names}, ROW_NUMBER() OVER (
+                       PARTITION BY artifact_type, artifact_id ORDER BY ts DESC, rid DESC
+                     ) AS rn
+              FROM (SELECT {projection}, timestamp_utc AS ts, rowid AS rid FROM {table})
+            )
+            WHERE rn = 1
+            ORDER BY artifact_type, artifact_id
+        """, ()
+    if after_rowid is None:
+        return f"SELECT {projection} FROM {table}", ()
+    return f"SELECT {projection} FROM {table} WHERE rowid > ? ORDER BY rowid", (after_rowid,)
 
-    item["source_path"] = source_path
-    item["explainer_path"] = explainer_path
-    item["artifacts_path"] = artifacts_path
-    return item
+def query_items(cur, table: str, cols: list, view: str = "history", after_rowid=None):
+    cur.execute(*item_query(cur, table, cols, view, after_rowid))
+    for row in iter_rows(cur):
+        yield compute_paths(dict(zip(FIXED_COLS, row)))
 
-def build_human_txt(items: list) -> str:
-    by_env = {}
-    for it in items:
-        env = it.get("use_env_last") or "unknown"
-        by_env.setdefault(env, []).append(it)
+def snapshot_copy(src_path: str, dst_path: str, pages: int) -> int:
+    """
+    Copy the registry to a local file with the online backup API, `pages` at a
+    time. The source read lock is dropped between batches, so a sync agent or
+    writer touching the file (or its WAL) is never blocked for the whole copy.
+    Returns the page count copied.
+    """
+    src = sqlite3.connect(f"file:{src_path}?mode=ro", uri=True, timeout=30)
+    dst = sqlite3.connect(dst_path)
+    total = [0]
+    try:
+        src.backup(dst, pages=pages, progress=lambda status, remaining, count: total.__setitem__(0, count))
+    finally:
+        dst.close()
+        src.close()
+    return total[0]
 
-    lines = []
-    for env in sorted(by_env.keys()):
-        lines.append(f"ENV: {env}")
-        lines.append("")
-        env_items = by_env[env]
+def open_snapshot(path: str, mmap_mb: int) -> sqlite3.Connection:
+    # Nobody else touches the copy: immutable skips locking and change detection.
+    con = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+    con.execute(f"PRAGMA mmap_size = {int(mmap_mb) * 1024 * 1024}")
+    return con
 
-        def sort_key(it):
-            t = it.get("artifact_type") or ""
-            aid = it.get("artifact_id") or ""
-            return (t, aid)
+def storage_mode(cur) -> str:
+    if not get_cols(cur, "registry_settings"):
+        return "full"
+    cur.execute("SELECT value FROM registry_settings WHERE key = 'storage_mode'")
+    row = cur.fetchone()
+    return row[0] if row else "full"
+
+# --- human indexes
+#
+# Both are written from items already in display order (env, then type and
+# id, ties in registry order), one line at a time; ItemSpool.sorted_items()
+# provides that order without holding the items.
+
+def display_key(it: dict) -> tuple:
+    return (it.get("use_env_last") or "unknown", it.get("artifact_type") or "", it.get("artifact_id") or "")
+
+def env_sections(sorted_items):
+    return itertools.groupby(sorted_items, key=lambda it: it.get("use_env_last") or "unknown")
+
+def human_txt_lines(sorted_items):
+    for env, env_items in env_sections(sorted_items):
+        yield f"ENV: {env}"
+        yield ""
 
-        for it in sorted(env_items, key=sort_key):
+        for it in env_items:
             t = it.get("artifact_type") or ""
             aid = it.get("artifact_id") or ""
             h = it.get("code_hash_full") or ""
@@ -105,38 +223,27 @@ def build_human_txt(items: list) -> str:
             if desc:
                 parts.append(f"desc={desc}")
 
-            lines.append(" | ".join(parts))
-            lines.append(f"  artifacts_path: {ap}")
-            lines.append(f"  source_path:    {sp}")
-            lines.append(f"  explainer_path: {ep}")
-            lines.append("")
+            yield " | ".join(parts)
+            yield f"  artifacts_path: {ap}"
+            yield f"  source_path:    {sp}"
+            yield f"  explainer_path: {ep}"
+            yield ""
 
-        lines.append("")
+        yield ""
 
-    return "\n".join(lines).rstrip() + "\n"
+def human_md_lines(sorted_items, generated: str):
+    yield "# Artifacts Index"
+    yield ""
+    yield f"Generated: {generated}"
+    yield ""
 
-def build_human_md(items: list) -> str:
-    by_env = {}
-    for it in items:
-        env = it.get("use_env_last") or "unknown"
-        by_env.setdefault(env, []).append(it)
-
-    out = []
-    out.append("# Artifacts Index")
-    out.append("")
-    out.append(f"Generated: {utc_now_iso()}")
-    out.append("")
-
-    for env in sorted(by_env.keys()):
-        out.append(f"## ENV: {env}")
-        out.append("")
-        out.append("| Type | ID | Hash | Capability | SID Count | CID Count | Sequence | Description | Artifacts Path | Source Path | Explainer Path |")
-        out.append("|---|---|---|---|---:|---:|---|---|---|---|---|")
+    for env, env_items in env_sections(sorted_items):
+        yield f"## ENV: {env}"
+        yield ""
+        yield "| Type | ID | Hash | Capability | SID Count | CID Count | Sequence | Description | Artifacts Path | Source Path | Explainer Path |"
+        yield "|---|---|---|---|---:|---:|---|---|---|---|---|"
 
-        def sort_key(it):
-            return (it.get("artifact_type") or "", it.get("artifact_id") or "")
-
-        for it in sorted(by_env[env], key=sort_key):
+        for it in env_items:
             t = it.get("artifact_type") or ""
             aid = it.get("artifact_id") or ""
             h = short8(it.get("code_hash_full") or "")
@@ -148,38 +255,642 @@ def build_human_md(items: list) -> str:
             ap = it.get("artifacts_path") or ""
             sp = it.get("source_path") or ""
             ep = it.get("explainer_path") or ""
-            out.append(f"| {t} | {aid} | {h} | {cap} | {sc} | {cc} | {seq} | {desc} | {ap} | {sp} | {ep} |")
+            yield f"| {t} | {aid} | {h} | {cap} | {sc} | {cc} | {seq} | {desc} | {ap} | {sp} | {ep} |"
+
+        yield ""
 
-        out.append("")
+def build_human_txt(items: list) -> str:
+    return "\n".join(human_txt_lines(sorted(items, key=display_key))).rstrip() + "\n"
 
-    return "\n".join(out).rstrip() + "\n"
+def build_human_md(items: list) -> str:
+    return "\n".join(human_md_lines(sorted(items, key=display_key), utc_now_iso())).rstrip() + "\n"
 
-def structural_rows_from_items(items: list):
-    rows = []
+def write_lines(f, lines) -> None:
+    """f.write("\\n".join(lines).rstrip() + "\\n") without building the whole string."""
+    lines = iter(lines)
+    held, sep = "", ""
+    while True:
+        batch = list(itertools.islice(lines, FETCH_BATCH))
+        if not batch:
+            break
+        text = held + sep + "\n".join(batch)
+        kept = text.rstrip()
+        f.write(kept)
+        held, sep = text[len(kept):], "\n"
+    f.write("\n")
+
+def structural_row(it: dict) -> dict:
+    return {
+        "artifact_type": it.get("artifact_type"),
+        "artifact_id": it.get("artifact_id"),
+        "code_hash_full": it.get("code_hash_full"),
+        "capability": it.get("capability"),
+        "cid_sequence": it.get("cid_sequence"),
+        "use_env_last": it.get("use_env_last"),
+    }
+
+SIG_MOD = 1 << 256
+
+def item_hash(it: dict) -> str:
+    return sha256_hex(json.dumps(structural_row(it), sort_keys=True, separators=(",", ":")))
+
+def item_digest(it: dict) -> int:
+    return int(item_hash(it), 16)
+
+def structural_signature(items: list, base: str = None) -> str:
+    """
+    Multiset hash of the items' structural rows: the sum of their sha256
+    digests mod 2**256. Order-independent, so new rows can be added to an
+    earlier signature (`base`) without re-reading the old ones.
+    """
+    total = int(base, 16) if base else 0
     for it in items:
-        rows.append({
-            "artifact_type": it.get("artifact_type"),
-            "artifact_id": it.get("artifact_id"),
-            "code_hash_full": it.get("code_hash_full"),
-            "capability": it.get("capability"),
-            "cid_sequence": it.get("cid_sequence"),
-            "use_env_last": it.get("use_env_last"),
-        })
-    rows_sorted = sorted(
-        rows,
-        key=lambda r: (
-            r.get("artifact_type") or "",
-            r.get("artifact_id") or "",
-            r.get("capability") or "",
-            r.get("use_env_last") or "",
-        ),
-    )
-    return rows_sorted
+        total = (total + item_digest(it)) % SIG_MOD
+    return f"{total:064x}"
+
+# --- signature tree
+#
+# Item digests sum into one node per (env, type), nodes into one per env and
+# envs into the root, which is the structural_signature. The manifest stores
+# the tree, so a run can name the sections that changed; sums can be patched,
+# so appended rows only touch the nodes they land in, and items only need
+# comparing inside changed nodes.
+
+def signature_tree(nodes: dict) -> dict:
+    """{env: {signature, count, types: {type: {signature, count}}}} from {(env, type): [count, sig]}."""
+    tree = {}
+    for (env, t), (count, sig) in sorted(nodes.items()):
+        if not count:
+            continue
+        e = tree.setdefault(env, {"structural_signature": 0, "item_count": 0, "types": {}})
+        e["types"][t] = {"structural_signature": f"{sig:064x}", "item_count": count}
+        e["structural_signature"] = (e["structural_signature"] + sig) % SIG_MOD
+        e["item_count"] += count
+    for e in tree.values():
+        e["structural_signature"] = f"{e['structural_signature']:064x}"
+    return tree
+
+def tree_nodes(tree: dict) -> dict:
+    """{(env, type): (count, signature)} from a stored tree."""
+    return {(env, t): (n["item_count"], n["structural_signature"])
+            for env, e in tree.items() for t, n in e["types"].items()}
+
+def changed_nodes(prev_tree: dict, tree: dict) -> list:
+    """[(env, type, count before, count after)] for the nodes that differ."""
+    before, after = tree_nodes(prev_tree), tree_nodes(tree)
+    return [(env, t, before.get((env, t), (0,))[0], after.get((env, t), (0,))[0])
+            for env, t in sorted(before.keys() | after.keys()) if before.get((env, t)) != after.get((env, t))]
+
+# --- watermark
+#
+# scan_events is append-only apart from archive.py moving the oldest rows
+# out, so (min rowid, max rowid, row count, the row at max) pins down what a
+# run saw.
+# A later run on the same registry reads only rows past max_rowid; anything
+# else (other table, migrated schema, archived or rewritten rows, a different
+# registry) falls back to a full read.
+# In delta storage a scan of unchanged artifacts adds no rows, only a
+# scan_seq entry and presence bits, so the last scan_seq is kept as well:
+# the stats CSV depends on it even when the items don't.
+
+WATERMARK_VERSION = 2
+WATERMARK_TABLE = "scan_events"
+
+def default_state_path(json_out: str) -> str:
+    return os.path.splitext(json_out)[0] + ".watermark.json"
+
+def rowid_table(cur, table: str) -> str:
+    # v2 registries expose scan_events as a view over events (same rowids).
+    cur.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,))
+    row = cur.fetchone()
+    if row and row[0] == "view" and get_cols(cur, "events"):
+        return "events"
+    return table
+
+def row_fingerprint(cur, table: str, rowid):
+    if rowid is None:
+        return None
+    cur.execute(f"SELECT timestamp_utc, scan_id, artifact_type, artifact_id FROM {table} WHERE rowid = ?", (rowid,))
+    row = cur.fetchone()
+    return list(row) if row else None
+
+def last_scan_seq(cur):
+    if not get_cols(cur, "scan_seq"):
+        return None
+    cur.execute("SELECT MAX(seq) FROM scan_seq")
+    return cur.fetchone()[0]
+
+def current_watermark(cur, table: str):
+    """Bounds of the registry table now, or None if it can't be read incrementally."""
+    if table != WATERMARK_TABLE or schema_version(cur) < FIXED_SCHEMA_VERSION:
+        return None
+    cur.execute(f"SELECT MIN(rowid), MAX(rowid), COUNT(*) FROM {rowid_table(cur, table)}")
+    lo, hi, n = cur.fetchone()
+    return {
+        "version": WATERMARK_VERSION,
+        "table": table,
+        "user_version": schema_version(cur),
+        "min_rowid": lo,
+        "max_rowid": hi,
+        "row_count": n,
+        "last_row": row_fingerprint(cur, table, hi),
+        "last_scan_seq": last_scan_seq(cur),
+    }
+
+def still_valid(cur, prev: dict, now: dict) -> bool:
+    """True if the table is still what `prev` saw, plus appended rows."""
+    keys = ("version", "table", "user_version", "min_rowid")
+    if not prev or any(prev.get(k) != now[k] for k in keys) or prev.get("max_rowid") is None:
+        return False
+    if row_fingerprint(cur, now["table"], prev["max_rowid"]) != prev.get("last_row"):
+        return False
+    # Rows deleted from the middle leave both ends alone.
+    cur.execute(f"SELECT COUNT(*) FROM {rowid_table(cur, now['table'])} WHERE rowid <= ?", (prev["max_rowid"],))
+    return cur.fetchone()[0] == prev.get("row_count")
+
+def load_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+@contextlib.contextmanager
+def atomic_text(path: str, binary: bool = False):
+    """open(path, "w") (or "wb") that only replaces `path` once the block completes."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp-{os.getpid()}"
+    try:
+        with (open(tmp, "wb") if binary else open(tmp, "w", encoding="utf-8")) as f:
+            yield f
+    except BaseException:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, path)
+
+def write_json_atomic(path: str, obj, indent=None) -> None:
+    with atomic_text(path) as f:
+        f.write(json.dumps(obj, indent=indent, sort_keys=False) + "\n")
+
+# --- manifest, streamed
+#
+# Schema 1 is written exactly as json.dumps(manifest, indent=2) would write
+# it, with "items" last, but one item at a time; ManifestReader reads it back
+# the same way. Schema 2 (--manifest-schema 2) writes each item as one
+# compact array in the order of "fields", leaves out the paths compute_paths
+# derives, and replaces repetitive string fields with an index into
+# "dictionaries" (sorted, so the bytes do not depend on item order).
+# manifest.py turns both back into the same item dicts.
+
+MANIFEST_SCHEMAS = (1, 2)
+DICT_FIELDS = ("artifact_type", "artifact_id", "use_env_last", "capability",
+               "cid_sequence", "code_hash_full", "description")
 
-def structural_signature(items: list) -> str:
-    rows_sorted = structural_rows_from_items(items)
-    payload = json.dumps(rows_sorted, sort_keys=True, separators=(",", ":"))
-    return sha256_hex(payload)
+# Encoders for the scalar types items hold, as json.dumps would write them
+# (dispatched on exact type, so bool is not taken for int). Anything else goes
+# through json.dumps.
+_SCALAR_JSON = {
+    str: json.encoder.encode_basestring_ascii,
+    int: int.__repr__,
+    bool: lambda v: "true" if v else "false",
+    type(None): lambda v: "null",
+}
+_KEY_JSON = {}
+
+def manifest_item_text(it: dict) -> str:
+    """One entry of the manifest's item list, indented for its place there."""
+    fields = []
+    for k, v in it.items():
+        enc = _SCALAR_JSON.get(type(v))
+        if enc is None:
+            if isinstance(v, (dict, list)):
+                return "    " + json.dumps(it, indent=2).replace("\n", "\n    ")
+            enc = json.dumps
+        key = _KEY_JSON.get(k)
+        if key is None:
+            key = _KEY_JSON[k] = f"      {json.dumps(str(k))}: "
+        fields.append(key + enc(v))
+    return "    {\n" + ",\n".join(fields) + "\n    }"
+
+ITEM_KEYS = FIXED_COLS + ["source_path", "explainer_path", "artifacts_path"]
+# Item fields the lookup index records (see lookup.py).
+LATEST_KEYS = ("artifact_type", "artifact_id", "use_env_last", "capability", "code_hash_full")
+
+_COMPACT_JSON = json.JSONEncoder(separators=(",", ":")).encode
+
+def compact_row_text(row: list) -> str:
+    return "    " + _COMPACT_JSON(row)
+
+def manifest_lines(head: dict, items, encode=manifest_item_text):
+    """Lines of json.dumps({**head, "items": [...]}, indent=2), for write_lines()."""
+    yield json.dumps(head, indent=2)[:-2] + ","  # without the closing "\n}"
+    prev = None
+    for it in items:
+        yield '  "items": [' if prev is None else prev + ","
+        prev = encode(it)
+    if prev is None:
+        yield '  "items": []'
+    else:
+        yield prev
+        yield "  ]"
+    yield "}"
+
+class ItemSpool:
+    """
+    Everything the outputs need from one pass over the items, in flat memory:
+    the count, the structural signature (also per (env, type) node), the manifest's
+    schema 1 item list as text in a temp file, and the fields in a scratch
+    SQLite table that sorted_items(), shard_items() and compact_lines() read
+    back in order (SQLite sorts on disk). `node_base` holds the signature tree nodes matching `base`
+    as {(env, type): signature}.
+    """
+
+    def __init__(self, base: str = None, node_base: dict = None, manifest: bool = True):
+        self.dir = tempfile.TemporaryDirectory(prefix="indexer-spool-")
+        self.count = 0
+        self.sig = int(base, 16) if base else 0
+        self.nodes = {k: [0, int(v, 16)] for k, v in (node_base or {}).items()}  # (env, type) -> [count, sig]
+        self.body_path = os.path.join(self.dir.name, "items.json")
+        self.manifest = manifest
+        self.body = open(self.body_path if manifest else os.devnull, "w", encoding="utf-8")
+        self.db = sqlite3.connect(os.path.join(self.dir.name, "sort.sqlite"))
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        # No column types: values sort as they are, like the Python sort did.
+        self.db.execute(f"CREATE TABLE items (env, type, id, digest, {', '.join(ITEM_KEYS)})")
+        self.insert_sql = f"INSERT INTO items VALUES ({', '.join('?' * (len(ITEM_KEYS) + 4))})"
+        self.has_latest = False
+
+    def add_all(self, items, signed: bool = True) -> None:
+        rows = []
+        for it in items:
+            if self.manifest:
+                self.body.write((",\n" if self.count else "") + manifest_item_text(it))
+            key = display_key(it)
+            node = self.nodes.get(key[:2])
+            if node is None:
+                node = self.nodes[key[:2]] = [0, 0]
+            h = None
+            if signed:
+                h = item_hash(it)
+                digest = int(h, 16)
+                self.sig = (self.sig + digest) % SIG_MOD
+                node[1] = (node[1] + digest) % SIG_MOD
+            self.count += 1
+            node[0] += 1
+            rows.append(key + (h,) + tuple(it.get(k) for k in ITEM_KEYS))
+            if len(rows) >= FETCH_BATCH:
+                self.db.executemany(self.insert_sql, rows)
+                rows = []
+        self.db.executemany(self.insert_sql, rows)
+
+    def add_latest(self, items) -> None:
+        """Each artifact's newest registry row (view "latest"), for write_lookup."""
+        self.db.execute(f"CREATE TABLE latest (type, id, {', '.join(LATEST_KEYS)})")
+        sql = f"INSERT INTO latest VALUES ({', '.join('?' * (len(LATEST_KEYS) + 2))})"
+        rows = []
+        for it in items:
+            rows.append(display_key(it)[1:] + tuple(it.get(k) for k in LATEST_KEYS))
+            if len(rows) >= FETCH_BATCH:
+                self.db.executemany(sql, rows)
+                rows = []
+        self.db.executemany(sql, rows)
+        self.has_latest = True
+
+    @property
+    def signature(self) -> str:
+        return f"{self.sig:064x}"
+
+    def _items(self, where: str, params: tuple, order: str):
+        cur = self.db.execute(f"SELECT {', '.join(ITEM_KEYS)} FROM items {where} ORDER BY {order}", params)
+        for row in iter_rows(cur):
+            yield dict(zip(ITEM_KEYS, row))
+
+    def sorted_items(self):
+        return self._items("", (), "env, type, id, rowid")
+
+    def shard_items(self, env, artifact_type, display: bool = False):
+        """One shard's items: in registry order, or in display order."""
+        self.db.execute("CREATE INDEX IF NOT EXISTS items_shard ON items(env, type, id)")
+        return self._items("WHERE env = ? AND type = ?", (env, artifact_type), "id, rowid" if display else "rowid")
+
+    def dictionaries(self, where: str = "", params: tuple = ()) -> dict:
+        """Sorted distinct values of each DICT_FIELDS field that repeats enough to be worth an index."""
+        counts = self.db.execute(
+            f"SELECT {', '.join(f'COUNT(DISTINCT {f}), COUNT({f})' for f in DICT_FIELDS)} FROM items {where}", params
+        ).fetchone()
+        out = {}
+        for f, distinct, total in zip(DICT_FIELDS, counts[::2], counts[1::2]):
+            if distinct * 2 > total:
+                continue
+            # typeof() keeps 1 and 1.0 apart, which SQLite would otherwise merge.
+            cur = self.db.execute(f"""
+                SELECT DISTINCT typeof({f}), {f} FROM items {where or "WHERE 1"} AND {f} IS NOT NULL
+                ORDER BY {f}, typeof({f})
+            """, params)
+            out[f] = [v for _, v in iter_rows(cur)]
+        return out
+
+    def compact_lines(self, head: dict, where: str = "", params: tuple = ()):
+        """manifest_lines() of a schema 2 manifest over the items matching `where`, in registry order."""
+        dicts = self.dictionaries(where, params)
+        lookups = [{(type(v), v): i for i, v in enumerate(dicts[f])} if f in dicts else None for f in FIXED_COLS]
+        cur = self.db.execute(f"SELECT {', '.join(FIXED_COLS)} FROM items {where} ORDER BY rowid", params)
+        rows = ([v if d is None or v is None else d[(type(v), v)] for v, d in zip(row, lookups)]
+                for row in iter_rows(cur))
+        return manifest_lines({**head, "fields": FIXED_COLS, "dictionaries": dicts}, rows, compact_row_text)
+
+    def changes(self, dirty: set, old_items=None):
+        """
+        (env, type, artifact_id, rows) for each structural row added (rows > 0)
+        or removed (rows < 0) in the `dirty` (env, type) nodes, compared with
+        old_items. Without old_items rows were only appended, and the added
+        ones are exactly those this spool hashed.
+        """
+        db = self.db
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS dirty (env, type)")
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS old (env, type, id, digest)")
+        db.executemany("INSERT INTO dirty VALUES (?, ?)", sorted(dirty))
+        if old_items is None:
+            new_side = "SELECT env, type, id, digest, 1 AS side FROM items WHERE digest IS NOT NULL"
+        else:
+            new_side = "SELECT env, type, id, digest, 1 AS side FROM items JOIN dirty USING (env, type)"
+            rows = []
+            for it in old_items:
+                key = display_key(it)
+                if key[:2] in dirty:
+                    rows.append(key + (item_hash(it),))
+                if len(rows) >= FETCH_BATCH:
+                    db.executemany("INSERT INTO old VALUES (?, ?, ?, ?)", rows)
+                    rows = []
+            db.executemany("INSERT INTO old VALUES (?, ?, ?, ?)", rows)
+        cur = db.execute(f"""
+            SELECT env, type, MIN(id), SUM(side) AS delta FROM (
+              {new_side}
+              UNION ALL SELECT env, type, id, digest, -1 FROM old
+            )
+            GROUP BY env, type, digest HAVING delta != 0
+            ORDER BY env, type, MIN(id), delta, digest
+        """)
+        return iter_rows(cur)
+
+    def write_manifest(self, path: str, head: dict) -> None:
+        self.body.close()
+        with atomic_text(path) as f:
+            if head["schema_version"] == 2:
+                write_lines(f, self.compact_lines(head))
+                return
+            if not self.count:
+                write_lines(f, manifest_lines(head, ()))
+                return
+            f.write(json.dumps(head, indent=2)[:-2] + ',\n  "items": [\n')
+            with open(self.body_path, "r", encoding="utf-8") as body:
+                shutil.copyfileobj(body, f, READ_CHUNK)
+            f.write("\n  ]\n}\n")
+
+    def close(self) -> None:
+        self.body.close()
+        self.db.close()
+        self.dir.cleanup()
+
+# --- sharded outputs
+#
+# --shard-dir DIR writes one manifest, TXT and MD per (use_env_last,
+# artifact_type) under DIR/<env>/<type>.*, plus DIR/index-manifest.json
+# listing every shard with its item count and signature. Shard signatures
+# sum to the root signature, the same value a single manifest carries, and
+# only shards whose signature changed are rewritten.
+
+ROOT_MANIFEST = "index-manifest.json"
+_SAFE_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]{0,63}")
+
+def shard_name(value) -> str:
+    """File name for an env or type value; anything unusual gets a hash suffix so names stay distinct."""
+    value = str(value)
+    if _SAFE_NAME.fullmatch(value):
+        return value
+    cleaned = re.sub(r"[^A-Za-z0-9._-]", "_", value)[:32]
+    return f"_{cleaned}-{short8(sha256_hex(value))}"
+
+def shard_entry(env, artifact_type, count: int, sig: int) -> dict:
+    base = f"{shard_name(env)}/{shard_name(artifact_type)}"
+    return {
+        "env": env,
+        "artifact_type": artifact_type,
+        "item_count": count,
+        "structural_signature": f"{sig:064x}",
+        "manifest": f"{base}.json",
+        "txt": f"{base}.txt",
+        "md": f"{base}.md",
+    }
+
+SHARD_FILES = ("manifest", "txt", "md")
+
+def write_shards(spool: ItemSpool, shard_dir: str, head: dict, prev_entries: list, rewrite_all: bool = False) -> int:
+    """Rewrite changed shards (all of them with rewrite_all) and the root manifest; returns shards written."""
+    prev = {(e.get("env"), e.get("artifact_type")): e for e in prev_entries}
+    entries, written = [], 0
+    for (env, t), (count, sig) in sorted(spool.nodes.items()):
+        entry = shard_entry(env, t, count, sig)
+        entries.append(entry)
+        paths = {k: os.path.join(shard_dir, entry[k]) for k in SHARD_FILES}
+        if not rewrite_all and prev.get((env, t)) == entry and all(os.path.exists(p) for p in paths.values()):
+            continue
+        with atomic_text(paths["manifest"]) as f:
+            shard_head = {k: v for k, v in head.items() if k != "signature_tree"}
+            shard_head.update(structural_signature=entry["structural_signature"], env=env, artifact_type=t,
+                              item_count=count)
+            if head["schema_version"] == 2:
+                write_lines(f, spool.compact_lines(shard_head, "WHERE env = ? AND type = ?", (env, t)))
+            else:
+                write_lines(f, manifest_lines(shard_head, spool.shard_items(env, t)))
+        with atomic_text(paths["txt"]) as f:
+            write_lines(f, human_txt_lines(spool.shard_items(env, t, display=True)))
+        with atomic_text(paths["md"]) as f:
+            write_lines(f, human_md_lines(spool.shard_items(env, t, display=True), head["generated_at_utc"]))
+        written += 1
+
+    for key in prev:
+        if key in spool.nodes:
+            continue
+        # Paths recomputed from the key, not taken from the old manifest.
+        gone = shard_entry(*key, 0, 0)
+        for k in SHARD_FILES:
+            path = os.path.join(shard_dir, gone[k])
+            if os.path.isfile(path):
+                os.remove(path)
+        try:
+            os.rmdir(os.path.dirname(os.path.join(shard_dir, gone["manifest"])))
+        except OSError:
+            pass  # other shards still there
+
+    write_json_atomic(os.path.join(shard_dir, ROOT_MANIFEST), {
+        **head, "shard_count": len(entries), "shards": entries,
+    }, indent=2)
+    return written
+
+# --- binary lookup index
+#
+# <manifest>.idx: one fixed-width record per artifact, sorted by artifact_id,
+# with secondary indexes by hash prefix and capability, for lookup.py to
+# binary-search through mmap (layout in lookup.py). Built from the spool's
+# table with SQLite doing the sorts, so memory stays flat here too; only the
+# distinct type/env/capability strings are held.
+
+def default_lookup_path(manifest_path: str) -> str:
+    return os.path.splitext(manifest_path)[0] + ".idx"
+
+def write_lookup(spool: ItemSpool, path: str, signature: str) -> int:
+    """Write the lookup index for the spooled items; returns its record count."""
+    db = spool.db
+    strings = set()
+    for f in ("artifact_type", "use_env_last", "capability"):
+        strings.update(str(v) for v, in iter_rows(db.execute(f"SELECT DISTINCT {f} FROM items WHERE {f} IS NOT NULL")))
+    strings = sorted(s.encode("utf-8") for s in strings)
+    number = {s.decode("utf-8"): i for i, s in enumerate(strings)}
+
+    def num(v):
+        return lookup.NONE if v is None else number[str(v)]
+
+    # Newest row of each artifact, in record order (BINARY collation sorts text as UTF-8 bytes).
+    # Spool order is registry order only when the whole table was read in
+    # this run without sharding; main() adds the registry's own newest rows
+    # where it can.
+    newest = ("latest" if spool.has_latest else
+              "(SELECT * FROM items WHERE rowid IN (SELECT MAX(rowid) FROM items GROUP BY type, id))")
+    db.execute("DROP TABLE IF EXISTS temp.lookup")
+    db.execute("CREATE TEMP TABLE lookup (n INTEGER PRIMARY KEY, id BLOB, hash BLOB, digits, type, env, cap, n_rows)")
+    cur = db.execute(f"""
+        SELECT CAST(i.id AS TEXT), i.code_hash_full, i.artifact_type, i.use_env_last, i.capability, g.n_rows
+        FROM (SELECT type, id, COUNT(*) AS n_rows FROM items GROUP BY type, id) g
+        JOIN {newest} i ON i.type = g.type AND i.id = g.id
+        ORDER BY CAST(i.id AS TEXT), CAST(i.type AS TEXT)
+    """)
+    rows, count = [], 0
+    for aid, h, t, env, cap, n_rows in iter_rows(cur):
+        rows.append((count, aid.encode("utf-8"), *lookup.hash_prefix(h), num(t), num(env),
+                     None if cap is None else number[str(cap)], n_rows))
+        count += 1
+        if len(rows) >= FETCH_BATCH:
+            db.executemany("INSERT INTO lookup VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            rows = []
+    db.executemany("INSERT INTO lookup VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    hashed = db.execute("SELECT COUNT(*) FROM lookup WHERE digits > 0").fetchone()[0]
+    capable = db.execute("SELECT COUNT(*) FROM lookup WHERE cap IS NOT NULL").fetchone()[0]
+
+    def align(f):
+        f.write(bytes(-f.tell() % 8))
+        return f.tell()
+
+    def offsets(f, lengths):
+        """u64 running offsets of `lengths` (with the leading 0 and the total)."""
+        pos, batch = 0, [0]
+        for n in lengths:
+            pos += n
+            batch.append(pos)
+            if len(batch) >= FETCH_BATCH:
+                f.write(struct.pack(f"<{len(batch)}Q", *batch))
+                batch = []
+        f.write(struct.pack(f"<{len(batch)}Q", *batch))
+
+    def u32s(f, sql):
+        cur = db.execute(sql)
+        while True:
+            batch = cur.fetchmany(FETCH_BATCH)
+            if not batch:
+                return
+            f.write(struct.pack(f"<{len(batch)}I", *(n for n, in batch)))
+
+    with atomic_text(path, binary=True) as f:
+        f.write(bytes(lookup.HEADER.size))
+        string_table = align(f)
+        offsets(f, map(len, strings))
+        f.writelines(strings)
+        id_table = align(f)
+        offsets(f, (n for n, in iter_rows(db.execute("SELECT length(id) FROM lookup ORDER BY n"))))
+        f.writelines(i for i, in iter_rows(db.execute("SELECT id FROM lookup ORDER BY n")))
+        records = align(f)
+        cur = db.execute("SELECT hash, digits, type, env, coalesce(cap, ?), n_rows FROM lookup ORDER BY n", (lookup.NONE,))
+        f.writelines(lookup.RECORD.pack(*r) for r in iter_rows(cur))
+        hash_order = align(f)
+        u32s(f, "SELECT n FROM lookup WHERE digits > 0 ORDER BY hash, n")
+        capability_order = align(f)
+        u32s(f, "SELECT n FROM lookup WHERE cap IS NOT NULL ORDER BY cap, n")
+        f.seek(0)
+        f.write(lookup.HEADER.pack(
+            lookup.MAGIC, lookup.VERSION, lookup.RECORD.size, count, len(strings), hashed, capable,
+            string_table, id_table, records, hash_order, capability_order, 0, 0, bytes.fromhex(signature),
+        ))
+    db.execute("DROP TABLE temp.lookup")
+    return count
+
+def write_changes(spool: ItemSpool, path: str, dirty: set, manifest_path: str, appended_only: bool = False) -> None:
+    """
+    JSON lines, one per structural row added or removed in the dirty
+    sections. Only those sections of the previous manifest are compared
+    (for a sharded one, only their shard files are read); after a pure
+    append nothing old is read at all.
+    """
+    with contextlib.ExitStack() as stack:
+        old_items = None
+        if not appended_only:
+            reader = stack.enter_context(ManifestReader(manifest_path))
+            old_items = reader.items(only=dirty)
+        with atomic_text(path) as f:
+            for env, t, aid, delta in spool.changes(dirty, old_items):
+                f.write(json.dumps({
+                    "change": "added" if delta > 0 else "removed",
+                    "env": env, "artifact_type": t, "artifact_id": aid, "rows": abs(delta),
+                }) + "\n")
+
+def write_stats(cur, table: str, cols: list, path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if "scan_id" in cols and "timestamp_utc" in cols:
+        if table == "scan_events" and storage_mode(cur) == "delta":
+            # Delta storage skips unchanged rows; membership lives in the
+            # per-artifact presence bitmaps (popcount cached as present_count).
+            cur.execute("SELECT COUNT(*) FROM scan_seq")
+            total_scans = cur.fetchone()[0] or 0
+            cur.execute("""
+                SELECT p.artifact_type, p.artifact_id, p.present_count, s.timestamp_utc
+                FROM scan_presence p LEFT JOIN scan_seq s ON s.seq = p.last_seq
+            """)
+        else:
+            # Only needed here: in delta mode scan_seq already counts the scans.
+            cur.execute(f"SELECT COUNT(DISTINCT scan_id) FROM {table}")
+            total_scans = cur.fetchone()[0] or 0
+            if table == "scan_events" and get_cols(cur, "artifacts_current"):
+                # Trigger-maintained latest state: one row per artifact, no history scan.
+                # event_count equals distinct scans (unique on scan_id + artifact).
+                # It still counts rows moved out by registry.py archive, so the
+                # archived months' scans belong in the total too (a scan cut by a
+                # month boundary or the cutoff counts once per part).
+                if get_cols(cur, "archive_months"):
+                    cur.execute("SELECT COALESCE(SUM(scans), 0) FROM archive_months")
+                    total_scans += cur.fetchone()[0]
+                cur.execute("""
+                    SELECT artifact_type, artifact_id, event_count, last_seen_utc
+                    FROM artifacts_current
+                """)
+            else:
+                cur.execute(f"""
+                    SELECT artifact_type, artifact_id,
+                           COUNT(DISTINCT scan_id) AS scans_present,
+                           MAX(timestamp_utc) AS last_seen
+                    FROM {table}
+                    GROUP BY artifact_type, artifact_id
+                """)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["artifact_type","artifact_id","scans_present","total_scans","presence_pct","last_seen_utc"])
+            for t, aid, scans_present, last_seen in iter_rows(cur):
+                pct = (float(scans_present) / float(total_scans) * 100.0) if total_scans else 0.0
+                w.writerow([t, aid, scans_present, total_scans, f"{pct:.4f}", last_seen])
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["note"])
+            w.writerow(["scan_id/timestamp_utc not available; stats limited."])
 
 def main():
     ap = argparse.ArgumentParser(
@@ -190,122 +901,185 @@ def main():
     ap.add_argument("--json-out", default="Artifacts/index-manifest.json", help="Repo: machine index JSON")
     ap.add_argument("--txt-out", default="Artifacts/index.txt", help="Repo: human index TXT")
     ap.add_argument("--md-out", default="Artifacts/index.md", help="Repo: human index MD")
+    ap.add_argument("--shard-dir", default=None,
+                    help="Repo: write one manifest/TXT/MD per env x type under this directory, plus "
+                         f"{ROOT_MANIFEST} listing the shards, instead of --json-out/--txt-out/--md-out")
+    ap.add_argument("--changes-out", default=None,
+                    help="On a structural change, write the added/removed items of the changed sections here (JSONL)")
+    ap.add_argument("--lookup-out", default=None,
+                    help="Binary lookup index for lookup.py (default: <manifest>.idx; "
+                         "derived, git-ignored under Artifacts/)")
     ap.add_argument("--stats-out", default=None, help="Outside repo: noisy stats CSV (updates every run)")
+    ap.add_argument("--state-out", default=None,
+                    help="Local watermark for incremental runs (default: <json-out>.watermark.json)")
+    ap.add_argument("--manifest-schema", type=int, choices=MANIFEST_SCHEMAS, default=1,
+                    help="1: items as JSON objects; 2: compact arrays with dictionary-encoded strings, "
+                         "paths left out (read either with modules/indexer/manifest.py)")
+    ap.add_argument("--view", choices=VIEWS, default="history",
+                    help="history: one item per registry row; latest: one per artifact, its newest row")
+    ap.add_argument("--full", action="store_true", help="Ignore the watermark and re-read the whole table")
+    ap.add_argument("--snapshot", action="store_true",
+                    help="Copy the registry to a local temp file first and read that (for cloud-synced DBs)")
+    ap.add_argument("--snapshot-pages", type=int, default=1024, help="Pages per backup step in --snapshot mode")
+    ap.add_argument("--mmap-mb", type=int, default=256, help="mmap_size for the snapshot copy")
     args = ap.parse_args()
 
     if not os.path.exists(args.db):
         raise SystemExit(f"DB not found: {args.db}")
+    manifest_path = os.path.join(args.shard_dir, ROOT_MANIFEST) if args.shard_dir else args.json_out
+    state_path = args.state_out or default_state_path(manifest_path)
+    lookup_path = args.lookup_out or default_lookup_path(manifest_path)
+    prev_state = None if args.full else load_json(state_path)
+    if prev_state and (prev_state.get("source_db") != os.path.abspath(args.db)
+                       or prev_state.get("view", "history") != args.view
+                       or prev_state.get("manifest_schema", 1) != args.manifest_schema
+                       or not os.path.exists(manifest_path)):
+        prev_state = None
+
+    # Nothing appended or scanned since the last run: a few index lookups and
+    # done, before any snapshot copy or full read. (The stats CSV would come
+    # out the same.)
+    if prev_state:
+        con = sqlite3.connect(args.db)
+        cur = con.cursor()
+        wm = current_watermark(cur, args.table)
+        unchanged = (wm is not None and wm["max_rowid"] == prev_state.get("max_rowid")
+                     and wm["last_scan_seq"] == prev_state.get("last_scan_seq")
+                     and still_valid(cur, prev_state, wm))
+        con.close()
+        if (unchanged and os.path.exists(lookup_path)
+                and (not args.stats_out or os.path.exists(args.stats_out))):
+            print("No structural change detected. Repo index files not rewritten.")
+            return
 
-    con = sqlite3.connect(args.db)
+    snap_dir = None
+    if args.snapshot:
+        snap_dir = tempfile.TemporaryDirectory(prefix="indexer-snapshot-")
+        snap_path = os.path.join(snap_dir.name, "registry.sqlite")
+        t0 = time.perf_counter()
+        pages = snapshot_copy(args.db, snap_path, args.snapshot_pages)
+        copy_s = time.perf_counter() - t0
+        con = open_snapshot(snap_path, args.mmap_mb)
+    else:
+        con = sqlite3.connect(args.db)
+    t_query = time.perf_counter()
     cur = con.cursor()
     cols = get_cols(cur, args.table)
     if not cols:
         raise SystemExit(f"Table not found or empty: {args.table}")
 
-    cur.execute(f"SELECT * FROM {args.table}")
-    rows = cur.fetchall()
-    col_idx = {name: i for i, name in enumerate(cols)}
-
-    def get(row, name, meta=None):
-        if name in col_idx:
-            return row[col_idx[name]]
-        if meta:
-            return meta.get(name)
-        return None
-
-    items = []
-    for r in rows:
-        meta = safe_json_loads(get(r, "metadata_json") or get(r, "meta_json"))
-
-        artifact_type = get(r, "artifact_type", meta) or get(r, "type", meta) or meta.get("artifact_type")
-        artifact_id   = get(r, "artifact_id", meta) or get(r, "id", meta) or meta.get("artifact_id")
-
-        item = {
-            "artifact_type": artifact_type,
-            "artifact_id": artifact_id,
-            "use_env_last": get(r, "use_env_last", meta) or meta.get("use_env_last") or None,
-            "capability": get(r, "capability", meta) or meta.get("capability") or None,
-            "sid_count": get(r, "sid_count", meta),
-            "cid_count": get(r, "cid_count", meta),
-            "cid_sequence": get(r, "cid_sequence", meta) or meta.get("cid_sequence") or meta.get("cid_seq") or None,
-            "code_hash_full": get(r, "code_hash_full", meta) or meta.get("code_hash_full") or None,
-            "description": get(r, "description", meta) or meta.get("description") or None,
-        }
-
-        item = compute_paths(item)
-        items.append(item)
+    # Read under one transaction so the watermark matches the rows read.
+    cur.execute("BEGIN")
+    wm = current_watermark(cur, args.table)
+    spool = n_old = None
+    v1_body = args.manifest_schema == 1 and not args.shard_dir
+    # Appended rows only extend a history; in the latest view they replace items.
+    if wm is not None and prev_state and args.view == "history" and still_valid(cur, prev_state, wm):
+        try:
+            with ManifestReader(manifest_path) as old_manifest:
+                old_tree = old_manifest.head.get("signature_tree")
+                if (old_tree is not None and
+                        old_manifest.head.get("structural_signature") == prev_state.get("structural_signature")):
+                    node_base = {k: sig for k, (_, sig) in tree_nodes(old_tree).items()}
+                    spool = ItemSpool(base=prev_state["structural_signature"], node_base=node_base,
+                                      manifest=v1_body)
+                    # The bases already count these.
+                    spool.add_all(old_manifest.items(), signed=False)
+                    n_old = spool.count
+                    spool.add_all(query_items(cur, args.table, cols, after_rowid=prev_state["max_rowid"]))
+                    print(f"Incremental: {spool.count - n_old} new rows after rowid {prev_state['max_rowid']}",
+                          file=sys.stderr)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Previous manifest unreadable ({e}); reading the whole table", file=sys.stderr)
+            if spool:
+                spool.close()
+            spool = n_old = None
 
-    # Compute structural signature from current registry view
-    new_sig = structural_signature(items)
+    if spool is None:
+        spool = ItemSpool(manifest=v1_body)
+        spool.add_all(query_items(cur, args.table, cols, args.view))
+    new_sig = spool.signature
 
     # Always update external stats if requested
     if args.stats_out:
-        os.makedirs(os.path.dirname(args.stats_out) or ".", exist_ok=True)
-        if "scan_id" in cols and "timestamp_utc" in cols:
-            cur.execute(f"SELECT COUNT(DISTINCT scan_id) FROM {args.table}")
-            total_scans = cur.fetchone()[0] or 0
-            cur.execute(f"""
-                SELECT artifact_type, artifact_id,
-                       COUNT(DISTINCT scan_id) AS scans_present,
-                       MAX(timestamp_utc) AS last_seen
-                FROM {args.table}
-                GROUP BY artifact_type, artifact_id
-            """)
-            stat_rows = cur.fetchall()
-            with open(args.stats_out, "w", newline="", encoding="utf-8") as f:
-                w = csv.writer(f)
-                w.writerow(["artifact_type","artifact_id","scans_present","total_scans","presence_pct","last_seen_utc"])
-                for t, aid, scans_present, last_seen in stat_rows:
-                    pct = (float(scans_present) / float(total_scans) * 100.0) if total_scans else 0.0
-                    w.writerow([t, aid, scans_present, total_scans, f"{pct:.4f}", last_seen])
-        else:
-            with open(args.stats_out, "w", newline="", encoding="utf-8") as f:
-                w = csv.writer(f)
-                w.writerow(["note"])
-                w.writerow(["scan_id/timestamp_utc not available; stats limited."])
+        write_stats(cur, args.table, cols, args.stats_out)
+
+    # Previous manifest signature, if it exists: the watermark already has it
+    # on the incremental path, otherwise only the manifest's head is read.
+    prev_head = manifest_head(manifest_path) if os.path.exists(manifest_path) else None
+    prev_sig = (prev_head or {}).get("structural_signature")
+    same_schema = (prev_head or {}).get("schema_version", 1) == args.manifest_schema
+
+    # The lookup index wants each artifact's newest row. Incremental and
+    # sharded runs refill the spool from the manifest, so spool order is not
+    # registry order: take the newest rows from the registry while it is open.
+    if (not (prev_sig == new_sig and same_schema and os.path.exists(lookup_path))
+            and (args.table in LATEST_TABLES or "timestamp_utc" in cols)):
+        spool.add_latest(query_items(cur, args.table, cols, "latest"))
 
     con.close()
+    if snap_dir:
+        query_s = time.perf_counter() - t_query
+        snap_dir.cleanup()
+        print(f"Snapshot: copy {copy_s:.3f}s ({pages} pages), queries {query_s:.3f}s", file=sys.stderr)
 
-    # Load previous manifest, if it exists
-    prev_sig = None
-    if os.path.exists(args.json_out):
-        try:
-            with open(args.json_out, "r", encoding="utf-8") as f:
-                old_manifest = json.load(f)
-            prev_sig = old_manifest.get("structural_signature")
-        except Exception:
-            prev_sig = None
-
-    # If structural signature is unchanged, don't rewrite repo files
-    if prev_sig == new_sig:
-        print("No structural change detected. Repo index files not rewritten.")
-        return
-
-    # Structural change: rewrite manifest, TXT, MD
-    os.makedirs(os.path.dirname(args.json_out) or ".", exist_ok=True)
-
-    manifest = {
-        "generated_at_utc": utc_now_iso(),
-        "schema_version": 1,
-        "structural_signature": new_sig,
-        "source_db": args.db,
-        "table": args.table,
-        "item_count": len(items),
-        "items": items,
-    }
+    def save_state():
+        if wm is None:
+            return
+        write_json_atomic(state_path, {
+            **wm, "source_db": os.path.abspath(args.db), "view": args.view,
+            "manifest_schema": args.manifest_schema, "item_count": spool.count,
+            "structural_signature": new_sig,
+        }, indent=2)
 
-    json_text = json.dumps(manifest, indent=2, sort_keys=False) + "\n"
-    with open(args.json_out, "w", encoding="utf-8") as f:
-        f.write(json_text)
+    try:
+        # If structural signature is unchanged, don't rewrite repo files
+        if prev_sig == new_sig and same_schema:
+            if not os.path.exists(lookup_path):
+                write_lookup(spool, lookup_path, new_sig)
+            save_state()
+            print("No structural change detected. Repo index files not rewritten.")
+            return
 
-    txt_text = build_human_txt(items)
-    with open(args.txt_out, "w", encoding="utf-8") as f:
-        f.write(txt_text)
+        tree = signature_tree(spool.nodes)
+        prev_tree = (prev_head or {}).get("signature_tree")
+        if prev_tree is not None:
+            changed = changed_nodes(prev_tree, tree)
+            print(f"Changed sections ({len(changed)} of {len(tree_nodes(tree))}):", file=sys.stderr)
+            for env, t, before, after in changed:
+                print(f"  {env}/{t}: {before} -> {after} items", file=sys.stderr)
+            if args.changes_out:
+                dirty = {(env, t) for env, t, _, _ in changed}
+                write_changes(spool, args.changes_out, dirty, manifest_path, appended_only=n_old is not None)
 
-    md_text = build_human_md(items)
-    with open(args.md_out, "w", encoding="utf-8") as f:
-        f.write(md_text)
+        # Structural change: rewrite manifest, TXT, MD
+        head = {
+            "generated_at_utc": utc_now_iso(),
+            "schema_version": args.manifest_schema,
+            "structural_signature": new_sig,
+            "source_db": args.db,
+            "table": args.table,
+            "view": args.view,
+            "item_count": spool.count,
+            "signature_tree": tree,
+        }
+        if args.shard_dir:
+            prev_entries = (prev_head or {}).get("shards") or []
+            written = write_shards(spool, args.shard_dir, head, prev_entries, rewrite_all=not same_schema)
+            print(f"Shards: {written} of {len(spool.nodes)} rewritten", file=sys.stderr)
+        else:
+            spool.write_manifest(args.json_out, head)
+            with atomic_text(args.txt_out) as f:
+                write_lines(f, human_txt_lines(spool.sorted_items()))
+            with atomic_text(args.md_out) as f:
+                write_lines(f, human_md_lines(spool.sorted_items(), utc_now_iso()))
+        write_lookup(spool, lookup_path, new_sig)
+    finally:
+        spool.close()
 
+    # Written last: a run interrupted above leaves the old watermark, whose
+    # signature no longer matches the manifest, so the next run reads in full.
+    save_state()
     print("Structural change detected. Repo index files updated.")
 
 if __name__ == "__main__":
@@ -0,0 +1,201 @@
+"""
+Read indexer manifests without loading them whole.
+
+  from manifest import ManifestReader
+
+  with ManifestReader("Artifacts/index-manifest.json") as m:
+      m.head["structural_signature"]
+      for item in m.items():
+          item["artifact_id"], item["artifacts_path"]
+
+items() yields the same dicts for every layout main.py writes:
+
+  schema 1   items as objects, paths included
+  schema 2   "fields" names the positions of each item array; fields listed
+             in "dictionaries" hold an index into that list (null stays
+             null); source/explainer/artifacts paths are left out and
+             recomputed here with compute_paths
+  sharded    a root manifest (--shard-dir) whose "shards" name one manifest
+             per (env, type), relative to the root; items() reads them in
+             turn, or only the shards passed as `only`
+
+Only the head (everything before "items") is held in memory; items are
+parsed one at a time from the file.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+
+READ_CHUNK = 1 << 16
+_WS = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+def sha256_hex(s: str) -> str:
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+def short8(hexstr: str) -> str:
+    return (hexstr or "")[:8]
+
+def compute_paths(item: dict) -> dict:
+    """
+    Compute deterministic paths based on artifact type, env, counts, and sequence.
+    This is just the view. Registry stays the truth.
+    """
+    t = (item.get("artifact_type") or "UNKNOWN").upper()
+    aid = item.get("artifact_id") or "UNKNOWN_ID"
+    env = item.get("use_env_last") or "unknown"
+    capability = item.get("capability") or "unknown"
+    sid_count = item.get("sid_count")
+    cid_count = item.get("cid_count")
+    cid_sequence = item.get("cid_sequence") or ""
+
+    source_path = f"Raw/{t}/{aid}.py"
+    explainer_path = f"Raw/{t}/{aid}.explainer.md"
+
+    if t == "PYN":
+        sc = int(sid_count or 0)
+        artifacts_path = f"Artifacts/PY/{env}/SID-count_{sc:03d}/{aid}/"
+    elif t == "SID":
+        cc = int(cid_count or 0)
+        seq_sig = short8(sha256_hex(cid_sequence)) if cid_sequence else "NOSEQ"
+        artifacts_path = f"Artifacts/SID/{env}/CID-count_{cc:03d}/SEQ_{seq_sig}/{aid}/"
+    elif t == "CID":
+        artifacts_path = f"Artifacts/CID/{aid}/CAP_{capability}/"
+    else:
+        artifacts_path = f"Artifacts/UNKNOWN/{env}/{aid}/"
+
+    item["source_path"] = source_path
+    item["explainer_path"] = explainer_path
+    item["artifacts_path"] = artifacts_path
+    return item
+
+class ManifestReader:
+    """
+    Top-level manifest fields (`head`, everything before "items") read on
+    open; items() then yields the item dicts one by one from the file.
+    Raises ValueError on anything it cannot parse.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.f = open(path, "r", encoding="utf-8")
+        self.buf, self.pos, self.eof = "", 0, False
+        self.head = {}
+        self.has_items = False
+        try:
+            self._read_head()
+        except BaseException:
+            self.f.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+    def _more(self) -> bool:
+        chunk = self.f.read(READ_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._more():
+                return ""
+
+    def _expect(self, ch: str) -> None:
+        if self._peek() != ch:
+            raise ValueError(f"manifest: expected {ch!r} at offset {self.pos}")
+        self.pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                v, end = _DECODER.raw_decode(self.buf, self.pos)
+                # A number cut off at the end of the buffer decodes too.
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return v
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._more()
+
+    def _read_head(self) -> None:
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "items":
+                self.has_items = True
+                return
+            self.head[key] = self._value()
+            if self._peek() != ",":
+                self._expect("}")
+                return
+            self.pos += 1
+
+    def raw_items(self):
+        """The entries of "items" as stored: dicts (schema 1) or arrays (schema 2)."""
+        if not self.has_items:
+            return
+        self._expect("[")
+        if self._peek() == "]":
+            return
+        while True:
+            yield self._value()
+            if self._peek() != ",":
+                self._expect("]")
+                return
+            self.pos += 1
+
+    def items(self, only: set = None):
+        """
+        Item dicts, paths included. For a sharded root, `only` limits the
+        shards read to those (env, artifact_type) pairs.
+        """
+        if "shards" in self.head:
+            root = os.path.dirname(self.path)
+            for entry in self.head["shards"]:
+                if only is not None and (entry["env"], entry["artifact_type"]) not in only:
+                    continue
+                with ManifestReader(os.path.join(root, entry["manifest"])) as shard:
+                    yield from shard.items()
+            return
+        if self.head.get("schema_version", 1) < 2:
+            yield from self.raw_items()
+            return
+        fields = self.head["fields"]
+        dicts = self.head.get("dictionaries") or {}
+        lookups = [dicts.get(f) for f in fields]
+        for row in self.raw_items():
+            yield compute_paths({
+                f: (d[v] if d is not None and v is not None else v) for f, d, v in zip(fields, lookups, row)
+            })
+
+def manifest_head(path: str):
+    """The manifest's top-level fields without its items, or None."""
+    try:
+        with ManifestReader(path) as r:
+            return r.head
+    except (OSError, ValueError):
+        return None
+
+def iter_items(path: str, only: set = None):
+    """Item dicts from a manifest of any layout, closing it when done."""
+    with ManifestReader(path) as r:
+        yield from r.items(only)
@@ -0,0 +1,375 @@
+"""
+Time-partitioned archival of old scan_events rows.
+
+  registry.py archive --before 2026-01-01      move older rows out, by month
+  registry.py archive                          list archived months
+  registry.py history --since 2025-06-01 --until 2025-09-01 --artifact-id CID-0001
+
+`archive --before` moves rows older than the cutoff into one database per
+UTC month next to the registry (archive/<stem>-YYYY-MM.sqlite, a plain v1
+scan_events table with the original rowids) and records each month in
+archive_months. artifacts_current, lineage, presence and the search index
+are left alone: they already summarize the full history, so day-to-day
+appends, `find`/`search` and `main.py --table artifacts_current` see every
+artifact while scan_events itself stays small. (The default indexer table,
+scan_events, then covers the hot file only.)
+
+Each month is copied and committed first, then removed from the main file
+in short batches by rowid, keyed on what the archive already holds, so an
+interrupted run leaves rows in both places at worst and simply resumes.
+The newest row is never archived: rowids must keep growing for export
+watermarks (shipping.py), so ship rows before archiving them.
+
+ArchiveRange attaches only the months a time range overlaps and exposes
+them together with the hot rows as temp.scan_events_range. history() reads
+ranges wider than SQLite's attach limit a batch of months at a time and
+merges the batches in timestamp order.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import heapq
+import itertools
+import pathlib
+import sqlite3
+
+import schema_v2
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS archive_months (
+  month        TEXT    PRIMARY KEY, -- YYYY-MM (UTC)
+  path         TEXT    NOT NULL,    -- archive file, relative to the registry's directory
+  rows         INTEGER NOT NULL,
+  scans        INTEGER NOT NULL,
+  pyn_rows     INTEGER NOT NULL,
+  sid_rows     INTEGER NOT NULL,
+  cid_rows     INTEGER NOT NULL,
+  first_utc    TEXT    NOT NULL,
+  last_utc     TEXT    NOT NULL,
+  min_rowid    INTEGER NOT NULL,
+  max_rowid    INTEGER NOT NULL,
+  archived_utc TEXT    NOT NULL
+);
+"""
+
+# Same order as registry.INSERT_SQL; archives keep these plus rowid.
+COLUMNS = [
+    "timestamp_utc", "scan_id", "artifact_type", "artifact_id",
+    "parent_id", "supersedes_id", "superseded_by_id", "pyn_id",
+    "sid_count", "cid_count", "capability", "standalone_status", "metadata_json",
+    "use_env_first", "use_env_last", "use_env_seen_json",
+]
+
+DELETE_BATCH = 5000
+BEGINNING = "0000-01-01T00:00:00.000Z"
+
+def ensure_archive(conn: sqlite3.Connection) -> None:
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'archive_months'").fetchone():
+        return
+    import migrations  # imports this module at load time
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        migrations.run_script(conn, SCHEMA_SQL)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+# --- paths and bounds
+
+def main_path(conn: sqlite3.Connection) -> pathlib.Path:
+    return pathlib.Path(next(r[2] for r in conn.execute("PRAGMA database_list") if r[1] == "main"))
+
+def archive_file(conn: sqlite3.Connection, month: str, archive_dir: pathlib.Path | None = None) -> pathlib.Path:
+    db = main_path(conn)
+    if archive_dir is None:
+        # A month archived before keeps its file (e.g. one named after the
+        # v1 registry this database was migrated from).
+        row = conn.execute("SELECT path FROM archive_months WHERE month = ?", (month,)).fetchone()
+        if row:
+            return db.parent / row[0]
+    return (archive_dir or db.parent / "archive") / f"{db.stem}-{month}.sqlite"
+
+def parse_bound(value: str) -> str:
+    """YYYY-MM-DD or a full ISO timestamp -> registry timestamp_utc form."""
+    t = dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=dt.timezone.utc)
+    t = t.astimezone(dt.timezone.utc)
+    return t.strftime("%Y-%m-%dT%H:%M:%S.") + f"{t.microsecond // 1000:03d}Z"
+
+def next_month(month: str) -> str:
+    y, m = int(month[:4]), int(month[5:7])
+    return f"{y + m // 12:04d}-{m % 12 + 1:02d}"
+
+def time_filter(conn: sqlite3.Connection) -> str:
+    """WHERE clause for lo <= timestamp_utc < hi on main.scan_events (params: lo, hi)."""
+    if schema_v2.is_v2(conn):
+        # Filter on events.ts_ms (indexed) instead of the view's formatted timestamp.
+        return (f"rowid IN (SELECT rowid FROM main.events WHERE ts_ms >= {schema_v2.iso_to_ms('?1')} "
+                f"AND ts_ms < {schema_v2.iso_to_ms('?2')})")
+    return "timestamp_utc >= ?1 AND timestamp_utc < ?2"
+
+def events_table(conn: sqlite3.Connection) -> str:
+    return "main.events" if schema_v2.is_v2(conn) else "main.scan_events"
+
+# --- archive
+
+def months_before(conn: sqlite3.Connection, cutoff: str) -> list[str]:
+    first = conn.execute(
+        f"SELECT MIN(timestamp_utc) FROM main.scan_events WHERE {time_filter(conn)}",
+        (BEGINNING, cutoff),
+    ).fetchone()[0]
+    if first is None:
+        return []
+    months, m = [], first[:7]
+    while f"{m}-01T00:00:00.000Z" < cutoff:
+        lo, m_next = f"{m}-01T00:00:00.000Z", next_month(m)
+        hi = min(f"{m_next}-01T00:00:00.000Z", cutoff)
+        if conn.execute(f"SELECT 1 FROM main.scan_events WHERE {time_filter(conn)} LIMIT 1", (lo, hi)).fetchone():
+            months.append(m)  # gaps (months without scans) get no archive file
+        m = m_next
+    return months
+
+def open_archive(path: pathlib.Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    import registry  # registry -> migrations -> archive; call time only
+
+    arc = sqlite3.connect(str(path))
+    try:
+        arc.executescript(registry.EVENTS_SQL)
+        arc.commit()
+    finally:
+        arc.close()
+
+def summarize(conn: sqlite3.Connection, month: str, rel_path: str, now_iso: str) -> tuple:
+    row = conn.execute("""
+        SELECT COUNT(*), COUNT(DISTINCT scan_id),
+               SUM(artifact_type = 'PYN'), SUM(artifact_type = 'SID'), SUM(artifact_type = 'CID'),
+               MIN(timestamp_utc), MAX(timestamp_utc), MIN(rowid), MAX(rowid)
+        FROM arc.scan_events
+    """).fetchone()
+    conn.execute(
+        """
+        INSERT INTO archive_months (month, path, rows, scans, pyn_rows, sid_rows, cid_rows,
+                                    first_utc, last_utc, min_rowid, max_rowid, archived_utc)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (month) DO UPDATE SET
+          path = excluded.path, rows = excluded.rows, scans = excluded.scans,
+          pyn_rows = excluded.pyn_rows, sid_rows = excluded.sid_rows, cid_rows = excluded.cid_rows,
+          first_utc = excluded.first_utc, last_utc = excluded.last_utc,
+          min_rowid = excluded.min_rowid, max_rowid = excluded.max_rowid,
+          archived_utc = excluded.archived_utc
+        """,
+        (month, rel_path, *row, now_iso),
+    )
+    return row
+
+def archive_month(
+    conn: sqlite3.Connection, month: str, cutoff: str, keep_rowid: int,
+    archive_dir: pathlib.Path | None, now_iso: str,
+) -> int:
+    path = archive_file(conn, month, archive_dir)
+    open_archive(path)
+    hi = min(f"{next_month(month)}-01T00:00:00.000Z", cutoff)
+    lo = f"{month}-01T00:00:00.000Z"
+    conn.execute("ATTACH DATABASE ? AS arc", (str(path),))
+    try:
+        # 1. copy, committed on its own: the archive holds the rows before any delete.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                f"""
+                INSERT OR IGNORE INTO arc.scan_events (rowid, {", ".join(COLUMNS)})
+                SELECT rowid, {", ".join(COLUMNS)} FROM main.scan_events
+                WHERE {time_filter(conn)} AND rowid < ?3
+                ORDER BY rowid
+                """,
+                (lo, hi, keep_rowid),
+            )
+            moved = cur.rowcount
+            try:
+                rel = str(path.relative_to(main_path(conn).parent))
+            except ValueError:
+                rel = str(path)
+            summarize(conn, month, rel, now_iso)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+        # 2. drop from the hot file whatever the archive now has, in short batches.
+        last = 0
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [r[0] for r in conn.execute(
+                    "SELECT rowid FROM arc.scan_events WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last, DELETE_BATCH),
+                )]
+                if ids:
+                    conn.execute(
+                        f"DELETE FROM {events_table(conn)} WHERE rowid >= ? AND rowid <= ? "
+                        f"AND rowid IN (SELECT rowid FROM arc.scan_events WHERE rowid >= ? AND rowid <= ?)",
+                        (ids[0], ids[-1], ids[0], ids[-1]),
+                    )
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            if len(ids) < DELETE_BATCH:
+                break
+            last = ids[-1]
+    finally:
+        conn.execute("DETACH DATABASE arc")
+    return moved
+
+def prune_metadata_blobs(conn: sqlite3.Connection) -> int:
+    # v2: blobs only referenced by archived rows (archives keep the JSON inline).
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        n = conn.execute("""
+            DELETE FROM metadata_blobs
+            WHERE NOT EXISTS (SELECT 1 FROM events WHERE meta = metadata_blobs.id)
+        """).rowcount
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return n
+
+def archive_before(
+    conn: sqlite3.Connection, cutoff: str, now_iso: str, archive_dir: pathlib.Path | None = None,
+) -> dict[str, int]:
+    """Move rows with timestamp_utc < cutoff into monthly archives; returns month -> rows moved."""
+    if conn.in_transaction:
+        conn.commit()  # ATTACH is not allowed inside a transaction
+    keep_rowid = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM main.scan_events").fetchone()[0]
+    out = {}
+    for month in months_before(conn, cutoff):
+        out[month] = archive_month(conn, month, cutoff, keep_rowid, archive_dir, now_iso)
+    if out and schema_v2.is_v2(conn):
+        prune_metadata_blobs(conn)
+    return out
+
+def archived_months(conn: sqlite3.Connection) -> list[tuple]:
+    return conn.execute("""
+        SELECT month, rows, scans, pyn_rows, sid_rows, cid_rows, first_utc, last_utc, path
+        FROM archive_months ORDER BY month
+    """).fetchall()
+
+# --- queries across archives
+
+class ArchiveRange:
+    """
+    Attach the archives overlapping [since, until) (either end open) and
+    expose them with the hot rows as temp.scan_events_range:
+
+        with ArchiveRange(conn, "2025-06-01T00:00:00.000Z", None) as r:
+            conn.execute("SELECT ... FROM scan_events_range WHERE ...")
+
+    Filters on the view reach each part's indexes. SQLite attaches at most
+    a handful of databases per connection (SQLITE_LIMIT_ATTACHED); wider
+    ranges raise ValueError. `archives` (rows of months()) attaches only
+    those months, and hot=False leaves main.scan_events out, so a caller
+    can walk a wide range in batches (see history).
+    """
+
+    VIEW = "scan_events_range"
+
+    def __init__(
+        self, conn: sqlite3.Connection, since: str | None = None, until: str | None = None,
+        archives: list[tuple[str, str]] | None = None, hot: bool = True,
+    ):
+        self.conn = conn
+        self.since = since
+        self.until = until
+        self.archives = archives
+        self.hot = hot
+        self.schemas: list[str] = []
+
+    def months(self) -> list[tuple[str, str]]:
+        return self.conn.execute(
+            """
+            SELECT month, path FROM archive_months
+            WHERE (?1 IS NULL OR last_utc >= ?1) AND (?2 IS NULL OR first_utc < ?2)
+            ORDER BY month
+            """,
+            (self.since, self.until),
+        ).fetchall()
+
+    def __enter__(self) -> "ArchiveRange":
+        months = self.months() if self.archives is None else self.archives
+        limit = attach_slots(self.conn)
+        if len(months) > limit:
+            raise ValueError(f"range spans {len(months)} archived months; at most {limit} can be attached")
+        if self.conn.in_transaction:
+            self.conn.commit()
+        base = main_path(self.conn).parent
+        try:
+            for month, rel in months:
+                path = base / rel
+                if not path.exists():
+                    raise ValueError(f"archive for {month} not found: {path}")
+                schema = f"arc_{month.replace('-', '_')}"
+                self.conn.execute(f"ATTACH DATABASE ? AS {schema}", (str(path),))
+                self.schemas.append(schema)
+            cols = ", ".join([*COLUMNS, "rowid"])
+            parts = [f"SELECT {cols} FROM {s}.scan_events" for s in self.schemas]
+            if self.hot:
+                parts.append(f"SELECT {cols} FROM main.scan_events")
+            self.conn.execute(f"DROP VIEW IF EXISTS temp.{self.VIEW}")
+            self.conn.execute(f"CREATE TEMP VIEW {self.VIEW} AS {' UNION ALL '.join(parts)}")
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.conn.in_transaction:
+            self.conn.rollback()  # read-only use; DETACH needs no open transaction
+        self.conn.execute(f"DROP VIEW IF EXISTS temp.{self.VIEW}")
+        for schema in self.schemas:
+            self.conn.execute(f"DETACH DATABASE {schema}")
+        self.schemas = []
+
+def attach_slots(conn: sqlite3.Connection) -> int:
+    """How many more databases this connection can attach."""
+    attached = sum(1 for r in conn.execute("PRAGMA database_list") if r[1] not in ("main", "temp"))
+    return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - attached
+
+def history(
+    conn: sqlite3.Connection,
+    since: str | None = None,
+    until: str | None = None,
+    artifact_type: str | None = None,
+    artifact_id: str | None = None,
+    limit: int | None = None,
+) -> list[dict]:
+    where, params = [], []
+    for cond, val in (
+        ("timestamp_utc >= ?", since),
+        ("timestamp_utc < ?", until),
+        ("artifact_type = ?", artifact_type),
+        ("artifact_id = ?", artifact_id),
+    ):
+        if val is not None:
+            where.append(cond)
+            params.append(val)
+    sql = f"SELECT {', '.join(COLUMNS)}, rowid FROM {ArchiveRange.VIEW}"
+    if where:
+        sql += f" WHERE {' AND '.join(where)}"
+    sql += " ORDER BY timestamp_utc, rowid"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    # At most attach_slots() months per query; the hot rows go with the last batch.
+    months = ArchiveRange(conn, since, until).months()
+    step = max(attach_slots(conn), 1)
+    batches = [months[i:i + step] for i in range(0, len(months), step)] or [[]]
+    parts = []
+    for n, batch in enumerate(batches):
+        with ArchiveRange(conn, since, until, archives=batch, hot=n == len(batches) - 1):
+            parts.append(conn.execute(sql, params).fetchall())
+    rows = heapq.merge(*parts, key=lambda r: (r[0], r[-1]))
+    return [dict(zip(COLUMNS, r)) for r in itertools.islice(rows, int(limit) if limit else None)]
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Regression checks for registry behaviour that breaks silently.
+
+Each check builds a throwaway registry in a temp directory, exercises one
+behaviour end to end and prints OK or FAIL with what differed. Exit status
+is 1 if any check failed.
+
+  python3 modules/registry/check_regressions.py              every check
+  python3 modules/registry/check_regressions.py daemon       only these
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import pathlib
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import archive
+import migrate_v2
+import presence
+import registry
+import registry_client
+import registry_server
+
+HERE = pathlib.Path(__file__).resolve().parent
+REGISTRY = HERE / "registry.py"
+INDEXER = HERE.parent / "indexer" / "main.py"
+
+CHECKS = {}
+
+def check(fn):
+    CHECKS[fn.__name__.removeprefix("check_")] = fn
+    return fn
+
+@check
+def check_daemon(tmp: pathlib.Path) -> list[str]:
+    """Malformed requests get an error reply; the writer keeps serving."""
+    db, sock = tmp / "registry.sqlite", tmp / "registry.sock"
+    proc = subprocess.Popen([sys.executable, str(REGISTRY), "--db", str(db), "serve", "--socket", str(sock)],
+                            stderr=subprocess.DEVNULL)
+    problems = []
+    try:
+        deadline = time.monotonic() + 10
+        while not registry_server.socket_is_live(sock):
+            if time.monotonic() > deadline or proc.poll() is not None:
+                return ["daemon did not start"]
+            time.sleep(0.05)
+        good = {"artifact_type": "PYN", "artifact_id": "CHECK_PYN"}
+        bad = [
+            {"op": "append", "row": "oops"},
+            {"op": "append", "row": [1, 2]},
+            {"op": "append", "row": {**good, "sid_count": "many"}},
+            {"op": "append", "row": {**good, "parent_id": {"nested": True}}},
+            {"op": "query", "sql": 5},
+            {"op": "query", "sql": "SELECT ?", "params": "x"},
+        ]
+        with registry_client.Client(sock, timeout=10) as c:
+            for msg in bad:
+                reply = c.call(msg)
+                if reply.get("ok") is not False or not reply.get("error"):
+                    problems.append(f"{msg} -> {reply}")
+            if c.call({"op": "ping"}) != {"ok": True}:
+                problems.append("ping failed after bad requests")
+            reply = c.call({"op": "append", "row": good})
+            if not reply.get("ok"):
+                problems.append(f"valid append failed after bad requests: {reply}")
+            reply = c.call({"op": "query", "sql": "SELECT COUNT(*) FROM scan_events"})
+            if reply.get("rows") != [[1]]:
+                problems.append(f"expected exactly the one valid row, got {reply}")
+    except (OSError, ValueError, registry_client.ReplyLost) as e:  # a hung writer shows up as a lost reply
+        problems.append(f"{type(e).__name__}: {e}")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+    return problems
+
+@check
+def check_daemon_dropped(tmp: pathlib.Path) -> list[str]:
+    """An append the daemon received but never answered is not written a second time directly."""
+    db, sock = tmp / "registry.sqlite", tmp / "registry.sock"
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(sock))
+    server.listen(1)
+
+    def drop_after_read() -> None:  # reads the request, then dies without replying
+        conn, _ = server.accept()
+        with conn, conn.makefile("rb") as f:
+            f.readline()
+
+    t = threading.Thread(target=drop_after_read, daemon=True)
+    t.start()
+    problems = []
+    try:
+        registry_client.append({"artifact_type": "PYN", "artifact_id": "A"}, db=db, sock_path=sock)
+        problems.append("append returned although the daemon never replied")
+    except registry_client.ReplyLost:
+        pass
+    finally:
+        t.join(10)
+        server.close()
+    if db.exists():
+        with registry.Registry(db) as reg:
+            rows = reg.query("SELECT COUNT(*) FROM scan_events")[0][0]
+        if rows:
+            problems.append(f"fell back to a direct write ({rows} row)")
+    if registry_client.CLIENT_TIMEOUT_S < registry_server.REPLY_TIMEOUT_S:
+        problems.append("client gives up before the daemon's own reply timeout")
+    return problems
+
+def report(db: pathlib.Path, name: str, incremental: bool = True) -> list[dict]:
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(io.StringIO()):
+        registry.main(["--db", str(db), "report", name, *(["--incremental"] if incremental else [])])
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+@check
+def check_identicals(tmp: pathlib.Path) -> list[str]:
+    """An incremental identicals run re-checks the group an artifact's hash left."""
+    db = tmp / "registry.sqlite"
+    def row(aid, h):
+        return {"artifact_type": "PYN", "artifact_id": aid, "metadata_json": {"code_hash_full": h}}
+    problems = []
+    with registry.Registry(db) as reg:
+        reg.append_many([row("A", "aaaa"), row("B", "aaaa"), row("C", "cccc")])
+    groups = report(db, "identicals", incremental=False)
+    if [g["code_hash_full"] for g in groups] != ["aaaa"]:
+        problems.append(f"full run: {groups}")
+    with registry.Registry(db) as reg:
+        reg.append(row("A", "bbbb"))  # A diverges from B
+        reg.append(row("C", "dddd"))  # C was never part of a group
+    groups = report(db, "identicals")
+    if groups != [{"report": "identicals", "code_hash_full": "aaaa", "count": 1,
+                   "artifacts": [{"artifact_type": "PYN", "artifact_id": "B"}], "resolved": True}]:
+        problems.append(f"after A moved away from B: {groups}")
+    if report(db, "identicals"):
+        problems.append("departures were not consumed by the previous run")
+    return problems
+
+def scan(reg: registry.Registry, *rows: dict) -> None:
+    with reg.scan() as s:
+        s.append_many(rows)
+
+@check
+def check_scan_rollback(tmp: pathlib.Path) -> list[str]:
+    """Registry.append inside reg.scan() refuses rather than committing the session's rows."""
+    db = tmp / "registry.sqlite"
+    a = {"artifact_type": "PYN", "artifact_id": "A"}
+    problems = []
+    with registry.Registry(db) as reg:
+        try:
+            with reg.scan() as s:
+                s.append(a)
+                try:
+                    reg.append({**a, "artifact_id": "B"})
+                    problems.append("append inside an open scan session was accepted")
+                except ValueError:
+                    pass
+                raise KeyboardInterrupt  # the session fails after that
+        except KeyboardInterrupt:
+            pass
+        rows = reg.query("SELECT artifact_id FROM scan_events")
+    if rows:
+        problems.append(f"rolled-back session left rows behind: {rows}")
+    return problems
+
+@check
+def check_presence_round_trip(tmp: pathlib.Path) -> list[str]:
+    """delta -> full -> delta keeps the memberships recorded in the first delta period."""
+    db = tmp / "registry.sqlite"
+    a = {"artifact_type": "PYN", "artifact_id": "A"}
+    b = {"artifact_type": "PYN", "artifact_id": "B"}
+    with registry.Registry(db) as reg:
+        presence.set_storage_mode(reg.conn, "delta")
+        for _ in range(3):
+            scan(reg, a, b)  # unchanged after the first: bitmaps only
+        presence.set_storage_mode(reg.conn, "full")
+        for _ in range(2):
+            scan(reg, a)
+        presence.set_storage_mode(reg.conn, "delta")
+        scan(reg, a, b)
+        counts = dict(reg.query("SELECT artifact_id, present_count FROM scan_presence"))
+        scans = reg.query("SELECT COUNT(*) FROM scan_seq")[0][0]
+    if counts != {"A": 6, "B": 4} or scans != 6:
+        return [f"expected A in 6 and B in 4 of 6 scans, got {counts} of {scans}"]
+    return []
+
+@check
+def check_delta_changes(tmp: pathlib.Path) -> list[str]:
+    """Delta mode stores a row whose only change is a use_env field."""
+    db = tmp / "registry.sqlite"
+    base = {"artifact_type": "PYN", "artifact_id": "A", "use_env_first": "dev"}
+    problems = []
+    with registry.Registry(db) as reg:
+        presence.set_storage_mode(reg.conn, "delta")
+        scan(reg, {**base, "use_env_last": "dev", "use_env_seen_json": '["dev"]'})
+        scan(reg, {**base, "use_env_last": "dev", "use_env_seen_json": '["dev"]'})  # unchanged
+        scan(reg, {**base, "use_env_last": "prod", "use_env_seen_json": '["dev"]'})
+        scan(reg, {**base, "use_env_last": "prod", "use_env_seen_json": '["dev", "prod"]'})
+        stored = reg.query("SELECT use_env_last, use_env_seen_json FROM scan_events ORDER BY timestamp_utc")
+        current = reg.query("SELECT use_env_first, use_env_last, use_env_seen_json FROM artifacts_current")
+    if [tuple(r) for r in stored] != [("dev", '["dev"]'), ("prod", '["dev"]'), ("prod", '["dev", "prod"]')]:
+        problems.append(f"stored rows: {stored}")
+    if [tuple(r) for r in current] != [("dev", "prod", '["dev", "prod"]')]:
+        problems.append(f"artifacts_current: {current}")
+    return problems
+
+def index_items(db: pathlib.Path, out: pathlib.Path, view: str, table: str = "scan_events") -> list[dict]:
+    out.mkdir()
+    manifest = out / "index-manifest.json"
+    subprocess.run([sys.executable, str(INDEXER), "--db", str(db), "--table", table, "--view", view, "--full",
+                    "--json-out", str(manifest), "--txt-out", str(out / "index.txt"),
+                    "--md-out", str(out / "index.md")], check=True, capture_output=True)
+    return json.loads(manifest.read_text(encoding="utf-8"))["items"]
+
+@check
+def check_migrated_index(tmp: pathlib.Path) -> list[str]:
+    """The indexer's fixed-column reads of a migrated registry match its reads of the unmigrated one."""
+    db, migrated = tmp / "unmigrated.sqlite", tmp / "migrated.sqlite"
+    envs = ["dev", "prod", "", None]
+    rows = []
+    for n in range(300):
+        meta = {"use_env_first": "dev", "use_env_last": "prod", "use_env_seen": ["dev", "prod"],
+                "cid_seq": f"seq-{n % 7}", "code_hash_full": f"{n % 11:064x}", "description": f"artifact {n % 100}"}
+        meta = {k: v for i, (k, v) in enumerate(meta.items()) if (n >> i) % 3}  # drop keys on some rows
+        rows.append((f"2026-01-01T00:{n // 60:02d}:{n % 60:02d}.000Z", f"20260101-{n // 100 + 1:05d}",
+                     "CID", f"CID-{n % 100:07d}", "PYN-0000001", n % 5, "cap",
+                     json.dumps(meta) if n % 13 else "{not json", envs[n % 4], envs[(n + 1) % 4], envs[n % 3]))
+    # A registry as written before versioned migrations: use_env columns often '' or NULL.
+    with contextlib.closing(sqlite3.connect(db)) as conn:
+        conn.executescript(registry.EVENTS_SQL)
+        conn.executemany("""
+            INSERT INTO scan_events (timestamp_utc, scan_id, artifact_type, artifact_id, pyn_id, cid_count,
+                                     capability, metadata_json, use_env_first, use_env_last, use_env_seen_json)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+    shutil.copy(db, migrated)
+    with registry.Registry(migrated):
+        pass
+    problems = []
+    for view, table in (("history", "scan_events"), ("latest", "scan_events"), ("latest", "artifacts_current")):
+        before = index_items(db, tmp / f"before-{view}-{table}", view)
+        after = index_items(migrated, tmp / f"after-{view}-{table}", view, table)
+        diff = [(b, a) for b, a in zip(before, after) if b != a]
+        if len(before) != len(after) or diff:
+            problems.append(f"{table} {view}: {len(diff)} of {len(before)} items differ, e.g. {diff[:1]}")
+    return problems
+
+@check
+def check_delta_stats(tmp: pathlib.Path) -> list[str]:
+    """An indexer run after a delta scan of unchanged artifacts rewrites --stats-out."""
+    db, out, stats = tmp / "registry.sqlite", tmp / "out", tmp / "stats.csv"
+    a = {"artifact_type": "PYN", "artifact_id": "A"}
+    out.mkdir()
+
+    def index() -> list[str]:
+        subprocess.run([sys.executable, str(INDEXER), "--db", str(db), "--stats-out", str(stats),
+                        "--json-out", str(out / "index-manifest.json"), "--txt-out", str(out / "index.txt"),
+                        "--md-out", str(out / "index.md")], check=True, capture_output=True)
+        return stats.read_text(encoding="utf-8").splitlines()[1].split(",")[2:4]
+
+    with registry.Registry(db) as reg:
+        presence.set_storage_mode(reg.conn, "delta")
+        scan(reg, a)
+    first = index()
+    with registry.Registry(db) as reg:
+        scan(reg, a)  # unchanged: no new scan_events row
+    second = index()
+    if first != ["1", "1"] or second != ["2", "2"]:
+        return [f"scans_present,total_scans after 1 and 2 scans: {first}, {second}"]
+    return []
+
+MONTHS = [f"{2024 + m // 12}-{m % 12 + 1:02d}" for m in range(14)]
+
+def archived_registry(reg: registry.Registry) -> None:
+    """A and B in one scan per month of MONTHS and in 2026-01; MONTHS archived."""
+    for n, month in enumerate([*MONTHS, "2026-01"]):
+        for aid in ("A", "B"):
+            row = {"artifact_type": "PYN", "artifact_id": aid, "metadata_json": {"code_hash_full": f"h{n}"}}
+            reg.conn.execute(registry.INSERT_SQL,
+                             registry.row_params(row, f"{month}-15T00:00:00.000Z", f"S-{n:05d}"))
+    reg.conn.commit()
+    archive.archive_before(reg.conn, "2025-12-31T00:00:00.000Z", "2026-01-01T00:00:00.000Z")
+
+@check
+def check_history_months(tmp: pathlib.Path) -> list[str]:
+    """history reads ranges spanning more archived months than SQLite can attach at once."""
+    db, months = tmp / "registry.sqlite", MONTHS
+    with registry.Registry(db) as reg:
+        archived_registry(reg)
+        archived = len(archive.archived_months(reg.conn))
+        everything = archive.history(reg.conn)
+        b_only = archive.history(reg.conn, artifact_id="B", limit=3)
+        since = archive.history(reg.conn, since="2024-11-01T00:00:00.000Z")
+        attached = len(reg.query("PRAGMA database_list"))
+    problems = []
+    if archived != 14:
+        problems.append(f"expected 14 archived months, got {archived}")
+    seen = [r["timestamp_utc"][:7] for r in everything]
+    if seen != [m for m in [*months, "2026-01"] for _ in (0, 1)]:
+        problems.append(f"history without --since: {len(everything)} rows, months {sorted(set(seen))}")
+    if [(r["artifact_id"], r["timestamp_utc"][:7]) for r in b_only] != [("B", m) for m in months[:3]]:
+        problems.append(f"history --artifact-id B --limit 3: {b_only}")
+    if len(since) != 2 * 5:
+        problems.append(f"history --since 2024-11-01: {len(since)} rows, expected 10")
+    if attached > 2:
+        problems.append(f"{attached - 2} archives left attached")
+    return problems
+
+@check
+def check_archived_stats(tmp: pathlib.Path) -> list[str]:
+    """--stats-out after an archive counts the archived scans in the total as well."""
+    db, out, stats = tmp / "registry.sqlite", tmp / "out", tmp / "stats.csv"
+    with registry.Registry(db) as reg:
+        archived_registry(reg)
+    out.mkdir()
+    subprocess.run([sys.executable, str(INDEXER), "--db", str(db), "--stats-out", str(stats),
+                    "--json-out", str(out / "index-manifest.json"), "--txt-out", str(out / "index.txt"),
+                    "--md-out", str(out / "index.md")], check=True, capture_output=True)
+    rows = [line.split(",")[1:5] for line in stats.read_text(encoding="utf-8").splitlines()[1:]]
+    want = [[aid, "15", "15", "100.0000"] for aid in ("A", "B")]
+    if sorted(rows) != want:
+        return [f"expected {want}, got {rows}"]
+    return []
+
+def lookup_env(idx: pathlib.Path, artifact_id: str):
+    sys.path.insert(0, str(INDEXER.parent))
+    try:
+        import lookup
+    finally:
+        sys.path.pop(0)
+    with lookup.LookupIndex(str(idx)) as li:
+        return [r["use_env_last"] for r in li.find(artifact_id)]
+
+@check
+def check_lookup_latest(tmp: pathlib.Path) -> list[str]:
+    """The lookup index holds each artifact's newest registry row on incremental sharded runs."""
+    db, shards = tmp / "registry.sqlite", tmp / "shards"
+
+    def index() -> None:
+        subprocess.run([sys.executable, str(INDEXER), "--db", str(db), "--shard-dir", str(shards)],
+                       check=True, capture_output=True, cwd=tmp)
+
+    def pyn(aid, env):
+        return {"artifact_type": "PYN", "artifact_id": aid, "use_env_last": env}
+
+    problems = []
+    with registry.Registry(db) as reg:
+        scan(reg, pyn("P1", "envB"))
+        scan(reg, pyn("P1", "envA"))
+    index()
+    idx = shards / "index-manifest.idx"
+    if lookup_env(idx, "P1") != ["envA"]:
+        problems.append(f"full run: P1 {lookup_env(idx, 'P1')}")
+    with registry.Registry(db) as reg:
+        scan(reg, pyn("P2", "envB"))
+        # Shipped in later, but older than P1's newest row.
+        reg.conn.execute(registry.INSERT_SQL,
+                         registry.row_params(pyn("P1", "envC"), "2020-01-01T00:00:00.000Z", "X-00001"))
+        reg.conn.commit()
+    index()
+    if lookup_env(idx, "P1") != ["envA"] or lookup_env(idx, "P2") != ["envB"]:
+        problems.append(f"incremental run: P1 {lookup_env(idx, 'P1')}, P2 {lookup_env(idx, 'P2')}")
+    return problems
+
+@check
+def check_migrate_v2(tmp: pathlib.Path) -> list[str]:
+    """migrate_v2 carries every side table over, and archived history still reads."""
+    src, dst = tmp / "v1" / "registry.sqlite", tmp / "v2" / "registry.sqlite"
+    later = {"archive_months", "import_state", "execution_referrals", "report_departed_hashes"}
+    with registry.Registry(src) as reg:
+        archived_registry(reg)
+        reg.append({"artifact_type": "PYN", "artifact_id": "A", "metadata_json": {"code_hash_full": "moved"}})
+        reg.conn.execute("INSERT INTO import_state (origin, last_rowid, updated_utc) VALUES ('other', 7, 'x')")
+        reg.conn.execute("""
+            INSERT INTO execution_referrals (run_id, executed_utc, path, rel_path, kind, python, platform)
+            VALUES ('run', 'x', '/abs/a.py', 'a.py', 'main', '3', 'linux')
+        """)
+        reg.conn.commit()
+        tables = [t for t in dict.fromkeys([*migrate_v2.SIDE_TABLES, *sorted(later)])
+                  if reg.query(f"SELECT 1 FROM {t} LIMIT 1")]
+        before = {t: reg.query(f"SELECT COUNT(*) FROM {t}")[0][0] for t in tables}
+        history = archive.history(reg.conn)
+    dst.parent.mkdir()
+    with contextlib.redirect_stdout(io.StringIO()):
+        migrate_v2.migrate(src, dst)
+    problems = []
+    if later - set(tables):
+        problems.append(f"source registry has no rows in {sorted(later - set(tables))}")
+    with registry.Registry(dst) as reg:
+        after = {t: reg.query(f"SELECT COUNT(*) FROM {t}")[0][0] for t in tables}
+        if after != before:
+            problems.append(f"side table rows {before} -> {after}")
+        if archive.history(reg.conn) != history:
+            problems.append("history differs after migrating")
+    return problems
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(description="Run registry regression checks.")
+    p.add_argument("checks", nargs="*", metavar="CHECK", help=f"checks to run (default: all): {', '.join(CHECKS)}")
+    args = p.parse_args(argv)
+    unknown = [c for c in args.checks if c not in CHECKS]
+    if unknown:
+        p.error(f"unknown check(s): {', '.join(unknown)}")
+
+    failed = 0
+    for name in args.checks or CHECKS:
+        with tempfile.TemporaryDirectory(prefix=f"check-{name}-") as tmp:
+            t0 = time.perf_counter()
+            try:
+                problems = CHECKS[name](pathlib.Path(tmp))
+            except Exception as e:  # a crash is a failure too; keep running the rest
+                problems = [f"{type(e).__name__}: {e}"]
+        status = "FAIL" if problems else "OK"
+        print(f"{name:24} {status}  ({time.perf_counter() - t0:.2f}s)")
+        for msg in problems:
+            print(f"    {msg}")
+        failed += bool(problems)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
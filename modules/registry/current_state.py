@@ -0,0 +1,193 @@
+"""
+artifacts_current: one row per (artifact_type, artifact_id) holding the
+latest scan_events values, kept up to date by a trigger on every INSERT.
+
+Readers that only need "what does the warehouse look like now" query this
+table instead of collapsing the full scan history. Column names match the
+indexer's item fields, so `main.py --table artifacts_current` works as is.
+"""
+from __future__ import annotations
+
+import sqlite3
+
+import schema_v2
+
+TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS artifacts_current (
+  artifact_type     TEXT    NOT NULL,
+  artifact_id       TEXT    NOT NULL,
+  first_seen_utc    TEXT    NOT NULL,
+  last_seen_utc     TEXT    NOT NULL, -- timestamp_utc of the row the values below came from
+  scan_id           TEXT    NOT NULL,
+  event_count       INTEGER NOT NULL DEFAULT 0, -- rows seen; one per scan given ux_scan_events_scan_artifact
+  parent_id         TEXT,
+  supersedes_id     TEXT,
+  superseded_by_id  TEXT,
+  pyn_id            TEXT,
+  sid_count         INTEGER NOT NULL DEFAULT 0,
+  cid_count         INTEGER NOT NULL DEFAULT 0,
+  capability        TEXT,
+  standalone_status TEXT    NOT NULL DEFAULT 'none',
+  metadata_json     TEXT,
+  -- promoted from metadata_json (or the live column where one exists)
+  use_env_last      TEXT,
+  cid_sequence      TEXT,
+  code_hash_full    TEXT,
+  description       TEXT,
+  use_env_first     TEXT,
+  use_env_seen_json TEXT,
+  PRIMARY KEY (artifact_type, artifact_id)
+);
+"""
+
+TRIGGER_NAME = "tr_scan_events_current"
+
+COPY_COLS = [
+    "parent_id", "supersedes_id", "superseded_by_id", "pyn_id",
+    "sid_count", "cid_count", "capability", "standalone_status", "metadata_json",
+    "use_env_first", "use_env_seen_json",
+]
+# Added after the table first shipped (migration step 14); see ensure_env_columns.
+ENV_COLS = ["use_env_first", "use_env_seen_json"]
+PROMOTED_COLS = ["use_env_last", "cid_sequence", "code_hash_full", "description"]
+
+def meta_expr(src: str, *keys: str) -> str:
+    # json_extract raises on malformed JSON; guard so one bad row can't block inserts.
+    picks = ", ".join(f"json_extract({src}.metadata_json, '$.{k}')" for k in keys)
+    if len(keys) > 1:
+        picks = f"COALESCE({picks})"
+    return f"CASE WHEN json_valid({src}.metadata_json) THEN {picks} END"
+
+def promoted_exprs(cols: set[str], src: str) -> dict[str, str]:
+    out = {
+        "use_env_last": meta_expr(src, "use_env_last"),
+        "cid_sequence": meta_expr(src, "cid_sequence", "cid_seq"),
+        "code_hash_full": meta_expr(src, "code_hash_full"),
+        "description": meta_expr(src, "description"),
+    }
+    for name in PROMOTED_COLS:
+        if name in cols:
+            out[name] = f"COALESCE(NULLIF({src}.{name}, ''), {out[name]})"
+    return out
+
+def scan_event_cols(conn: sqlite3.Connection) -> set[str]:
+    return {r[1] for r in conn.execute("PRAGMA table_xinfo(scan_events)")}
+
+def trigger_sql(cols: set[str], timing: str = "AFTER INSERT") -> str:
+    promoted = promoted_exprs(cols, "NEW")
+    insert_cols = ["artifact_type", "artifact_id", "first_seen_utc", "last_seen_utc", "scan_id",
+                   *COPY_COLS, *PROMOTED_COLS]
+    values = ["NEW.artifact_type", "NEW.artifact_id", "NEW.timestamp_utc", "NEW.timestamp_utc", "NEW.scan_id",
+              *[f"NEW.{c}" for c in COPY_COLS], *[promoted[c] for c in PROMOTED_COLS]]
+    latest = ["last_seen_utc", "scan_id", *COPY_COLS, *PROMOTED_COLS]
+    return f"""
+CREATE TRIGGER IF NOT EXISTS {TRIGGER_NAME}
+{timing} ON scan_events
+BEGIN
+  INSERT INTO artifacts_current ({", ".join(insert_cols)})
+  VALUES ({", ".join(values)})
+  ON CONFLICT (artifact_type, artifact_id) DO UPDATE SET
+    {", ".join(f"{c} = excluded.{c}" for c in latest)}
+  WHERE excluded.last_seen_utc >= artifacts_current.last_seen_utc;
+
+  UPDATE artifacts_current
+  SET event_count = event_count + 1,
+      first_seen_utc = MIN(first_seen_utc, NEW.timestamp_utc)
+  WHERE artifact_type = NEW.artifact_type AND artifact_id = NEW.artifact_id;
+END;
+"""
+
+def backfill(conn: sqlite3.Connection) -> int:
+    """Rebuild artifacts_current from the full scan_events history."""
+    cols = scan_event_cols(conn)
+    promoted = promoted_exprs(cols, "e")
+    conn.execute("DELETE FROM artifacts_current")
+    conn.execute(f"""
+        INSERT INTO artifacts_current (
+          artifact_type, artifact_id, first_seen_utc, last_seen_utc, scan_id, event_count,
+          {", ".join(COPY_COLS)}, {", ".join(PROMOTED_COLS)}
+        )
+        SELECT artifact_type, artifact_id, first_seen_utc, timestamp_utc, scan_id, event_count,
+               {", ".join(COPY_COLS)}, {", ".join(PROMOTED_COLS)}
+        FROM (
+          SELECT e.artifact_type, e.artifact_id, e.timestamp_utc, e.scan_id,
+                 {", ".join(f"e.{c}" for c in COPY_COLS)},
+                 {", ".join(f"{promoted[c]} AS {c}" for c in PROMOTED_COLS)},
+                 MIN(e.timestamp_utc) OVER w_all AS first_seen_utc,
+                 COUNT(*) OVER w_all AS event_count,
+                 ROW_NUMBER() OVER (
+                   PARTITION BY e.artifact_type, e.artifact_id
+                   ORDER BY e.timestamp_utc DESC, e.rowid DESC
+                 ) AS rn
+          FROM scan_events e
+          WINDOW w_all AS (PARTITION BY e.artifact_type, e.artifact_id)
+        )
+        WHERE rn = 1
+    """)
+    return conn.execute("SELECT COUNT(*) FROM artifacts_current").fetchone()[0]
+
+def existing_objects(conn: sqlite3.Connection) -> set[str]:
+    return {
+        r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name IN ('artifacts_current', ?)", (TRIGGER_NAME,)
+        )
+    }
+
+def ensure_current_state(conn: sqlite3.Connection) -> None:
+    # Called from init_db on every connect, so only touch the schema when something is missing.
+    have = existing_objects(conn)
+    if {"artifacts_current", TRIGGER_NAME} <= have:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Re-check under the write lock; another process may have just done this.
+        have = existing_objects(conn)
+        conn.execute(TABLE_SQL)
+        conn.execute(trigger_sql(scan_event_cols(conn), schema_v2.insert_timing(conn)))
+        if "artifacts_current" not in have:
+            # First time on an existing database: one-shot backfill from history.
+            backfill(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def fill_env_columns(conn: sqlite3.Connection) -> None:
+    """Set ENV_COLS from the scan_events row each artifacts_current row came from."""
+    conn.execute(f"""
+        UPDATE artifacts_current
+        SET ({", ".join(ENV_COLS)}) = (
+          SELECT {", ".join(f"e.{c}" for c in ENV_COLS)}
+          FROM scan_events e
+          WHERE e.scan_id = artifacts_current.scan_id
+            AND e.artifact_type = artifacts_current.artifact_type
+            AND e.artifact_id = artifacts_current.artifact_id
+          ORDER BY e.timestamp_utc DESC
+          LIMIT 1
+        )
+    """)
+
+def ensure_env_columns(conn: sqlite3.Connection) -> None:
+    """
+    Add use_env_first / use_env_seen_json to an artifacts_current created
+    before they were tracked, so delta mode can compare every use_env field.
+    """
+    def missing() -> list[str]:
+        have = {r[1] for r in conn.execute("PRAGMA table_info(artifacts_current)")}
+        return [c for c in ENV_COLS if c not in have]
+
+    if not missing():
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        cols = missing()
+        if cols:
+            for c in cols:
+                conn.execute(f"ALTER TABLE artifacts_current ADD COLUMN {c} TEXT")
+            conn.execute(f"DROP TRIGGER IF EXISTS {TRIGGER_NAME}")
+            conn.execute(trigger_sql(scan_event_cols(conn), schema_v2.insert_timing(conn)))
+            fill_env_columns(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
@@ -0,0 +1,75 @@
+"""
+Hot metadata_json keys promoted to indexed generated columns on scan_events.
+
+The indexer used to json-parse every row to find these; as VIRTUAL generated
+columns they cost nothing on insert, read like ordinary columns, and the
+indexes below turn "all CIDs in env X" or "who has hash H" into index lookups.
+
+Databases that already carry a real column of the same name keep it; only
+missing names are added. use_env_last is a real column (migrations step 2
+adds and backfills it); it is added here as a plain TEXT column if missing,
+never as a generated one, so it can always be written. v2 layouts index the
+events table instead.
+"""
+from __future__ import annotations
+
+import sqlite3
+
+import schema_v2
+
+def meta_json(*keys: str) -> str:
+    picks = ", ".join(f"json_extract(metadata_json, '$.{k}')" for k in keys)
+    if len(keys) > 1:
+        picks = f"COALESCE({picks})"
+    return f"CASE WHEN json_valid(metadata_json) THEN {picks} END"
+
+# column -> generated expression
+HOT_COLUMNS = {
+    "cid_sequence": meta_json("cid_sequence", "cid_seq"),
+    "code_hash_full": meta_json("code_hash_full"),
+    "description": meta_json("description"),
+}
+
+# Indexed columns that must be real (writable) columns, added as TEXT if missing.
+REAL_COLUMNS = ("use_env_last",)
+
+# capability and use_env_last are real columns; they only need the index.
+HOT_INDEXES = {
+    "ix_scan_events_code_hash": "code_hash_full",
+    "ix_scan_events_use_env": "use_env_last",
+    "ix_scan_events_capability": "capability",
+}
+
+def missing(conn: sqlite3.Connection) -> tuple[list[str], list[str], list[str]]:
+    cols = {r[1] for r in conn.execute("PRAGMA table_xinfo(scan_events)")}
+    idx = {r[1] for r in conn.execute("PRAGMA index_list(scan_events)")}
+    return (
+        [c for c in REAL_COLUMNS if c not in cols],
+        [c for c in HOT_COLUMNS if c not in cols],
+        [i for i in HOT_INDEXES if i not in idx],
+    )
+
+def ensure_hot_columns(conn: sqlite3.Connection) -> None:
+    if schema_v2.is_v2(conn):
+        return
+    real, cols, idxs = missing(conn)
+    if not real and not cols and not idxs:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        real, cols, idxs = missing(conn)  # re-check under the write lock
+        for c in real:
+            conn.execute(f"ALTER TABLE scan_events ADD COLUMN {c} TEXT")
+        for c in cols:
+            conn.execute(
+                f"ALTER TABLE scan_events ADD COLUMN {c} TEXT GENERATED ALWAYS AS ({HOT_COLUMNS[c]}) VIRTUAL"
+            )
+        for name in idxs:
+            col = HOT_INDEXES[name]
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON scan_events({col}) WHERE {col} IS NOT NULL"
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
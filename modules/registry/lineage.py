@@ -0,0 +1,166 @@
+"""
+Lineage closure table: every (ancestor, descendant, depth) pair, kept
+incrementally by triggers on scan_events so ancestry questions are a single
+indexed lookup instead of following parent pointers one query at a time.
+
+Two kinds of chain are tracked:
+
+  parent      parent_id -> artifact_id          (extraction lineage, back to GEN 0)
+  supersedes  older -> newer, from supersedes_id / superseded_by_id
+
+Rows are ID strings only; an edge is recorded the first time it is seen and
+repeated scans of the same artifact cost one index probe in the trigger.
+"""
+from __future__ import annotations
+
+import sqlite3
+
+import schema_v2
+
+KINDS = ("parent", "supersedes")
+
+TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS lineage_closure (
+  kind       TEXT    NOT NULL, -- parent|supersedes
+  ancestor   TEXT    NOT NULL,
+  descendant TEXT    NOT NULL,
+  depth      INTEGER NOT NULL, -- 1 = direct edge
+  PRIMARY KEY (kind, ancestor, descendant)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS ix_lineage_closure_descendant
+ON lineage_closure(kind, descendant, depth);
+"""
+
+# trigger name -> (kind, ancestor expr, descendant expr)
+EDGES = {
+    "tr_scan_events_lineage_parent": ("parent", "NEW.parent_id", "NEW.artifact_id"),
+    "tr_scan_events_lineage_supersedes": ("supersedes", "NEW.supersedes_id", "NEW.artifact_id"),
+    "tr_scan_events_lineage_superseded_by": ("supersedes", "NEW.artifact_id", "NEW.superseded_by_id"),
+}
+
+def edge_guard_sql(kind: str, anc: str, desc: str) -> str:
+    # Skip edges that are already known or would close a cycle.
+    return f"""
+{anc} IS NOT NULL AND {desc} IS NOT NULL AND {anc} != {desc}
+  AND NOT EXISTS (
+    SELECT 1 FROM lineage_closure
+    WHERE kind = '{kind}' AND ancestor = {anc} AND descendant = {desc} AND depth = 1
+  )
+  AND NOT EXISTS (
+    SELECT 1 FROM lineage_closure
+    WHERE kind = '{kind}' AND ancestor = {desc} AND descendant = {anc}
+  )"""
+
+def edge_insert_sql(kind: str, anc: str, desc: str) -> str:
+    # Link every ancestor of `anc` (and anc) to every descendant of `desc` (and desc).
+    return f"""
+  INSERT OR IGNORE INTO lineage_closure (kind, ancestor, descendant, depth)
+  SELECT '{kind}', a.ancestor, d.descendant, a.depth + d.depth + 1
+  FROM (
+    SELECT ancestor, depth FROM lineage_closure WHERE kind = '{kind}' AND descendant = {anc}
+    UNION ALL SELECT {anc}, 0
+  ) AS a,
+  (
+    SELECT descendant, depth FROM lineage_closure WHERE kind = '{kind}' AND ancestor = {desc}
+    UNION ALL SELECT {desc}, 0
+  ) AS d"""
+
+def edge_trigger_sql(name: str, kind: str, anc: str, desc: str, timing: str = "AFTER INSERT") -> str:
+    return f"""
+CREATE TRIGGER IF NOT EXISTS {name}
+{timing} ON scan_events
+WHEN {edge_guard_sql(kind, anc, desc)}
+BEGIN
+  {edge_insert_sql(kind, anc, desc)};
+END;
+"""
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """
+    Recompute the closure from scan_events by replaying each distinct edge in
+    first-seen order through the same SQL the triggers run, so a rebuilt table
+    matches an incrementally maintained one (including refused cycles).
+    """
+    conn.execute("DELETE FROM lineage_closure")
+    edges = conn.execute("""
+        SELECT kind, anc, desc FROM (
+          SELECT 'parent' AS kind, parent_id AS anc, artifact_id AS desc, rowid AS rid
+          FROM scan_events WHERE parent_id IS NOT NULL
+          UNION ALL
+          SELECT 'supersedes', supersedes_id, artifact_id, rowid
+          FROM scan_events WHERE supersedes_id IS NOT NULL
+          UNION ALL
+          SELECT 'supersedes', artifact_id, superseded_by_id, rowid
+          FROM scan_events WHERE superseded_by_id IS NOT NULL
+        )
+        GROUP BY kind, anc, desc
+        ORDER BY MIN(rid)
+    """).fetchall()
+    stmts = {
+        kind: f"{edge_insert_sql(kind, ':anc', ':desc')} WHERE {edge_guard_sql(kind, ':anc', ':desc')}"
+        for kind in KINDS
+    }
+    for kind, anc, desc in edges:
+        conn.execute(stmts[kind], {"anc": anc, "desc": desc})
+    return conn.execute("SELECT COUNT(*) FROM lineage_closure").fetchone()[0]
+
+def existing_objects(conn: sqlite3.Connection) -> set[str]:
+    names = ["lineage_closure", *EDGES]
+    marks = ", ".join("?" for _ in names)
+    return {r[0] for r in conn.execute(f"SELECT name FROM sqlite_master WHERE name IN ({marks})", names)}
+
+def ensure_lineage(conn: sqlite3.Connection) -> None:
+    if {"lineage_closure", *EDGES} <= existing_objects(conn):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        have = existing_objects(conn)
+        for stmt in TABLE_SQL.split(";"):
+            if stmt.strip():
+                conn.execute(stmt)
+        timing = schema_v2.insert_timing(conn)
+        for name, (kind, anc, desc) in EDGES.items():
+            conn.execute(edge_trigger_sql(name, kind, anc, desc, timing))
+        if "lineage_closure" not in have:
+            rebuild(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+# --- queries: each is one lookup on the primary key or ix_lineage_closure_descendant
+
+def ancestors(conn: sqlite3.Connection, artifact_id: str, kind: str = "parent") -> list[tuple[str, int]]:
+    return conn.execute(
+        "SELECT ancestor, depth FROM lineage_closure WHERE kind = ? AND descendant = ? ORDER BY depth",
+        (kind, artifact_id),
+    ).fetchall()
+
+def descendants(conn: sqlite3.Connection, artifact_id: str, kind: str = "parent") -> list[tuple[str, int]]:
+    return conn.execute(
+        "SELECT descendant, depth FROM lineage_closure WHERE kind = ? AND ancestor = ? ORDER BY depth, descendant",
+        (kind, artifact_id),
+    ).fetchall()
+
+def gen0_root(conn: sqlite3.Connection, artifact_id: str) -> str:
+    row = conn.execute(
+        """
+        SELECT ancestor FROM lineage_closure
+        WHERE kind = 'parent' AND descendant = ?
+        ORDER BY depth DESC LIMIT 1
+        """,
+        (artifact_id,),
+    ).fetchone()
+    return row[0] if row else artifact_id
+
+def current_head(conn: sqlite3.Connection, artifact_id: str) -> str:
+    row = conn.execute(
+        """
+        SELECT descendant FROM lineage_closure
+        WHERE kind = 'supersedes' AND ancestor = ?
+        ORDER BY depth DESC, descendant LIMIT 1
+        """,
+        (artifact_id,),
+    ).fetchone()
+    return row[0] if row else artifact_id
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Copy a v1 registry (TEXT-keyed scan_events table) into a new v2 database
+(interned integer keys, scan_events as a view; see schema_v2.py).
+
+  python3 modules/registry/migrate_v2.py --src registry/registry.sqlite --dst registry/registry_v2.sqlite
+
+The source is only read. Events keep their rowids, so archive_months,
+shipping watermarks and the monthly archives still line up; side tables
+that the source already has (artifacts_current, lineage_closure, presence,
+archive_months, import_state, ...) are copied as is, anything missing is
+rebuilt from the migrated events. archive_months paths are rewritten to
+point at the same archive files from the new database's directory.
+report_state is not carried over; the first report run after migrating
+reads everything.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+
+import current_state
+import lineage
+import registry
+import reports
+import schema_v2
+
+ID_COLS = ("artifact_id", "parent_id", "supersedes_id", "superseded_by_id", "pyn_id")
+
+# side table -> rebuild used when the source doesn't have it
+SIDE_TABLES = {
+    "scan_sessions": None,
+    "registry_settings": None,
+    "scan_id_counters": None,
+    "artifacts_current": current_state.backfill,
+    "lineage_closure": lineage.rebuild,
+    "cid_capability_owners": reports.backfill_owners,
+    "scan_seq": None,
+    "scan_presence": None,
+    "report_departed_hashes": None,
+    "import_state": None,
+    "archive_months": None,
+    "execution_referrals": None,
+}
+
+def src_cols(conn: sqlite3.Connection, table: str) -> dict[str, int]:
+    """Column name -> hidden flag (0 real, 2/3 generated) for a source table."""
+    return {r[1]: r[6] for r in conn.execute(f"PRAGMA src.table_xinfo({table})")}
+
+def copy_events(conn: sqlite3.Connection) -> int:
+    cols = src_cols(conn, "scan_events")
+    real = {c for c, hidden in cols.items() if hidden == 0}
+
+    ids = " UNION ".join(f"SELECT {c} FROM src.scan_events WHERE {c} IS NOT NULL" for c in ID_COLS)
+    conn.execute(f"INSERT OR IGNORE INTO artifacts (artifact_id) {ids}")
+
+    label_cols = [c for c in ("capability", "use_env_first", "use_env_last") if c in real]
+    labels = " UNION ".join(f"SELECT {c} FROM src.scan_events WHERE {c} IS NOT NULL" for c in label_cols)
+    conn.execute(f"INSERT OR IGNORE INTO labels (label) {labels}")
+
+    conn.execute("""
+        INSERT OR IGNORE INTO metadata_blobs (hash, json)
+        SELECT meta_hash(metadata_json), meta_canonical(metadata_json) FROM src.scan_events
+        WHERE metadata_json IS NOT NULL
+    """)
+
+    conn.execute(f"""
+        INSERT INTO scans (scan_id, started_ms)
+        SELECT scan_id, {schema_v2.iso_to_ms("MIN(timestamp_utc)")} FROM src.scan_events
+        GROUP BY scan_id ORDER BY MIN(timestamp_utc), scan_id
+    """)
+
+    def label(c: str) -> str:
+        return f"(SELECT id FROM labels WHERE label = e.{c})" if c in real else "NULL"
+
+    def artifact(c: str) -> str:
+        return f"(SELECT id FROM artifacts WHERE artifact_id = e.{c})"
+
+    conn.execute(f"""
+        INSERT INTO events (
+          rowid, scan, type, artifact, ts_ms, parent, supersedes, superseded_by, pyn,
+          sid_count, cid_count, capability, standalone, env_first, env_last, env_seen_json, meta
+        )
+        SELECT
+          e.rowid,
+          (SELECT id FROM scans WHERE scan_id = e.scan_id),
+          {schema_v2.case_map("e.artifact_type", schema_v2.TYPE_CODES)},
+          {artifact("artifact_id")},
+          {schema_v2.iso_to_ms("e.timestamp_utc")},
+          {artifact("parent_id")},
+          {artifact("supersedes_id")},
+          {artifact("superseded_by_id")},
+          {artifact("pyn_id")},
+          e.sid_count, e.cid_count,
+          {label("capability")},
+          COALESCE({schema_v2.case_map("e.standalone_status", schema_v2.STATUS_CODES)}, 0),
+          {label("use_env_first")},
+          {label("use_env_last")},
+          {"e.use_env_seen_json" if "use_env_seen_json" in real else "NULL"},
+          (SELECT id FROM metadata_blobs WHERE hash = meta_hash(e.metadata_json))
+        FROM src.scan_events e
+        ORDER BY e.rowid
+    """)
+    return conn.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+def rebase_archive_paths(conn: sqlite3.Connection) -> None:
+    # Paths are relative to the registry's directory (see archive.archive_month).
+    dbs = {r[1]: pathlib.Path(r[2]) for r in conn.execute("PRAGMA database_list")}
+    src_dir, dst_dir = dbs["src"].parent, dbs["main"].parent
+    if src_dir.resolve() == dst_dir.resolve():
+        return
+    for month, path in conn.execute("SELECT month, path FROM main.archive_months").fetchall():
+        conn.execute(
+            "UPDATE main.archive_months SET path = ? WHERE month = ?",
+            (os.path.relpath(src_dir / path, dst_dir), month),
+        )
+
+def copy_side_tables(conn: sqlite3.Connection) -> list[str]:
+    have = {r[0] for r in conn.execute("SELECT name FROM src.sqlite_master WHERE type = 'table'")}
+    notes = []
+    for table, rebuild in SIDE_TABLES.items():
+        conn.execute(f"DELETE FROM main.{table}")
+        if table in have:
+            dst = {r[1] for r in conn.execute(f"PRAGMA main.table_info({table})")}
+            cols = ", ".join(c for c in src_cols(conn, table) if c in dst)
+            conn.execute(f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM src.{table}")
+            notes.append(f"{table}: copied")
+            if table == "artifacts_current" and not set(current_state.ENV_COLS) <= set(src_cols(conn, table)):
+                current_state.fill_env_columns(conn)
+            if table == "archive_months":
+                rebase_archive_paths(conn)
+        elif rebuild:
+            rebuild(conn)
+            notes.append(f"{table}: rebuilt")
+    return notes
+
+def migrate(src: pathlib.Path, dst: pathlib.Path) -> int:
+    conn = registry.connect(dst)
+    # Create the v2 tables and view first so init_db sees a v2 layout and
+    # attaches every feature trigger as INSTEAD OF.
+    schema_v2.create_schema(conn)
+    registry.init_db(conn)
+    conn.execute("ATTACH DATABASE ? AS src", (str(src),))
+
+    t0 = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        n = copy_events(conn)
+        notes = copy_side_tables(conn)
+        conn.execute(
+            "INSERT INTO registry_settings (key, value) VALUES ('layout', 'v2') "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value"
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.execute("DETACH DATABASE src")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+    src_size, dst_size = src.stat().st_size, dst.stat().st_size
+    print(f"{n} events in {time.perf_counter() - t0:.2f}s; " + "; ".join(notes))
+    print(f"size: {src_size:,} -> {dst_size:,} bytes ({dst_size / max(src_size, 1):.0%})")
+    return 0
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(description="Migrate a registry to the v2 (integer-keyed) layout.")
+    p.add_argument("--src", default=str(registry.DEFAULT_DB), help="v1 registry to read")
+    p.add_argument("--dst", required=True, help="new v2 registry to create")
+    args = p.parse_args(argv)
+
+    src, dst = pathlib.Path(args.src), pathlib.Path(args.dst)
+    if not src.exists():
+        print(f"ERROR: source db not found: {src}", file=sys.stderr)
+        return 2
+    if dst.exists():
+        print(f"ERROR: destination already exists: {dst}", file=sys.stderr)
+        return 2
+    with sqlite3.connect(str(src)) as check:
+        if schema_v2.is_v2(check):
+            print(f"ERROR: {src} already uses the v2 layout", file=sys.stderr)
+            return 2
+    return migrate(src, dst)
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
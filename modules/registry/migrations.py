@@ -0,0 +1,227 @@
+"""
+Versioned schema migrations, tracked in PRAGMA user_version.
+
+Every database converges on the same schema: init_db runs whichever steps
+are above the file's user_version, in order, and bumps it after each one.
+A database already at SCHEMA_VERSION costs a single PRAGMA read per connect.
+
+Steps are idempotent and take the write lock only for their DDL; long
+backfills run in short BEGIN IMMEDIATE batches so live writers interleave.
+A step interrupted halfway simply runs again on the next connect.
+
+Version history:
+  1  base tables (scan_events or the v2 layout, sessions, settings, counters)
+  2  real use_env_first / use_env_last / use_env_seen_json columns
+  3  promoted metadata columns (hot_columns.py)
+  4  artifacts_current (current_state.py)
+  5  lineage_closure (lineage.py)
+  6  review report tables (reports.py)
+  7  presence bitmaps for delta storage (presence.py)
+  8  import_state watermarks for log shipping (shipping.py)
+  9  v2 only: metadata_json moved to content-addressed metadata_blobs
+ 10  artifacts_fts full-text index over artifacts_current (search.py)
+ 11  archive_months summary for monthly archives (archive.py)
+ 12  execution_referrals from the Execution Scan Trigger (referrals.py)
+ 13  report_departed_hashes for incremental identicals (reports.py)
+ 14  use_env_first / use_env_seen_json in artifacts_current (current_state.py)
+"""
+from __future__ import annotations
+
+import sqlite3
+
+import archive
+import current_state
+import hot_columns
+import lineage
+import presence
+import referrals
+import reports
+import schema_v2
+import search
+import shipping
+
+BACKFILL_BATCH = 5000  # rows per write transaction during backfills
+
+USE_ENV_COLS = ("use_env_first", "use_env_last", "use_env_seen_json")
+
+def user_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def set_user_version(conn: sqlite3.Connection, version: int) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if user_version(conn) < version:  # another process may be ahead of us
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def run_script(conn: sqlite3.Connection, sql: str) -> None:
+    # executescript would commit; run statement by statement inside the caller's
+    # transaction (complete_statement, not split(";"): comments contain semicolons).
+    stmt = ""
+    for line in sql.splitlines(keepends=True):
+        stmt += line
+        if sqlite3.complete_statement(stmt):
+            conn.execute(stmt)
+            stmt = ""
+
+def ensure_base(conn: sqlite3.Connection, base_sql: str) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        run_script(conn, base_sql)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+# --- 2: use_env columns
+
+def missing_use_env(conn: sqlite3.Connection) -> list[str]:
+    cols = {r[1] for r in conn.execute("PRAGMA table_xinfo(scan_events)")}
+    return [c for c in USE_ENV_COLS if c not in cols]
+
+def ensure_use_env_columns(conn: sqlite3.Connection) -> None:
+    if schema_v2.is_v2(conn):
+        return  # the v2 events table has them from the start
+    if missing_use_env(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for c in missing_use_env(conn):  # re-check under the write lock
+                conn.execute(f"ALTER TABLE scan_events ADD COLUMN {c} TEXT")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    backfill_use_env(conn)
+
+def backfill_use_env(conn: sqlite3.Connection, batch: int = BACKFILL_BATCH) -> int:
+    """
+    Fill empty use_env columns from metadata_json, one short write
+    transaction per batch. '' counts as empty, as it does for the indexer's
+    column-then-metadata fallback on unmigrated registries.
+    """
+    meta = current_state.meta_expr
+    sets = ", ".join([
+        f"use_env_first = COALESCE(NULLIF(use_env_first, ''), {meta('scan_events', 'use_env_first')})",
+        f"use_env_last = COALESCE(NULLIF(use_env_last, ''), {meta('scan_events', 'use_env_last')})",
+        f"use_env_seen_json = COALESCE(NULLIF(use_env_seen_json, ''), "
+        f"{meta('scan_events', 'use_env_seen_json', 'use_env_seen')})",
+    ])
+    hi = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM scan_events").fetchone()[0]
+    done = 0
+    for lo in range(0, hi, batch):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done += conn.execute(
+                f"""
+                UPDATE scan_events SET {sets}
+                WHERE rowid > ? AND rowid <= ? AND metadata_json LIKE '%use\\_env%' ESCAPE '\\'
+                """,
+                (lo, lo + batch),
+            ).rowcount
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    return done
+
+# --- 9: v2 metadata blobs
+
+def events_cols(conn: sqlite3.Connection) -> set[str]:
+    return {r[1] for r in conn.execute("PRAGMA table_info(events)")}
+
+def fill_metadata_blobs(conn: sqlite3.Connection, lo: int, hi: int | None) -> None:
+    where = "rowid > ? AND rowid <= ?" if hi is not None else "rowid > ?"
+    args = (lo, hi) if hi is not None else (lo,)
+    conn.execute(f"""
+        INSERT OR IGNORE INTO metadata_blobs (hash, json)
+        SELECT meta_hash(metadata_json), meta_canonical(metadata_json) FROM events
+        WHERE {where} AND metadata_json IS NOT NULL AND meta IS NULL
+    """, args)
+    conn.execute(f"""
+        UPDATE events SET meta = (SELECT id FROM metadata_blobs WHERE hash = meta_hash(events.metadata_json))
+        WHERE {where} AND metadata_json IS NOT NULL AND meta IS NULL
+    """, args)
+
+def ensure_metadata_blobs(conn: sqlite3.Connection, batch: int = BACKFILL_BATCH) -> None:
+    """
+    v2 files created before blobs existed keep metadata_json inline on events.
+    Intern it in batches, then swap the column out under one short lock.
+    """
+    if not schema_v2.is_v2(conn) or "metadata_json" not in events_cols(conn):
+        return
+    schema_v2.register_functions(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        run_script(conn, schema_v2.METADATA_BLOBS_SQL)
+        if "meta" not in events_cols(conn):
+            conn.execute("ALTER TABLE events ADD COLUMN meta INTEGER")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    hi = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM events").fetchone()[0]
+    for lo in range(0, hi, batch):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fill_metadata_blobs(conn, lo, lo + batch)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        fill_metadata_blobs(conn, hi, None)  # rows appended while we were batching
+        # Dropping the view drops every INSTEAD OF trigger on it; put them all back.
+        conn.execute("DROP VIEW scan_events")
+        conn.execute("DROP INDEX IF EXISTS ix_events_code_hash")
+        conn.execute("ALTER TABLE events DROP COLUMN metadata_json")
+        run_script(conn, schema_v2.TABLES_SQL + schema_v2.VIEW_SQL + schema_v2.INSERT_TRIGGER_SQL)
+        timing = schema_v2.insert_timing(conn)
+        conn.execute(current_state.trigger_sql(current_state.scan_event_cols(conn), timing))
+        for name, (kind, anc, desc) in lineage.EDGES.items():
+            conn.execute(lineage.edge_trigger_sql(name, kind, anc, desc, timing))
+        conn.execute(reports.TRIGGER_SQL.format(timing=timing))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+# version -> (description, step); version 1 is ensure_base
+STEPS = {
+    2: ("real use_env columns", ensure_use_env_columns),
+    3: ("promoted metadata columns", hot_columns.ensure_hot_columns),
+    4: ("artifacts_current", current_state.ensure_current_state),
+    5: ("lineage closure", lineage.ensure_lineage),
+    6: ("review reports", reports.ensure_reports),
+    7: ("presence bitmaps", presence.ensure_presence),
+    8: ("import watermarks", shipping.ensure_shipping),
+    9: ("v2 metadata blobs", ensure_metadata_blobs),
+    10: ("full-text search", search.ensure_search),
+    11: ("archive summary", archive.ensure_archive),
+    12: ("execution referrals", referrals.ensure_referrals),
+    13: ("identicals departures", reports.ensure_reports),
+    14: ("current use_env columns", current_state.ensure_env_columns),
+}
+SCHEMA_VERSION = max(STEPS)
+
+def migrate(conn: sqlite3.Connection, base_sql: str) -> int:
+    """
+    Bring the database up to SCHEMA_VERSION. `base_sql` holds the layout's
+    CREATE ... IF NOT EXISTS statements (step 1). Returns the version reached.
+    """
+    current = user_version(conn)
+    if current >= SCHEMA_VERSION:
+        return current
+    if current < 1:
+        ensure_base(conn, base_sql)
+        set_user_version(conn, 1)
+    for version, (_, step) in sorted(STEPS.items()):
+        if user_version(conn) < version:
+            step(conn)
+            set_user_version(conn, version)
+    return user_version(conn)
@@ -0,0 +1,213 @@
+"""
+Delta storage mode: scan_events only gets a row when an artifact's fields
+change, and scan membership is kept as one run-length bitmap per artifact.
+
+  scan_seq        scan_id -> dense sequence number (bit position)
+  scan_presence   per artifact: bitmap of scan seqs it appeared in, plus the
+                  cached popcount and highest seq so stats never decode blobs
+
+A bitmap is a flat list of (start, length) runs packed as little-endian
+uint32. Artifacts seen in every scan collapse to a single run, and appending
+the next scan extends the last run in place.
+
+The mode lives in registry_settings (storage_mode = full|delta). Switching
+to delta rebuilds presence from the existing history, merged with whatever
+the bitmaps already hold: scans from an earlier delta period left no rows for
+unchanged artifacts, so only the bitmaps remember them.
+"""
+from __future__ import annotations
+
+import sqlite3
+import struct
+from typing import Iterable
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS scan_seq (
+  seq           INTEGER PRIMARY KEY, -- dense: bit positions in scan_presence.runs
+  scan_id       TEXT    NOT NULL UNIQUE,
+  timestamp_utc TEXT    NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS scan_presence (
+  artifact_type TEXT    NOT NULL,
+  artifact_id   TEXT    NOT NULL,
+  runs          BLOB    NOT NULL, -- packed <uint32 start, uint32 length> pairs
+  present_count INTEGER NOT NULL, -- popcount of runs
+  last_seq      INTEGER NOT NULL,
+  PRIMARY KEY (artifact_type, artifact_id)
+) WITHOUT ROWID;
+"""
+
+# Fields compared to decide whether a row carries new information
+# (positions in registry.row_params tuples).
+CHANGE_FIELDS = (
+    "parent_id", "supersedes_id", "superseded_by_id", "pyn_id",
+    "sid_count", "cid_count", "capability", "standalone_status", "metadata_json",
+    "use_env_first", "use_env_last", "use_env_seen_json",
+)
+CHANGE_SLICE = slice(4, 16)
+
+# --- run-length bitmaps
+
+def encode(runs: list[int]) -> bytes:
+    return struct.pack(f"<{len(runs)}I", *runs)
+
+def decode(blob: bytes) -> list[int]:
+    return list(struct.unpack(f"<{len(blob) // 4}I", blob))
+
+def popcount(runs: list[int]) -> int:
+    return sum(runs[1::2])
+
+def iter_seqs(runs: list[int]) -> Iterable[int]:
+    for start, n in zip(runs[0::2], runs[1::2]):
+        yield from range(start, start + n)
+
+def from_seqs(seqs: Iterable[int]) -> list[int]:
+    runs: list[int] = []
+    for s in sorted(set(seqs)):
+        if runs and runs[-2] + runs[-1] == s:
+            runs[-1] += 1
+        else:
+            runs += [s, 1]
+    return runs
+
+def add(runs: list[int], seq: int) -> bool:
+    """Set bit `seq`; returns False if it was already set."""
+    if not runs or seq > runs[-2] + runs[-1]:
+        runs += [seq, 1]
+        return True
+    if seq == runs[-2] + runs[-1]:
+        runs[-1] += 1
+        return True
+    if any(start <= seq < start + n for start, n in zip(runs[0::2], runs[1::2])):
+        return False
+    # Out-of-order scan (rare): rebuild the runs.
+    runs[:] = from_seqs([*iter_seqs(runs), seq])
+    return True
+
+# --- schema / mode
+
+def storage_mode(conn: sqlite3.Connection) -> str:
+    row = conn.execute("SELECT value FROM registry_settings WHERE key = 'storage_mode'").fetchone()
+    return row[0] if row else "full"
+
+def ensure_presence(conn: sqlite3.Connection) -> None:
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'scan_presence'").fetchone():
+        return
+    import migrations  # imports this module at load time
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        migrations.run_script(conn, SCHEMA_SQL)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def rebuild(conn: sqlite3.Connection) -> int:
+    """
+    Bring scan_seq and scan_presence up to date with the rows in scan_events,
+    keeping the scans and memberships they already record (from an earlier
+    delta period). Scans new to scan_seq get the next seqs in time order.
+    """
+    conn.execute("""
+        INSERT INTO scan_seq (scan_id, timestamp_utc)
+        SELECT scan_id, MIN(timestamp_utc) FROM scan_events
+        WHERE scan_id NOT IN (SELECT scan_id FROM scan_seq)
+        GROUP BY scan_id ORDER BY MIN(timestamp_utc), scan_id
+    """)
+    known = {
+        (t, aid): decode(runs)
+        for t, aid, runs in conn.execute("SELECT artifact_type, artifact_id, runs FROM scan_presence")
+    }
+    cur = conn.execute("""
+        SELECT e.artifact_type, e.artifact_id, s.seq
+        FROM scan_events e JOIN scan_seq s ON s.scan_id = e.scan_id
+        ORDER BY e.artifact_type, e.artifact_id, s.seq
+    """)
+    out, key, seqs = [], None, []
+    for t, aid, seq in cur:
+        if (t, aid) != key:
+            if key:
+                out.append(presence_row(key, from_seqs([*iter_seqs(known.pop(key, [])), *seqs])))
+            key, seqs = (t, aid), []
+        seqs.append(seq)
+    if key:
+        out.append(presence_row(key, from_seqs([*iter_seqs(known.pop(key, [])), *seqs])))
+    out += [presence_row(k, runs) for k, runs in known.items() if runs]
+    conn.execute("DELETE FROM scan_presence")
+    conn.executemany(
+        "INSERT INTO scan_presence (artifact_type, artifact_id, runs, present_count, last_seq) VALUES (?, ?, ?, ?, ?)",
+        out,
+    )
+    return len(out)
+
+def set_storage_mode(conn: sqlite3.Connection, mode: str) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if mode == "delta" and storage_mode(conn) != "delta":
+            rebuild(conn)
+        conn.execute(
+            "INSERT INTO registry_settings (key, value) VALUES ('storage_mode', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (mode,),
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def presence_row(key: tuple[str, str], runs: list[int]) -> tuple:
+    return (key[0], key[1], encode(runs), popcount(runs), runs[-2] + runs[-1] - 1)
+
+# --- write path
+
+def scan_seq_for(conn: sqlite3.Connection, scan_id: str, ts: str, cache: dict) -> int:
+    if scan_id not in cache:
+        row = conn.execute("SELECT seq FROM scan_seq WHERE scan_id = ?", (scan_id,)).fetchone()
+        if row is None:
+            # Look up before inserting: an ignored INSERT would still burn a seq.
+            row = conn.execute(
+                "INSERT INTO scan_seq (scan_id, timestamp_utc) VALUES (?, ?) RETURNING seq", (scan_id, ts)
+            ).fetchall()[0]
+        cache[scan_id] = row[0]
+    return cache[scan_id]
+
+def filter_changed(conn: sqlite3.Connection, params: list[tuple]) -> list[tuple]:
+    """
+    Record presence for every row and return only the rows whose fields
+    differ from the artifact's latest stored row (artifacts_current).
+    Rows are registry.row_params tuples.
+    """
+    seqs: dict[str, int] = {}
+    latest: dict[tuple[str, str], tuple] = {}
+    changed = []
+    for p in params:
+        key = (p[2], p[3])
+        if key not in latest:
+            row = conn.execute(
+                f"SELECT {', '.join(CHANGE_FIELDS)} FROM artifacts_current WHERE artifact_type = ? AND artifact_id = ?",
+                key,
+            ).fetchone()
+            latest[key] = tuple(row) if row else None
+        if latest[key] != tuple(p[CHANGE_SLICE]):
+            changed.append(p)
+            latest[key] = tuple(p[CHANGE_SLICE])
+
+        seq = scan_seq_for(conn, p[1], p[0], seqs)
+        row = conn.execute(
+            "SELECT runs FROM scan_presence WHERE artifact_type = ? AND artifact_id = ?", key
+        ).fetchone()
+        runs = decode(row[0]) if row else []
+        if add(runs, seq):
+            conn.execute(
+                """
+                INSERT INTO scan_presence (artifact_type, artifact_id, runs, present_count, last_seq)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (artifact_type, artifact_id) DO UPDATE SET
+                  runs = excluded.runs, present_count = excluded.present_count,
+                  last_seq = MAX(last_seq, excluded.last_seq)
+                """,
+                presence_row(key, runs),
+            )
+    return changed
@@ -0,0 +1,174 @@
+"""
+Execution referrals: warehouse files that actually ran, waiting for annotation.
+
+  PYTHONPATH=modules python -m cpw.run Scripts/new_script.py      trace one run
+  PYTHONPATH=modules/cpw/site python Scripts/new_script.py       trace via sitecustomize
+  registry.py referrals                                          pending referrals (JSONL)
+  registry.py referrals --ack 12 13                              mark them handled
+
+The Execution Scan Trigger (constitution section 13, modules/cpw) writes one
+row per file per run. It records what executed and the content hash it had,
+nothing more: no identity is assigned here, and the annotation pipeline picks
+pending rows up like any other scan input. status is the only mutable column.
+
+Referrals a traced process could not write before it exited are left in
+<db>.spool/ (one TSV file per run) and ingested by the next trigger writer or
+by `registry.py referrals`. Hashing is lazy either way: a file whose path,
+mtime and size match an earlier referral reuses that hash, and a spooled file
+that changed before ingestion is recorded without one.
+
+This module is also loaded by file path from inside traced programs, so it
+imports nothing outside the standard library.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+from typing import Iterator
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS execution_referrals (
+  id           INTEGER PRIMARY KEY,
+  run_id       TEXT    NOT NULL,                 -- one traced process
+  executed_utc TEXT    NOT NULL,                 -- first execution in that run
+  path         TEXT    NOT NULL,                 -- absolute, symlinks resolved
+  rel_path     TEXT    NOT NULL,                 -- relative to the matching root
+  kind         TEXT    NOT NULL,                 -- main|import
+  sha256       TEXT,                             -- NULL if unreadable or changed before hashing
+  size         INTEGER,
+  mtime_ns     INTEGER,
+  python       TEXT    NOT NULL,
+  platform     TEXT    NOT NULL,
+  status       TEXT    NOT NULL DEFAULT 'pending', -- pending|acked
+  UNIQUE (run_id, path)
+);
+CREATE INDEX IF NOT EXISTS ix_execution_referrals_pending
+  ON execution_referrals(id) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS ix_execution_referrals_file
+  ON execution_referrals(path, mtime_ns, size);
+"""
+
+INSERT_SQL = """
+INSERT OR IGNORE INTO execution_referrals (
+  run_id, executed_utc, path, rel_path, kind, sha256, size, mtime_ns, python, platform
+) VALUES (?,?,?,?,?,?,?,?,?,?)
+"""
+
+KNOWN_HASH_SQL = """
+SELECT sha256 FROM execution_referrals
+WHERE path = ? AND mtime_ns = ? AND size = ? AND sha256 IS NOT NULL
+LIMIT 1
+"""
+
+COLUMNS = ["id", "run_id", "executed_utc", "path", "rel_path", "kind", "sha256", "size", "mtime_ns",
+           "python", "platform", "status"]
+
+# Spool line: run_id, executed_utc, path, rel_path, kind, size, mtime_ns, python, platform
+SPOOL_FIELDS = 9
+
+def ensure_referrals(conn: sqlite3.Connection) -> None:
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'execution_referrals'").fetchone():
+        return
+    import migrations  # only migrations calls this, never a traced program
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        migrations.run_script(conn, SCHEMA_SQL)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+def spool_dir(db: str | os.PathLike) -> str:
+    return f"{os.fspath(db)}.spool"
+
+def sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_hash(conn: sqlite3.Connection, path: str, size: int | None = None, mtime_ns: int | None = None) -> tuple:
+    """
+    (sha256, size, mtime_ns) for a referred file. With size/mtime_ns given
+    (spooled referrals), a file that changed since is not hashed.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, size, mtime_ns  # deleted since it ran; still referred
+    if size is not None and (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+        return None, size, mtime_ns
+    known = conn.execute(KNOWN_HASH_SQL, (path, st.st_mtime_ns, st.st_size)).fetchone()
+    if known:
+        return known[0], st.st_size, st.st_mtime_ns
+    try:
+        return sha256_file(path), st.st_size, st.st_mtime_ns
+    except OSError:
+        return None, st.st_size, st.st_mtime_ns
+
+def insert_referrals(conn: sqlite3.Connection, items: list[tuple]) -> int:
+    """
+    Hash and insert referrals given as spool tuples. size/mtime_ns are None
+    when the writer thread handles them: the file is stat'ed now.
+    """
+    rows = []
+    for run_id, ts, path, rel, kind, size, mtime_ns, python, platform in items:
+        path = os.path.realpath(path)
+        sha, size, mtime_ns = file_hash(conn, path, size, mtime_ns)
+        rows.append((run_id, ts, path, rel, kind, sha, size, mtime_ns, python, platform))
+    with conn:
+        conn.executemany(INSERT_SQL, rows)
+    return len(rows)
+
+def ingest_spool(conn: sqlite3.Connection, db: str | os.PathLike) -> int:
+    """Insert spooled referrals and remove their files; returns rows read."""
+    d = spool_dir(db)
+    try:
+        names = sorted(n for n in os.listdir(d) if n.endswith(".tsv"))
+    except OSError:
+        return 0
+    total = 0
+    for name in names:
+        src = os.path.join(d, name)
+        claimed = f"{src}.{os.getpid()}"
+        try:
+            os.rename(src, claimed)  # another ingester may have taken it
+        except OSError:
+            continue
+        items = []
+        with open(claimed, "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != SPOOL_FIELDS:
+                    continue  # torn write at exit
+                parts[5:7] = [int(v) if v else None for v in parts[5:7]]
+                items.append(tuple(parts))
+        total += insert_referrals(conn, items)
+        os.remove(claimed)
+    return total
+
+def pending(conn: sqlite3.Connection, limit: int | None = None) -> Iterator[dict]:
+    sql = f"SELECT {', '.join(COLUMNS)} FROM execution_referrals WHERE status = 'pending' ORDER BY id"
+    params: tuple = ()
+    if limit is not None:
+        sql += " LIMIT ?"
+        params = (limit,)
+    for row in conn.execute(sql, params):
+        yield dict(zip(COLUMNS, row))
+
+def ack(conn: sqlite3.Connection, ids: list[int]) -> int:
+    """Mark referrals as handled; returns how many were still pending."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        n = conn.executemany(
+            "UPDATE execution_referrals SET status = 'acked' WHERE id = ? AND status = 'pending'",
+            [(i,) for i in ids],
+        ).rowcount
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return n
@@ -7,13 +7,27 @@ import json
 import pathlib
 import sqlite3
 import sys
+import time
+
+import archive
+import current_state
+import lineage
+import migrations
+import presence
+import referrals
+import reports
+import schema_v2
+import search
 
 DEFAULT_DB = pathlib.Path("registry/registry.sqlite")
 
-SCHEMA_SQL = """
+PRAGMAS_SQL = """
 PRAGMA journal_mode=WAL;
 PRAGMA synchronous=NORMAL;
+"""
 
+# v1 layout; v2 databases (see schema_v2.py) provide scan_events as a view.
+EVENTS_SQL = """
 CREATE TABLE IF NOT EXISTS scan_events (
   timestamp_utc     TEXT    NOT NULL, -- ISO 8601 with ms, UTC (e.g. 2026-02-01T16:05:12.123Z)
   scan_id           TEXT    NOT NULL, -- YYYYMMDD-NNNNN
@@ -27,7 +41,10 @@ CREATE TABLE IF NOT EXISTS scan_events (
   cid_count         INTEGER NOT NULL DEFAULT 0,
   capability        TEXT,             -- only meaningful for CID rows
   standalone_status TEXT    NOT NULL DEFAULT 'none', -- none|inventory|runnable
-  metadata_json     TEXT              -- JSON string; optional spillover
+  metadata_json     TEXT,             -- JSON string; optional spillover
+  use_env_first     TEXT,             -- env of first use; row value or metadata_json key
+  use_env_last      TEXT,             -- env of latest use
+  use_env_seen_json TEXT              -- JSON list of envs seen
 );
 
 CREATE UNIQUE INDEX IF NOT EXISTS ux_scan_events_scan_artifact
@@ -40,6 +57,41 @@ CREATE INDEX IF NOT EXISTS ix_scan_events_time
 ON scan_events(timestamp_utc);
 """
 
+SUPPORT_SQL = """
+CREATE TABLE IF NOT EXISTS scan_sessions (
+  scan_id       TEXT    PRIMARY KEY,   -- reserved up front by `scan begin`
+  started_utc   TEXT    NOT NULL,
+  committed_utc TEXT,                  -- NULL while the session is open
+  row_count     INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS registry_settings (
+  key   TEXT PRIMARY KEY,
+  value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS scan_id_counters (
+  day    TEXT    PRIMARY KEY,         -- YYYYMMDD (UTC)
+  last_n INTEGER NOT NULL             -- last NNNNN handed out for that day
+);
+"""
+
+SCHEMA_SQL = PRAGMAS_SQL + EVENTS_SQL + SUPPORT_SQL
+
+INSERT_SQL = """
+INSERT INTO scan_events (
+  timestamp_utc, scan_id, artifact_type, artifact_id,
+  parent_id, supersedes_id, superseded_by_id, pyn_id,
+  sid_count, cid_count, capability, standalone_status, metadata_json,
+  use_env_first, use_env_last, use_env_seen_json
+)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+ARTIFACT_TYPES = ("PYN", "SID", "CID")
+STANDALONE_STATUSES = ("none", "inventory", "runnable")
+BATCH_SIZE = 1000
+
 def now_utc() -> dt.datetime:
     return dt.datetime.now(dt.timezone.utc)
 
@@ -48,29 +100,324 @@ def iso_utc_ms(t: dt.datetime) -> str:
 
 def connect(db: pathlib.Path) -> sqlite3.Connection:
     db.parent.mkdir(parents=True, exist_ok=True)
-    return sqlite3.connect(str(db))
+    # Writers queue on BEGIN IMMEDIATE; give them room under parallel appends.
+    conn = sqlite3.connect(str(db), timeout=30)
+    schema_v2.register_functions(conn)  # v2 insert trigger hashes metadata
+    return conn
 
 def init_db(conn: sqlite3.Connection) -> None:
-    conn.executescript(SCHEMA_SQL)
-    conn.commit()
+    conn.executescript(PRAGMAS_SQL)  # synchronous is per connection
+    if migrations.user_version(conn) < migrations.SCHEMA_VERSION:
+        migrations.migrate(conn, SUPPORT_SQL if schema_v2.is_v2(conn) else EVENTS_SQL + SUPPORT_SQL)
 
-def next_scan_id(conn: sqlite3.Connection, t: dt.datetime) -> str:
+def seed_scan_counter(conn: sqlite3.Connection, day: str) -> int:
+    # First allocation of a day: pick up IDs written before the counter existed.
+    # Range predicates keep this on the scan_id indexes; it runs once per day.
+    lo, hi = f"{day}-", f"{day}."
+    return conn.execute(
+        """
+        SELECT COALESCE(MAX(CAST(substr(scan_id, 10) AS INTEGER)), 0) FROM (
+          SELECT MAX(scan_id) AS scan_id FROM scan_events WHERE scan_id >= ?1 AND scan_id < ?2
+          UNION ALL
+          SELECT MAX(scan_id) FROM scan_sessions WHERE scan_id >= ?1 AND scan_id < ?2
+        )
+        """,
+        (lo, hi),
+    ).fetchone()[0]
+
+def next_scan_ids(conn: sqlite3.Connection, t: dt.datetime, k: int) -> list[str]:
+    # Atomic per-day counter: BEGIN IMMEDIATE serializes concurrent writers, and
+    # the UPDATE ... RETURNING touches one row regardless of how full the day is.
     day = t.strftime("%Y%m%d")
-    n = conn.execute(
-        "SELECT COUNT(*) FROM scan_events WHERE scan_id LIKE ?",
-        (f"{day}-%",),
-    ).fetchone()[0] + 1
-    return f"{day}-{n:05d}"
+    if conn.in_transaction:
+        # Committing here would commit the caller's pending rows with it (an open
+        # ScanSession on a shared connection) and take away its rollback.
+        raise ValueError("cannot allocate scan_ids inside an open transaction; commit or roll it back first")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "UPDATE scan_id_counters SET last_n = last_n + ? WHERE day = ? RETURNING last_n",
+            (k, day),
+        ).fetchall()
+        if row:
+            n = row[0][0]
+        else:
+            n = seed_scan_counter(conn, day) + k
+            conn.execute("INSERT INTO scan_id_counters (day, last_n) VALUES (?, ?)", (day, n))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return [f"{day}-{i:05d}" for i in range(n - k + 1, n + 1)]
 
-def build_parser() -> argparse.ArgumentParser:
-    p = argparse.ArgumentParser(prog="registry.py")
-    p.add_argument("--db", default=str(DEFAULT_DB))
-    sub = p.add_subparsers(dest="cmd", required=True)
+def next_scan_id(conn: sqlite3.Connection, t: dt.datetime) -> str:
+    return next_scan_ids(conn, t, 1)[0]
 
-    sub.add_parser("init")
-    sub.add_parser("schema")
+def parse_metadata(value):
+    # Accepts a JSON string or an already-decoded object (JSONL rows).
+    if value is None or value == "":
+        return None
+    return json.loads(value) if isinstance(value, str) else value
 
-    a = sub.add_parser("append")
+def canonical_metadata(value) -> str | None:
+    # Strings and objects are stored in one canonical form so equal metadata compares equal.
+    obj = parse_metadata(value)
+    return None if obj is None else json.dumps(obj, separators=(",", ":"), sort_keys=True)
+
+def use_env_params(row: dict, meta) -> tuple:
+    # Row values win; otherwise the same keys from metadata_json, as the backfill does.
+    meta = meta if isinstance(meta, dict) else {}
+    first = row.get("use_env_first") or meta.get("use_env_first")
+    last = row.get("use_env_last") or meta.get("use_env_last")
+    seen = row.get("use_env_seen_json") or meta.get("use_env_seen_json") or meta.get("use_env_seen")
+    if seen is not None and not isinstance(seen, str):
+        seen = json.dumps(seen, separators=(",", ":"))
+    return first, last, seen
+
+def validate_row(row: dict) -> None:
+    t = row.get("artifact_type")
+    if t not in ARTIFACT_TYPES:
+        raise ValueError(f"artifact_type must be one of {'|'.join(ARTIFACT_TYPES)}, got {t!r}")
+    if not row.get("artifact_id"):
+        raise ValueError("artifact_id is required")
+    if (row.get("standalone_status") or "none") not in STANDALONE_STATUSES:
+        raise ValueError(f"standalone_status must be one of {'|'.join(STANDALONE_STATUSES)}")
+    if t != "PYN" and not row.get("pyn_id"):
+        raise ValueError("pyn_id is required for SID and CID rows")
+    if t != "CID" and row.get("capability"):
+        raise ValueError("capability is only allowed for CID rows")
+    if t == "CID" and not row.get("capability"):
+        raise ValueError("capability is required for CID rows")
+
+def row_params(row: dict, ts: str, scan_id: str) -> tuple:
+    meta = parse_metadata(row.get("metadata_json"))
+    return (
+        ts, scan_id, row["artifact_type"], row["artifact_id"],
+        row.get("parent_id"), row.get("supersedes_id"), row.get("superseded_by_id"), row.get("pyn_id"),
+        int(row.get("sid_count") or 0), int(row.get("cid_count") or 0), row.get("capability"),
+        row.get("standalone_status") or "none", canonical_metadata(meta),
+        *use_env_params(row, meta),
+    )
+
+def write_rows(conn: sqlite3.Connection, params: list[tuple]) -> int:
+    # Every insert goes through here so the storage mode applies to all writers.
+    # In delta mode presence is recorded for all rows, but only changed rows are stored.
+    if presence.storage_mode(conn) == "delta":
+        params = presence.filter_changed(conn, params)
+    if params:
+        conn.executemany(INSERT_SQL, params)
+    return len(params)
+
+def begin_scan(conn: sqlite3.Connection, scan_id: str | None = None) -> str:
+    t = now_utc()
+    sid = scan_id or next_scan_id(conn, t)
+    conn.execute(
+        "INSERT INTO scan_sessions (scan_id, started_utc) VALUES (?, ?)",
+        (sid, iso_utc_ms(t)),
+    )
+    conn.commit()
+    return sid
+
+def open_session(conn: sqlite3.Connection, scan_id: str) -> None:
+    row = conn.execute(
+        "SELECT committed_utc FROM scan_sessions WHERE scan_id = ?", (scan_id,)
+    ).fetchone()
+    if row is None:
+        raise SystemExit(f"ERROR: no scan session {scan_id}; run `scan begin` first")
+    if row[0] is not None:
+        raise SystemExit(f"ERROR: scan session {scan_id} was committed at {row[0]}")
+
+class ScanSession:
+    """
+    One scan_id, many rows, one transaction.
+
+        with ScanSession(db) as s:
+            s.append_many(rows)
+
+    Rows are dicts keyed by scan_events column names. Everything appended
+    inside the block is committed together on exit and rolled back on error.
+    Pass the scan_id from `scan begin` to append into an open session; without
+    one a new session is reserved and closed when the block exits.
+    """
+
+    def __init__(self, db: pathlib.Path, scan_id: str | None = None, conn: sqlite3.Connection | None = None):
+        self.db = pathlib.Path(db)
+        self.scan_id = scan_id
+        self.owns_session = scan_id is None
+        self.shared_conn = conn is not None  # borrowed from a Registry; left open on exit
+        self.rows = 0
+        self.stored = 0  # rows actually written; fewer than self.rows in delta mode
+        self.ts = ""
+        self.conn = conn
+        self._t0 = 0.0
+
+    def __enter__(self) -> "ScanSession":
+        if not self.shared_conn:
+            self.conn = connect(self.db)
+            init_db(self.conn)
+        if self.scan_id:
+            open_session(self.conn, self.scan_id)
+        else:
+            self.scan_id = begin_scan(self.conn)
+        self.ts = iso_utc_ms(now_utc())
+        self._t0 = time.perf_counter()
+        return self
+
+    def append(self, row: dict) -> None:
+        self.append_many([row])
+
+    def append_many(self, rows) -> int:
+        n = 0
+        batch = []
+        for row in rows:
+            try:
+                validate_row(row)
+                batch.append(row_params(row, self.ts, self.scan_id))
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"row {self.rows + n + len(batch) + 1}: {e}") from e
+            if len(batch) >= BATCH_SIZE:
+                self.stored += write_rows(self.conn, batch)
+                n += len(batch)
+                batch = []
+        if batch:
+            self.stored += write_rows(self.conn, batch)
+            n += len(batch)
+        self.rows += n
+        return n
+
+    def commit(self) -> None:
+        self.conn.execute(
+            "UPDATE scan_sessions SET row_count = row_count + ? WHERE scan_id = ?",
+            (self.rows, self.scan_id),
+        )
+        if self.owns_session:
+            self.conn.execute(
+                "UPDATE scan_sessions SET committed_utc = ? WHERE scan_id = ?",
+                (iso_utc_ms(now_utc()), self.scan_id),
+            )
+        self.conn.commit()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.conn.rollback()
+                if self.owns_session:
+                    # Release the reservation so failed one-shot loads leave no trace.
+                    self.conn.execute("DELETE FROM scan_sessions WHERE scan_id = ?", (self.scan_id,))
+                    self.conn.commit()
+        finally:
+            if not self.shared_conn:
+                self.conn.close()
+
+def prepare_rows(rows, numbered: bool = True) -> list[tuple]:
+    # Validate the whole batch before anything is written or any scan_id is
+    # allocated. Params carry empty ts/scan_id; the caller fills them in.
+    out = []
+    for n, row in enumerate(rows, 1):
+        try:
+            validate_row(row)
+            out.append(row_params(row, "", ""))
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"row {n}: {e}" if numbered else str(e)) from e
+    return out
+
+class Registry:
+    """
+    In-process handle on the registry for Python callers (indexer, DocTools)
+    that would otherwise spawn `registry.py append` per event.
+
+        with Registry(db) as reg:
+            sid = reg.append({"artifact_type": "PYN", "artifact_id": "..."})
+            sids = reg.append_many(rows)      # one scan_id per row, one commit
+            with reg.scan() as s:             # many rows under one scan_id
+                s.append_many(rows)
+
+    The connection and schema check are set up once; every write goes through
+    write_rows, so sqlite's statement cache reuses the same prepared INSERT.
+    """
+
+    def __init__(self, db: pathlib.Path = DEFAULT_DB):
+        self.db = pathlib.Path(db)
+        self.conn = connect(self.db)
+        init_db(self.conn)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "Registry":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def append(self, row: dict, scan_id: str | None = None) -> str:
+        return self.write(prepare_rows([row], numbered=False), scan_id)[0]
+
+    def append_many(self, rows, scan_id: str | None = None) -> list[str]:
+        """
+        Append rows as individual events, each under a fresh scan_id (or all
+        under `scan_id`), in one transaction. Nothing is written if any row
+        fails validation. Returns the scan_id of each row.
+        """
+        return self.write(prepare_rows(rows), scan_id)
+
+    def write(self, params: list[tuple], scan_id: str | None) -> list[str]:
+        if not params:
+            return []
+        if self.conn.in_transaction:
+            # write() commits; inside `with reg.scan() as s` that would commit the
+            # session's rows early. Append through the session instead.
+            raise ValueError("a transaction is open on this connection (inside reg.scan()?); "
+                             "append through the scan session")
+        t = now_utc()
+        ts = iso_utc_ms(t)
+        ids = [scan_id] * len(params) if scan_id else next_scan_ids(self.conn, t, len(params))
+        try:
+            write_rows(self.conn, [(ts, sid, *p[2:]) for p, sid in zip(params, ids)])
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        return ids
+
+    def scan(self, scan_id: str | None = None) -> ScanSession:
+        return ScanSession(self.db, scan_id, conn=self.conn)
+
+    def query(self, sql: str, params=()) -> list[tuple]:
+        return self.conn.execute(sql, params).fetchall()
+
+def commit_scan(conn: sqlite3.Connection, scan_id: str) -> int:
+    open_session(conn, scan_id)
+    conn.execute(
+        "UPDATE scan_sessions SET committed_utc = ? WHERE scan_id = ?",
+        (iso_utc_ms(now_utc()), scan_id),
+    )
+    conn.commit()
+    return conn.execute(
+        "SELECT row_count FROM scan_sessions WHERE scan_id = ?", (scan_id,)
+    ).fetchone()[0]
+
+def read_jsonl(f):
+    for lineno, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise SystemExit(f"ERROR: line {lineno}: invalid JSON: {e}")
+
+def add_append_args(a: argparse.ArgumentParser) -> None:
     a.add_argument("--scan-id")  # optional override
     a.add_argument("--artifact-type", required=True, choices=["PYN", "SID", "CID"])
     a.add_argument("--artifact-id", required=True)
@@ -84,6 +431,107 @@ def build_parser() -> argparse.ArgumentParser:
     a.add_argument("--standalone-status", default="none", choices=["none", "inventory", "runnable"])
     a.add_argument("--metadata-json")  # optional JSON string
 
+def row_from_args(args: argparse.Namespace) -> dict:
+    return {
+        "artifact_type": args.artifact_type,
+        "artifact_id": args.artifact_id,
+        "parent_id": args.parent_id,
+        "supersedes_id": args.supersedes_id,
+        "superseded_by_id": args.superseded_by_id,
+        "pyn_id": args.pyn_id,
+        "sid_count": args.sid_count,
+        "cid_count": args.cid_count,
+        "capability": args.capability,
+        "standalone_status": args.standalone_status,
+        "metadata_json": args.metadata_json,
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="registry.py")
+    p.add_argument("--db", default=str(DEFAULT_DB))
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    sub.add_parser("init")
+    sub.add_parser("schema")
+    sub.add_parser("backfill-current", help="rebuild artifacts_current from scan_events history")
+
+    a = sub.add_parser("append")
+    add_append_args(a)
+
+    s = sub.add_parser("scan", help="batched appends under one scan_id")
+    ssub = s.add_subparsers(dest="scan_cmd", required=True)
+    ssub.add_parser("begin")
+    am = ssub.add_parser("append-many")
+    am.add_argument("--scan-id", help="open session from `scan begin`; omit to begin+commit in one go")
+    am.add_argument("--input", default="-", help="JSONL file, one scan_events row per line (default: stdin)")
+    c = ssub.add_parser("commit")
+    c.add_argument("--scan-id", required=True)
+
+    f = sub.add_parser("find", help="indexed lookups on promoted metadata")
+    f.add_argument("--artifact-type", choices=["PYN", "SID", "CID"])
+    f.add_argument("--env", help="use_env_last")
+    f.add_argument("--hash", help="code_hash_full")
+    f.add_argument("--capability")
+
+    se = sub.add_parser("search", help="BM25-ranked full-text search over current artifacts")
+    se.add_argument("query", help="words to match (all must match, each as a prefix)")
+    se.add_argument("--limit", type=int, default=20)
+    se.add_argument("--type", dest="artifact_type", choices=["PYN", "SID", "CID"])
+    se.add_argument("--exact", action="store_true", help="whole words only, no prefix matching")
+    se.add_argument("--raw", action="store_true", help="query is FTS5 syntax (column:term, OR, NOT, NEAR)")
+    se.add_argument("--json", action="store_true", help="JSONL output")
+
+    ln = sub.add_parser("lineage", help="closure-table ancestry queries")
+    lsub = ln.add_subparsers(dest="lineage_cmd", required=True)
+    for name in ("ancestors", "descendants"):
+        q = lsub.add_parser(name)
+        q.add_argument("artifact_id")
+        q.add_argument("--kind", default="parent", choices=list(lineage.KINDS))
+    lsub.add_parser("gen0-root").add_argument("artifact_id")
+    lsub.add_parser("current-head").add_argument("artifact_id")
+    lsub.add_parser("rebuild")
+
+    rp = sub.add_parser("report", help="identicals / merge-candidates review reports (JSONL)")
+    rp.add_argument("report", choices=list(reports.REPORTS))
+    rp.add_argument("--incremental", action="store_true",
+                    help="only re-evaluate groups touched since the last run of this report")
+
+    sm = sub.add_parser("storage-mode", help="show or set full|delta history storage")
+    sm.add_argument("mode", nargs="?", choices=["full", "delta"])
+
+    ex = sub.add_parser("export-since", help="ship scan_events rows past a rowid watermark (gzip JSONL)")
+    ex.add_argument("watermark", type=int, help="last rowid the target already has (0 for everything)")
+    ex.add_argument("--out", default="-", help="output file (default: stdout)")
+
+    im = sub.add_parser("import", help="merge exports from other registries (idempotent)")
+    im.add_argument("files", nargs="+", help="export files; - for stdin")
+
+    sub.add_parser("import-state", help="per-origin import watermarks")
+
+    og = sub.add_parser("origin", help="show or set this registry's origin name for exports")
+    og.add_argument("name", nargs="?")
+
+    ar = sub.add_parser("archive", help="move old scan_events rows into per-month archive files")
+    ar.add_argument("--before", help="YYYY-MM-DD or ISO timestamp (UTC); omit to list archived months")
+    ar.add_argument("--dir", help="archive directory (default: archive/ next to the db)")
+    ar.add_argument("--vacuum", action="store_true", help="VACUUM the main file afterwards to return the space")
+
+    hi = sub.add_parser("history", help="scan_events rows across the hot file and archives (JSONL)")
+    hi.add_argument("--since", help="YYYY-MM-DD or ISO timestamp (UTC), inclusive")
+    hi.add_argument("--until", help="YYYY-MM-DD or ISO timestamp (UTC), exclusive")
+    hi.add_argument("--type", dest="artifact_type", choices=["PYN", "SID", "CID"])
+    hi.add_argument("--artifact-id")
+    hi.add_argument("--limit", type=int)
+
+    rf = sub.add_parser("referrals", help="pending execution referrals from the trigger (JSONL), or ack them")
+    rf.add_argument("--ack", type=int, nargs="+", metavar="ID", help="mark these referral ids handled")
+    rf.add_argument("--limit", type=int)
+
+    sv = sub.add_parser("serve", help="long-running writer with group commit over a Unix socket")
+    sv.add_argument("--socket", help="socket path (default: <db>.sock)")
+    sv.add_argument("--window-ms", type=float, default=5.0, help="group-commit window")
+    sv.add_argument("--max-batch", type=int, default=500)
+
     return p
 
 def cmd_init(args: argparse.Namespace) -> int:
@@ -96,46 +544,259 @@ def cmd_schema(args: argparse.Namespace) -> int:
     print(SCHEMA_SQL.strip())
     return 0
 
+def cmd_backfill_current(args: argparse.Namespace) -> int:
+    db = pathlib.Path(args.db)
+    with connect(db) as conn:
+        init_db(conn)
+        n = current_state.backfill(conn)
+        conn.commit()
+    print(f"artifacts_current: {n} artifacts")
+    return 0
+
 def cmd_append(args: argparse.Namespace) -> int:
+    with Registry(args.db) as reg:
+        try:
+            sid = reg.append(row_from_args(args), args.scan_id)  # guardrails run before an ID is allocated
+        except ValueError as e:
+            raise SystemExit(f"ERROR: {e}")
+    print(sid)
+    return 0
+
+def cmd_find(args: argparse.Namespace) -> int:
     db = pathlib.Path(args.db)
-    t = now_utc()
-    ts = iso_utc_ms(t)
+    where, params = [], []
+    for col, val in (
+        ("artifact_type", args.artifact_type),
+        ("use_env_last", args.env),
+        ("code_hash_full", args.hash),
+        ("capability", args.capability),
+    ):
+        if val is not None:
+            where.append(f"{col} = ?")
+            params.append(val)
+    if not where:
+        raise SystemExit("ERROR: give at least one of --artifact-type/--env/--hash/--capability")
+
+    with connect(db) as conn:
+        init_db(conn)
+        if args.hash is not None and schema_v2.is_v2(conn):
+            # The view reaches metadata_blobs through a LEFT JOIN, so a filter on
+            # code_hash_full can't start from the blob index; resolve ids first.
+            i = where.index("code_hash_full = ?")
+            ids = schema_v2.metadata_ids(conn, "code_hash_full", args.hash)
+            where[i] = f"metadata_id IN ({', '.join('?' for _ in ids) or 'NULL'})"
+            params[i:i + 1] = ids
+        rows = conn.execute(
+            f"""
+            SELECT artifact_type, artifact_id, MAX(timestamp_utc)
+            FROM scan_events
+            WHERE {" AND ".join(where)}
+            GROUP BY artifact_type, artifact_id
+            ORDER BY artifact_type, artifact_id
+            """,
+            params,
+        ).fetchall()
+    for t, aid, last_seen in rows:
+        print(f"{t}\t{aid}\t{last_seen}")
+    return 0
+
+def cmd_search(args: argparse.Namespace) -> int:
+    db = pathlib.Path(args.db)
+    with connect(db) as conn:
+        init_db(conn)
+        try:
+            hits = list(search.search(conn, args.query, args.limit, args.artifact_type,
+                                      raw=args.raw, prefix=not args.exact))
+        except ValueError as e:
+            raise SystemExit(f"ERROR: {e}")
+    for h in hits:
+        if args.json:
+            print(json.dumps(h, separators=(",", ":")))
+        else:
+            print(f"{h['artifact_type']}\t{h['artifact_id']}\t{h['capability'] or ''}\t{h['score']}\t{h['snippet'] or ''}")
+    return 0
+
+def cmd_lineage(args: argparse.Namespace) -> int:
+    db = pathlib.Path(args.db)
+    with connect(db) as conn:
+        init_db(conn)
+        if args.lineage_cmd == "rebuild":
+            n = lineage.rebuild(conn)
+            conn.commit()
+            print(f"lineage_closure: {n} pairs")
+        elif args.lineage_cmd == "ancestors":
+            for aid, depth in lineage.ancestors(conn, args.artifact_id, args.kind):
+                print(f"{depth}\t{aid}")
+        elif args.lineage_cmd == "descendants":
+            for aid, depth in lineage.descendants(conn, args.artifact_id, args.kind):
+                print(f"{depth}\t{aid}")
+        elif args.lineage_cmd == "gen0-root":
+            print(lineage.gen0_root(conn, args.artifact_id))
+        else:
+            print(lineage.current_head(conn, args.artifact_id))
+    return 0
 
-    meta = None
-    if args.metadata_json:
-        json.loads(args.metadata_json)  # validate
-        meta = args.metadata_json
+def cmd_report(args: argparse.Namespace) -> int:
+    db = pathlib.Path(args.db)
+    with connect(db) as conn:
+        init_db(conn)
+        upto = reports.max_rowid(conn)
+        since = reports.watermark(conn, args.report) if args.incremental else None
+        n = 0
+        for group in reports.RUNNERS[args.report](conn, since):
+            print(json.dumps(group, separators=(",", ":")))
+            n += 1
+        reports.save_watermark(conn, args.report, upto, iso_utc_ms(now_utc()))
+    print(f"{args.report}: {n} groups", file=sys.stderr)
+    return 0
 
+def cmd_storage_mode(args: argparse.Namespace) -> int:
+    db = pathlib.Path(args.db)
     with connect(db) as conn:
         init_db(conn)
-        sid = args.scan_id or next_scan_id(conn, t)
-
-        # Guardrails
-        if args.artifact_type != "PYN" and not args.pyn_id:
-            raise SystemExit("ERROR: --pyn-id is required for SID and CID rows")
-        if args.artifact_type != "CID" and args.capability:
-            raise SystemExit("ERROR: --capability is only allowed for CID rows")
-        if args.artifact_type == "CID" and not args.capability:
-            raise SystemExit("ERROR: --capability is required for CID rows")
-
-        conn.execute(
-            """
-            INSERT INTO scan_events (
-              timestamp_utc, scan_id, artifact_type, artifact_id,
-              parent_id, supersedes_id, superseded_by_id, pyn_id,
-              sid_count, cid_count, capability, standalone_status, metadata_json
+        if args.mode:
+            presence.set_storage_mode(conn, args.mode)
+        print(presence.storage_mode(conn))
+    return 0
+
+def cmd_export_since(args: argparse.Namespace) -> int:
+    import shipping
+
+    with Registry(args.db) as reg:
+        if args.out == "-":
+            n, upto = shipping.export_since(reg.conn, args.watermark, sys.stdout.buffer)
+        else:
+            with open(args.out, "wb") as f:
+                n, upto = shipping.export_since(reg.conn, args.watermark, f)
+    print(f"{n} rows, next watermark {upto}", file=sys.stderr)
+    return 0
+
+def cmd_import(args: argparse.Namespace) -> int:
+    import shipping
+
+    with Registry(args.db) as reg:
+        for path in args.files:
+            t0 = time.perf_counter()
+            f = sys.stdin.buffer if path == "-" else open(path, "rb")
+            try:
+                r = shipping.import_file(reg.conn, f)
+            except (ValueError, OSError) as e:
+                raise SystemExit(f"ERROR: {path}: {e}")
+            finally:
+                if f is not sys.stdin.buffer:
+                    f.close()
+            print(f"{path}: origin {r['origin']}: {r['rows']} rows, {r['new']} new, "
+                  f"watermark {r['watermark']} ({time.perf_counter() - t0:.2f}s)", file=sys.stderr)
+    return 0
+
+def cmd_import_state(args: argparse.Namespace) -> int:
+    with Registry(args.db) as reg:
+        for origin, last_rowid, n, updated in reg.query(
+            "SELECT origin, last_rowid, rows_imported, updated_utc FROM import_state ORDER BY origin"
+        ):
+            print(f"{origin}\t{last_rowid}\t{n}\t{updated}")
+    return 0
+
+def cmd_origin(args: argparse.Namespace) -> int:
+    import shipping
+
+    with Registry(args.db) as reg:
+        if args.name:
+            try:
+                shipping.set_origin(reg.conn, args.name)
+            except ValueError as e:
+                raise SystemExit(f"ERROR: {e}")
+        print(shipping.origin(reg.conn))
+    return 0
+
+def cmd_archive(args: argparse.Namespace) -> int:
+    with Registry(args.db) as reg:
+        if args.before:
+            try:
+                cutoff = archive.parse_bound(args.before)
+            except ValueError as e:
+                raise SystemExit(f"ERROR: --before: {e}")
+            t0 = time.perf_counter()
+            moved = archive.archive_before(
+                reg.conn, cutoff, iso_utc_ms(now_utc()), pathlib.Path(args.dir) if args.dir else None
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                ts, sid, args.artifact_type, args.artifact_id,
-                args.parent_id, args.supersedes_id, args.superseded_by_id, args.pyn_id,
-                args.sid_count, args.cid_count, args.capability, args.standalone_status, meta
-            ),
-        )
-        conn.commit()
+            for month, n in moved.items():
+                print(f"{month}\t{n} rows", file=sys.stderr)
+            print(f"archived {sum(moved.values())} rows before {cutoff} "
+                  f"({time.perf_counter() - t0:.2f}s)", file=sys.stderr)
+            if args.vacuum and moved:
+                reg.conn.execute("VACUUM")
+        for month, rows, scans, pyn, sid, cid, first, last, path in archive.archived_months(reg.conn):
+            print(f"{month}\t{rows}\t{scans} scans\tPYN {pyn} SID {sid} CID {cid}\t{first}\t{last}\t{path}")
+    return 0
 
-    print(sid)
+def cmd_history(args: argparse.Namespace) -> int:
+    try:
+        since = archive.parse_bound(args.since) if args.since else None
+        until = archive.parse_bound(args.until) if args.until else None
+    except ValueError as e:
+        raise SystemExit(f"ERROR: {e}")
+    with Registry(args.db) as reg:
+        try:
+            rows = archive.history(reg.conn, since, until, args.artifact_type, args.artifact_id, args.limit)
+        except ValueError as e:
+            raise SystemExit(f"ERROR: {e}")
+    for r in rows:
+        print(json.dumps(r, separators=(",", ":")))
+    return 0
+
+def cmd_referrals(args: argparse.Namespace) -> int:
+    with Registry(args.db) as reg:
+        referrals.ingest_spool(reg.conn, reg.db)  # left by traced runs that exited first
+        if args.ack:
+            n = referrals.ack(reg.conn, args.ack)
+            print(f"acked {n} of {len(args.ack)}", file=sys.stderr)
+            return 0
+        for r in referrals.pending(reg.conn, args.limit):
+            print(json.dumps(r, separators=(",", ":")))
+    return 0
+
+def cmd_serve(args: argparse.Namespace) -> int:
+    import registry_server
+
+    db = pathlib.Path(args.db)
+    sock = pathlib.Path(args.socket) if args.socket else registry_server.socket_path_for(db)
+    return registry_server.serve(db, sock, window_s=args.window_ms / 1000.0, max_batch=args.max_batch)
+
+def cmd_scan(args: argparse.Namespace) -> int:
+    db = pathlib.Path(args.db)
+
+    if args.scan_cmd == "begin":
+        with connect(db) as conn:
+            init_db(conn)
+            print(begin_scan(conn))
+        return 0
+
+    if args.scan_cmd == "commit":
+        conn = connect(db)
+        try:
+            init_db(conn)
+            n = commit_scan(conn, args.scan_id)
+        finally:
+            conn.close()
+        print(f"{args.scan_id} committed ({n} rows)")
+        return 0
+
+    # append-many
+    f = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    try:
+        with ScanSession(db, args.scan_id) as s:
+            try:
+                s.append_many(read_jsonl(f))
+            except ValueError as e:
+                raise SystemExit(f"ERROR: {e}")
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+    print(s.scan_id)
+    stored = "" if s.stored == s.rows else f", {s.stored} changed"
+    print(f"{s.rows} rows{stored} in {s.elapsed:.3f}s ({s.rows_per_sec:,.0f} rows/sec)", file=sys.stderr)
     return 0
 
 def main(argv: list[str]) -> int:
@@ -146,8 +807,38 @@ def main(argv: list[str]) -> int:
         return cmd_init(args)
     if args.cmd == "schema":
         return cmd_schema(args)
+    if args.cmd == "backfill-current":
+        return cmd_backfill_current(args)
     if args.cmd == "append":
         return cmd_append(args)
+    if args.cmd == "scan":
+        return cmd_scan(args)
+    if args.cmd == "find":
+        return cmd_find(args)
+    if args.cmd == "search":
+        return cmd_search(args)
+    if args.cmd == "archive":
+        return cmd_archive(args)
+    if args.cmd == "history":
+        return cmd_history(args)
+    if args.cmd == "lineage":
+        return cmd_lineage(args)
+    if args.cmd == "report":
+        return cmd_report(args)
+    if args.cmd == "storage-mode":
+        return cmd_storage_mode(args)
+    if args.cmd == "export-since":
+        return cmd_export_since(args)
+    if args.cmd == "import":
+        return cmd_import(args)
+    if args.cmd == "import-state":
+        return cmd_import_state(args)
+    if args.cmd == "origin":
+        return cmd_origin(args)
+    if args.cmd == "referrals":
+        return cmd_referrals(args)
+    if args.cmd == "serve":
+        return cmd_serve(args)
 
     return 2
 
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Thin client for the registry daemon (`registry.py serve`).
+
+Library:
+
+  import registry_client
+  sid = registry_client.append({"artifact_type": "PYN", "artifact_id": "X"}, db=db)
+  cols, rows = registry_client.query("SELECT COUNT(*) FROM scan_events", db=db)
+
+CLI (same append flags as registry.py):
+
+  python3 registry_client.py --db registry/registry.sqlite append --artifact-type PYN --artifact-id X
+
+When no daemon is listening on the socket, both fall back to a direct write
+or read against the database, so callers never need to care whether it runs.
+An append the daemon received but never answered is not retried directly
+(the daemon may have committed it): it raises ReplyLost instead.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import pathlib
+import socket
+import sys
+
+import registry
+from registry_server import REPLY_TIMEOUT_S, socket_path_for
+
+# Longer than the daemon takes to give up on a request itself, so a slow
+# group commit still gets its reply (or the daemon's timeout error).
+CLIENT_TIMEOUT_S = REPLY_TIMEOUT_S + 10.0
+
+class DaemonUnavailable(Exception):
+    """No daemon took the request; nothing was sent."""
+
+class ReplyLost(Exception):
+    """The request was sent but no reply came; it may or may not have been applied."""
+
+class Client:
+    """One socket connection, reusable for many requests."""
+
+    def __init__(self, sock_path: pathlib.Path, timeout: float = CLIENT_TIMEOUT_S):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(str(sock_path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            self.sock.close()
+            raise DaemonUnavailable(str(e)) from e
+        self.f = self.sock.makefile("rwb")
+
+    def call(self, msg: dict) -> dict:
+        try:
+            self.f.write(json.dumps(msg, separators=(",", ":")).encode("utf-8") + b"\n")
+            self.f.flush()
+        except OSError as e:
+            # A request line cut short never parses on the daemon's side.
+            raise DaemonUnavailable(f"sending to the daemon failed: {e}") from e
+        try:
+            line = self.f.readline()
+        except OSError as e:  # includes socket timeouts
+            raise ReplyLost(f"no reply from the daemon: {e}") from e
+        if not line:
+            raise ReplyLost("daemon closed the connection before replying")
+        return json.loads(line)
+
+    def close(self) -> None:
+        self.f.close()
+        self.sock.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def _call(msg: dict, db: pathlib.Path, sock_path: pathlib.Path | None) -> dict:
+    with Client(sock_path or socket_path_for(db)) as c:
+        return c.call(msg)
+
+def append(row: dict, db: pathlib.Path = registry.DEFAULT_DB, scan_id: str | None = None,
+           sock_path: pathlib.Path | None = None) -> str:
+    """Append one row through the daemon, or directly if it is not running."""
+    db = pathlib.Path(db)
+    try:
+        reply = _call({"op": "append", "row": row, "scan_id": scan_id}, db, sock_path)
+    except DaemonUnavailable:
+        with registry.Registry(db) as reg:
+            return reg.append(row, scan_id)
+    if not reply.get("ok"):
+        raise ValueError(reply.get("error"))
+    return reply["scan_id"]
+
+def query(sql: str, params: list | tuple = (), db: pathlib.Path = registry.DEFAULT_DB,
+          sock_path: pathlib.Path | None = None) -> tuple[list[str], list[list]]:
+    """Run a read-only query through the daemon, or directly if it is not running."""
+    db = pathlib.Path(db)
+    try:
+        reply = _call({"op": "query", "sql": sql, "params": list(params)}, db, sock_path)
+    except (DaemonUnavailable, ReplyLost):  # read-only, so safe to run again
+        conn = registry.connect(db)
+        try:
+            conn.execute("PRAGMA query_only=ON")
+            cur = conn.execute(sql, params)
+            return [d[0] for d in cur.description or []], [list(r) for r in cur.fetchall()]
+        finally:
+            conn.close()
+    if not reply.get("ok"):
+        raise ValueError(reply.get("error"))
+    return reply["columns"], reply["rows"]
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(prog="registry_client.py", description="Talk to the registry daemon.")
+    p.add_argument("--db", default=str(registry.DEFAULT_DB))
+    p.add_argument("--socket", help="daemon socket (default: <db>.sock)")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    registry.add_append_args(sub.add_parser("append"))
+    q = sub.add_parser("query")
+    q.add_argument("sql")
+    q.add_argument("params", nargs="*")
+    args = p.parse_args(argv)
+
+    db = pathlib.Path(args.db)
+    sock = pathlib.Path(args.socket) if args.socket else None
+    try:
+        if args.cmd == "append":
+            print(append(registry.row_from_args(args), db, args.scan_id, sock))
+            return 0
+        cols, rows = query(args.sql, args.params, db, sock)
+    except (ValueError, ReplyLost) as e:
+        raise SystemExit(f"ERROR: {e}")
+    print("\t".join(cols))
+    for r in rows:
+        print("\t".join("" if v is None else str(v) for v in r))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,258 @@
+"""
+Registry daemon: one long-lived WAL connection behind a Unix domain socket.
+
+Started with `registry.py serve`. Clients send one JSON request per line and
+get one JSON reply per line:
+
+  {"op": "append", "row": {...scan_events columns...}, "scan_id": null}
+      -> {"ok": true, "scan_id": "20260201-00042"}
+  {"op": "query", "sql": "SELECT ...", "params": [...]}
+      -> {"ok": true, "columns": [...], "rows": [[...], ...]}
+  {"op": "ping"} -> {"ok": true}
+
+Appends that arrive within the group-commit window share one transaction and
+one block of scan_ids. Queries run read-only on the same connection after
+pending writes commit, so callers always read their own appends. Because the
+protocol is plain JSON lines, shell scripts can talk to it without starting
+Python at all:
+
+  echo '{"op":"append","row":{"artifact_type":"PYN","artifact_id":"X"}}' \
+    | nc -U registry/registry.sock
+"""
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import queue
+import signal
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+
+import registry
+
+# How long a connection waits for the writer's reply before giving up on it.
+REPLY_TIMEOUT_S = 60.0
+
+def socket_path_for(db: pathlib.Path) -> pathlib.Path:
+    return pathlib.Path(db).with_suffix(".sock")
+
+class Request:
+    __slots__ = ("msg", "reply", "done")
+
+    def __init__(self, msg: dict):
+        self.msg = msg
+        self.reply: dict = {}
+        self.done = threading.Event()
+
+    def finish(self, reply: dict) -> None:
+        self.reply = reply
+        self.done.set()
+
+class Writer(threading.Thread):
+    """Single owner of the sqlite connection; drains the queue in group commits."""
+
+    def __init__(self, db: pathlib.Path, window_s: float, max_batch: int):
+        super().__init__(name="registry-writer", daemon=True)
+        self.db = db
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self.q: queue.Queue[Request | None] = queue.Queue()
+        self.stats = {"appends": 0, "commits": 0, "queries": 0}
+
+    def submit(self, msg: dict, timeout: float = REPLY_TIMEOUT_S) -> dict:
+        req = Request(msg)
+        self.q.put(req)
+        if not req.done.wait(timeout):
+            return {"ok": False, "error": f"no reply from the writer within {timeout:g}s"}
+        return req.reply
+
+    def stop(self) -> None:
+        self.q.put(None)
+
+    def run(self) -> None:
+        conn = registry.connect(self.db)
+        registry.init_db(conn)
+        try:
+            while True:
+                first = self.q.get()
+                if first is None:
+                    return
+                batch = [first]
+                deadline = time.monotonic() + self.window_s
+                stopping = False
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        nxt = self.q.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if nxt is None:
+                        stopping = True
+                        break
+                    batch.append(nxt)
+                self.process(conn, batch)
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    def process(self, conn: sqlite3.Connection, batch: list[Request]) -> None:
+        appends, others = [], []
+        for req in batch:
+            (appends if req.msg.get("op") == "append" else others).append(req)
+        # Whatever a request does, it gets a reply and the writer keeps running.
+        if appends:
+            try:
+                self.group_commit(conn, appends)
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                for req in appends:
+                    if not req.done.is_set():
+                        req.finish({"ok": False, "error": f"{type(e).__name__}: {e}"})
+        for req in others:
+            try:
+                reply = self.handle_other(conn, req.msg)
+            except Exception as e:
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            req.finish(reply)
+
+    def group_commit(self, conn: sqlite3.Connection, reqs: list[Request]) -> None:
+        valid = []
+        for req in reqs:
+            row = req.msg.get("row") or {}
+            try:
+                if not isinstance(row, dict):
+                    raise ValueError("row must be a JSON object")
+                registry.validate_row(row)
+                registry.canonical_metadata(row.get("metadata_json"))
+            except ValueError as e:
+                req.finish({"ok": False, "error": str(e)})
+                continue
+            valid.append(req)
+        if not valid:
+            return
+
+        t = registry.now_utc()
+        ts = registry.iso_utc_ms(t)
+        need = sum(1 for req in valid if not req.msg.get("scan_id"))
+        ids = iter(registry.next_scan_ids(conn, t, need) if need else [])
+
+        results = []
+        try:
+            for req in valid:
+                sid = req.msg.get("scan_id") or next(ids)
+                try:
+                    registry.write_rows(conn, [registry.row_params(req.msg["row"], ts, sid)])
+                    results.append((req, {"ok": True, "scan_id": sid}))
+                except (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.ProgrammingError,
+                        ValueError, TypeError) as e:
+                    # Statement-level failure, or a field that does not convert or
+                    # bind (a non-numeric sid_count, an object); the rest of the
+                    # group still commits.
+                    results.append((req, {"ok": False, "error": str(e)}))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            results = [(req, {"ok": False, "error": str(e)}) for req in valid]
+        else:
+            self.stats["commits"] += 1
+            self.stats["appends"] += sum(1 for _, rep in results if rep["ok"])
+        for req, rep in results:
+            req.finish(rep)
+
+    def handle_other(self, conn: sqlite3.Connection, msg: dict) -> dict:
+        op = msg.get("op")
+        if op == "ping":
+            return {"ok": True}
+        if op == "stats":
+            return {"ok": True, **self.stats}
+        if op == "query":
+            self.stats["queries"] += 1
+            sql, params = msg.get("sql") or "", msg.get("params") or []
+            if not isinstance(sql, str) or not isinstance(params, (list, dict)):
+                return {"ok": False, "error": "sql must be a string and params a list or object"}
+            conn.execute("PRAGMA query_only=ON")
+            try:
+                cur = conn.execute(sql, params)
+                cols = [d[0] for d in cur.description or []]
+                return {"ok": True, "columns": cols, "rows": [list(r) for r in cur.fetchall()]}
+            except sqlite3.Error as e:
+                return {"ok": False, "error": str(e)}
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.execute("PRAGMA query_only=OFF")
+        return {"ok": False, "error": f"unknown op {op!r}"}
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: pathlib.Path, writer: Writer):
+        self.writer = writer
+        super().__init__(str(path), Handler)
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                msg = json.loads(line)
+                if not isinstance(msg, dict):
+                    raise ValueError("request must be a JSON object")
+            except ValueError as e:
+                reply = {"ok": False, "error": f"bad request: {e}"}
+            else:
+                reply = self.server.writer.submit(msg)
+            self.wfile.write(json.dumps(reply, separators=(",", ":")).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+def socket_is_live(path: pathlib.Path) -> bool:
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(str(path))
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+def serve(db: pathlib.Path, sock: pathlib.Path, window_s: float = 0.005, max_batch: int = 500) -> int:
+    if sock.exists():
+        if socket_is_live(sock):
+            print(f"ERROR: registry daemon already listening on {sock}", file=sys.stderr)
+            return 2
+        sock.unlink()  # stale socket from a crashed daemon
+
+    writer = Writer(db, window_s, max_batch)
+    writer.start()
+    server = Server(sock, writer)
+
+    def shutdown(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    print(f"registry daemon: db={db} socket={sock} window={window_s * 1000:.1f}ms", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        writer.stop()
+        writer.join()
+        try:
+            os.unlink(sock)
+        except FileNotFoundError:
+            pass
+    print(f"registry daemon stopped: {writer.stats}", file=sys.stderr)
+    return 0
@@ -0,0 +1,206 @@
+"""
+Review reports from constitution 8.2.3 / 8.2.4.
+
+  identicals        artifacts whose current code_hash_full is shared (hash collisions)
+  merge-candidates  CIDs with the same capability owned by more than one PYN
+
+Both stream grouped rows in one ordered pass over an index: identicals over
+artifacts_current(code_hash_full), merge candidates over cid_capability_owners,
+a small trigger-maintained (cid, capability, pyn_id) table. With --incremental
+only groups touched by scan_events rows newer than the last run's watermark
+are re-evaluated. For identicals that includes the hash an artifact moved away
+from while others still had it (report_departed_hashes, filled by triggers on
+artifacts_current); such a group that no longer has two members is emitted
+once with "resolved": true so consumers can drop it.
+"""
+from __future__ import annotations
+
+import itertools
+import sqlite3
+from typing import Iterator
+
+import schema_v2
+
+REPORTS = ("identicals", "merge-candidates")
+
+SCHEMA_SQL = """
+CREATE INDEX IF NOT EXISTS ix_artifacts_current_hash
+ON artifacts_current(code_hash_full, artifact_type, artifact_id)
+WHERE code_hash_full IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS cid_capability_owners (
+  cid            TEXT NOT NULL,
+  capability     TEXT NOT NULL,
+  pyn_id         TEXT NOT NULL,
+  first_seen_utc TEXT NOT NULL,
+  last_seen_utc  TEXT NOT NULL,
+  PRIMARY KEY (cid, capability, pyn_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS report_departed_hashes (
+  seq            INTEGER PRIMARY KEY,
+  code_hash_full TEXT    NOT NULL -- an artifacts_current row left this hash's group
+);
+
+CREATE TABLE IF NOT EXISTS report_state (
+  report      TEXT    PRIMARY KEY,
+  last_rowid  INTEGER NOT NULL, -- scan_events rowid covered by the last run
+  updated_utc TEXT    NOT NULL
+);
+"""
+
+TRIGGER_NAME = "tr_scan_events_cid_owners"
+
+TRIGGER_SQL = f"""
+CREATE TRIGGER IF NOT EXISTS {TRIGGER_NAME}
+{{timing}} ON scan_events
+WHEN NEW.artifact_type = 'CID' AND NEW.capability IS NOT NULL AND NEW.pyn_id IS NOT NULL
+BEGIN
+  INSERT INTO cid_capability_owners (cid, capability, pyn_id, first_seen_utc, last_seen_utc)
+  VALUES (NEW.artifact_id, NEW.capability, NEW.pyn_id, NEW.timestamp_utc, NEW.timestamp_utc)
+  ON CONFLICT (cid, capability, pyn_id) DO UPDATE SET
+    first_seen_utc = MIN(first_seen_utc, excluded.first_seen_utc),
+    last_seen_utc = MAX(last_seen_utc, excluded.last_seen_utc);
+END;
+"""
+
+DEPARTED_TRIGGERS = {
+    "tr_artifacts_current_hash_updated": """
+CREATE TRIGGER IF NOT EXISTS tr_artifacts_current_hash_updated
+AFTER UPDATE OF code_hash_full ON artifacts_current
+WHEN OLD.code_hash_full IS NOT NULL AND OLD.code_hash_full IS NOT NEW.code_hash_full
+  AND EXISTS (SELECT 1 FROM artifacts_current WHERE code_hash_full = OLD.code_hash_full)
+BEGIN
+  INSERT INTO report_departed_hashes (code_hash_full) VALUES (OLD.code_hash_full);
+END;
+""",
+    "tr_artifacts_current_hash_deleted": """
+CREATE TRIGGER IF NOT EXISTS tr_artifacts_current_hash_deleted
+AFTER DELETE ON artifacts_current
+WHEN OLD.code_hash_full IS NOT NULL
+  AND EXISTS (SELECT 1 FROM artifacts_current WHERE code_hash_full = OLD.code_hash_full)
+BEGIN
+  INSERT INTO report_departed_hashes (code_hash_full) VALUES (OLD.code_hash_full);
+END;
+""",
+}
+
+def backfill_owners(conn: sqlite3.Connection) -> int:
+    conn.execute("DELETE FROM cid_capability_owners")
+    conn.execute("""
+        INSERT INTO cid_capability_owners (cid, capability, pyn_id, first_seen_utc, last_seen_utc)
+        SELECT artifact_id, capability, pyn_id, MIN(timestamp_utc), MAX(timestamp_utc)
+        FROM scan_events
+        WHERE artifact_type = 'CID' AND capability IS NOT NULL AND pyn_id IS NOT NULL
+        GROUP BY artifact_id, capability, pyn_id
+    """)
+    return conn.execute("SELECT COUNT(*) FROM cid_capability_owners").fetchone()[0]
+
+def ensure_reports(conn: sqlite3.Connection) -> None:
+    names = ("ix_artifacts_current_hash", "cid_capability_owners", "report_departed_hashes", "report_state",
+             TRIGGER_NAME, *DEPARTED_TRIGGERS)
+    have = {r[0] for r in conn.execute(
+        f"SELECT name FROM sqlite_master WHERE name IN ({', '.join('?' for _ in names)})", names
+    )}
+    if set(names) <= have:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        fresh = "cid_capability_owners" not in {r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name = 'cid_capability_owners'"
+        )}
+        for stmt in SCHEMA_SQL.split(";"):
+            if stmt.strip():
+                conn.execute(stmt)
+        conn.execute(TRIGGER_SQL.format(timing=schema_v2.insert_timing(conn)))
+        for sql in DEPARTED_TRIGGERS.values():
+            conn.execute(sql)
+        if fresh:
+            backfill_owners(conn)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+# --- report state
+
+def max_rowid(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM scan_events").fetchone()[0]
+
+def watermark(conn: sqlite3.Connection, report: str) -> int:
+    row = conn.execute("SELECT last_rowid FROM report_state WHERE report = ?", (report,)).fetchone()
+    return row[0] if row else 0
+
+def save_watermark(conn: sqlite3.Connection, report: str, rowid: int, now_iso: str) -> None:
+    conn.execute(
+        """
+        INSERT INTO report_state (report, last_rowid, updated_utc) VALUES (?, ?, ?)
+        ON CONFLICT (report) DO UPDATE SET last_rowid = excluded.last_rowid, updated_utc = excluded.updated_utc
+        """,
+        (report, rowid, now_iso),
+    )
+    conn.commit()
+
+# --- reports
+
+def identicals(conn: sqlite3.Connection, since_rowid: int | None = None) -> Iterator[dict]:
+    departed_upto = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM report_departed_hashes").fetchone()[0]
+    if since_rowid is None:
+        cur = conn.execute("""
+            SELECT code_hash_full, artifact_type, artifact_id, 0 FROM artifacts_current
+            WHERE code_hash_full IS NOT NULL
+            ORDER BY code_hash_full, artifact_type, artifact_id
+        """)
+    else:
+        # Hashes that appeared in rows past the watermark, plus those artifacts
+        # moved away from; each group is then one range lookup on
+        # ix_artifacts_current_hash. LEFT JOIN: a departed hash may have no
+        # members left at all.
+        cur = conn.execute("""
+            SELECT t.code_hash_full, a.artifact_type, a.artifact_id, t.departed
+            FROM (
+              SELECT code_hash_full, MAX(departed) AS departed FROM (
+                SELECT code_hash_full, 0 AS departed FROM scan_events
+                WHERE rowid > ? AND code_hash_full IS NOT NULL
+                UNION ALL
+                SELECT code_hash_full, 1 FROM report_departed_hashes WHERE seq <= ?
+              )
+              GROUP BY code_hash_full
+            ) AS t
+            LEFT JOIN artifacts_current a ON a.code_hash_full = t.code_hash_full
+            ORDER BY t.code_hash_full, a.artifact_type, a.artifact_id
+        """, (since_rowid, departed_upto))
+    for h, grp in itertools.groupby(cur, key=lambda r: r[0]):
+        grp = list(grp)
+        members = [{"artifact_type": t, "artifact_id": aid} for _, t, aid, _ in grp if aid is not None]
+        if len(members) > 1:
+            yield {"report": "identicals", "code_hash_full": h, "count": len(members), "artifacts": members}
+        elif grp[0][3]:
+            yield {"report": "identicals", "code_hash_full": h, "count": len(members), "artifacts": members,
+                   "resolved": True}
+    # Consumed with this run; committed together with its watermark.
+    conn.execute("DELETE FROM report_departed_hashes WHERE seq <= ?", (departed_upto,))
+
+def merge_candidates(conn: sqlite3.Connection, since_rowid: int | None = None) -> Iterator[dict]:
+    if since_rowid is None:
+        cur = conn.execute("""
+            SELECT cid, capability, pyn_id, last_seen_utc FROM cid_capability_owners
+            ORDER BY cid, capability, pyn_id
+        """)
+    else:
+        cur = conn.execute("""
+            SELECT o.cid, o.capability, o.pyn_id, o.last_seen_utc
+            FROM (
+              SELECT DISTINCT artifact_id AS cid, capability FROM scan_events
+              WHERE rowid > ? AND artifact_type = 'CID' AND capability IS NOT NULL
+            ) AS t
+            JOIN cid_capability_owners o ON o.cid = t.cid AND o.capability = t.capability
+            ORDER BY o.cid, o.capability, o.pyn_id
+        """, (since_rowid,))
+    for (cid, cap), grp in itertools.groupby(cur, key=lambda r: (r[0], r[1])):
+        owners = [{"pyn_id": p, "last_seen_utc": ts} for _, _, p, ts in grp]
+        if len(owners) > 1:
+            yield {"report": "merge-candidates", "cid": cid, "capability": cap,
+                   "count": len(owners), "owners": owners}
+
+RUNNERS = {"identicals": identicals, "merge-candidates": merge_candidates}
@@ -0,0 +1,221 @@
+"""
+Registry schema v2: interned integer keys instead of repeated TEXT.
+
+  artifacts  every ID string seen (artifact, parent, supersedes, pyn) once
+  scans      scan_id -> small int, with the scan's start in epoch ms
+  labels          capability and env strings
+  metadata_blobs  each distinct metadata_json once, keyed by meta_hash()
+  events          one row per scan_events row, all small integers
+
+`scan_events` becomes a view over these with the v1 column names and order
+(plus the promoted metadata columns and `rowid`), and an INSTEAD OF INSERT
+trigger interns new rows, so the indexer and the registry writers keep
+working unchanged. Feature triggers (artifacts_current, lineage, ...) attach
+to the view with INSTEAD OF as well; see insert_timing().
+
+Metadata is content-addressed: the trigger canonicalizes the JSON (sorted
+keys, compact), hashes it, and events keep only the blob's id. Connections
+that write need meta_canonical()/meta_hash() registered, which
+registry.connect does; readers don't.
+
+Build a v2 database from a v1 one with migrate_v2.py.
+"""
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import sqlite3
+
+TYPE_CODES = {"PYN": 1, "SID": 2, "CID": 3}
+STATUS_CODES = {"none": 0, "inventory": 1, "runnable": 2}
+
+def case_map(expr: str, mapping: dict, reverse: bool = False) -> str:
+    pairs = [(v, repr(k)) for k, v in mapping.items()] if reverse else [(repr(k), v) for k, v in mapping.items()]
+    whens = " ".join(f"WHEN {a} THEN {b}" for a, b in pairs)
+    return f"CASE {expr} {whens} END"
+
+def iso_to_ms(expr: str) -> str:
+    return f"CAST(ROUND((julianday({expr}) - 2440587.5) * 86400000) AS INTEGER)"
+
+def ms_to_iso(expr: str) -> str:
+    return f"strftime('%Y-%m-%dT%H:%M:%fZ', {expr} / 1000.0, 'unixepoch')"
+
+def meta_json(expr: str, *keys: str) -> str:
+    picks = ", ".join(f"json_extract({expr}, '$.{k}')" for k in keys)
+    if len(keys) > 1:
+        picks = f"COALESCE({picks})"
+    return f"CASE WHEN json_valid({expr}) THEN {picks} END"
+
+@functools.lru_cache(maxsize=4096)
+def meta_canonical(text: str | None) -> str | None:
+    if text is None:
+        return None
+    try:
+        return json.dumps(json.loads(text), separators=(",", ":"), sort_keys=True)
+    except ValueError:
+        return text  # kept as given; readers guard with json_valid()
+
+@functools.lru_cache(maxsize=4096)
+def meta_hash(text: str | None) -> bytes | None:
+    canon = meta_canonical(text)
+    return None if canon is None else hashlib.sha256(canon.encode("utf-8")).digest()[:16]
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    conn.create_function("meta_canonical", 1, meta_canonical, deterministic=True)
+    conn.create_function("meta_hash", 1, meta_hash, deterministic=True)
+
+METADATA_BLOBS_SQL = f"""
+CREATE TABLE IF NOT EXISTS metadata_blobs (
+  id   INTEGER PRIMARY KEY,
+  hash BLOB    NOT NULL UNIQUE, -- meta_hash(): first 16 bytes of sha256(canonical json)
+  json TEXT    NOT NULL         -- canonical: sorted keys, compact separators
+);
+CREATE INDEX IF NOT EXISTS ix_metadata_blobs_code_hash ON metadata_blobs({meta_json("json", "code_hash_full")});
+"""
+
+TABLES_SQL = f"""
+CREATE TABLE IF NOT EXISTS artifacts (
+  id          INTEGER PRIMARY KEY,
+  artifact_id TEXT    NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS scans (
+  id         INTEGER PRIMARY KEY,
+  scan_id    TEXT    NOT NULL UNIQUE,
+  started_ms INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS labels (
+  id    INTEGER PRIMARY KEY,
+  label TEXT    NOT NULL UNIQUE
+);
+
+{METADATA_BLOBS_SQL}
+CREATE TABLE IF NOT EXISTS events (
+  scan          INTEGER NOT NULL,           -- scans.id
+  type          INTEGER NOT NULL,           -- 1 PYN, 2 SID, 3 CID
+  artifact      INTEGER NOT NULL,           -- artifacts.id
+  ts_ms         INTEGER NOT NULL,           -- epoch ms, UTC
+  parent        INTEGER,                    -- artifacts.id
+  supersedes    INTEGER,
+  superseded_by INTEGER,
+  pyn           INTEGER,
+  sid_count     INTEGER NOT NULL DEFAULT 0,
+  cid_count     INTEGER NOT NULL DEFAULT 0,
+  capability    INTEGER,                    -- labels.id
+  standalone    INTEGER NOT NULL DEFAULT 0, -- 0 none, 1 inventory, 2 runnable
+  env_first     INTEGER,                    -- labels.id
+  env_last      INTEGER,                    -- labels.id
+  env_seen_json TEXT,
+  meta          INTEGER                     -- metadata_blobs.id
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_events_scan_artifact ON events(scan, type, artifact);
+CREATE INDEX IF NOT EXISTS ix_events_artifact ON events(artifact, type);
+CREATE INDEX IF NOT EXISTS ix_events_time ON events(ts_ms);
+CREATE INDEX IF NOT EXISTS ix_events_capability ON events(capability) WHERE capability IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_events_env_last ON events(env_last) WHERE env_last IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_events_meta ON events(meta) WHERE meta IS NOT NULL;
+"""
+
+VIEW_SQL = f"""
+CREATE VIEW IF NOT EXISTS scan_events AS
+SELECT
+  {ms_to_iso("e.ts_ms")} AS timestamp_utc,
+  s.scan_id AS scan_id,
+  {case_map("e.type", TYPE_CODES, reverse=True)} AS artifact_type,
+  a.artifact_id AS artifact_id,
+  ap.artifact_id AS parent_id,
+  asup.artifact_id AS supersedes_id,
+  asby.artifact_id AS superseded_by_id,
+  apyn.artifact_id AS pyn_id,
+  e.sid_count AS sid_count,
+  e.cid_count AS cid_count,
+  lc.label AS capability,
+  {case_map("e.standalone", STATUS_CODES, reverse=True)} AS standalone_status,
+  mb.json AS metadata_json,
+  lf.label AS use_env_first,
+  COALESCE(ll.label, {meta_json("mb.json", "use_env_last")}) AS use_env_last,
+  e.env_seen_json AS use_env_seen_json,
+  {meta_json("mb.json", "cid_sequence", "cid_seq")} AS cid_sequence,
+  {meta_json("mb.json", "code_hash_full")} AS code_hash_full,
+  {meta_json("mb.json", "description")} AS description,
+  e.meta AS metadata_id, -- same id, same blob: readers can memoize parses on it
+  e.rowid AS rowid
+FROM events e
+JOIN scans s ON s.id = e.scan
+JOIN artifacts a ON a.id = e.artifact
+LEFT JOIN artifacts ap ON ap.id = e.parent
+LEFT JOIN artifacts asup ON asup.id = e.supersedes
+LEFT JOIN artifacts asby ON asby.id = e.superseded_by
+LEFT JOIN artifacts apyn ON apyn.id = e.pyn
+LEFT JOIN labels lc ON lc.id = e.capability
+LEFT JOIN labels lf ON lf.id = e.env_first
+LEFT JOIN labels ll ON ll.id = e.env_last
+LEFT JOIN metadata_blobs mb ON mb.id = e.meta
+ORDER BY e.rowid; -- v1 readers get rows in insertion order, as from the table
+"""
+
+def intern(table: str, col: str, expr: str) -> str:
+    return f"INSERT OR IGNORE INTO {table} ({col}) SELECT {expr} WHERE {expr} IS NOT NULL;"
+
+def ref(table: str, col: str, expr: str) -> str:
+    return f"(SELECT id FROM {table} WHERE {col} = {expr})"
+
+INSERT_TRIGGER_SQL = f"""
+CREATE TRIGGER IF NOT EXISTS tr_scan_events_v2_insert
+INSTEAD OF INSERT ON scan_events
+BEGIN
+  INSERT OR IGNORE INTO scans (scan_id, started_ms) VALUES (NEW.scan_id, {iso_to_ms("NEW.timestamp_utc")});
+  {intern("artifacts", "artifact_id", "NEW.artifact_id")}
+  {intern("artifacts", "artifact_id", "NEW.parent_id")}
+  {intern("artifacts", "artifact_id", "NEW.supersedes_id")}
+  {intern("artifacts", "artifact_id", "NEW.superseded_by_id")}
+  {intern("artifacts", "artifact_id", "NEW.pyn_id")}
+  {intern("labels", "label", "NEW.capability")}
+  {intern("labels", "label", "NEW.use_env_first")}
+  {intern("labels", "label", "NEW.use_env_last")}
+  INSERT OR IGNORE INTO metadata_blobs (hash, json)
+  SELECT meta_hash(NEW.metadata_json), meta_canonical(NEW.metadata_json) WHERE NEW.metadata_json IS NOT NULL;
+  INSERT INTO events (
+    scan, type, artifact, ts_ms, parent, supersedes, superseded_by, pyn,
+    sid_count, cid_count, capability, standalone, env_first, env_last, env_seen_json, meta
+  )
+  VALUES (
+    {ref("scans", "scan_id", "NEW.scan_id")},
+    {case_map("NEW.artifact_type", TYPE_CODES)},
+    {ref("artifacts", "artifact_id", "NEW.artifact_id")},
+    {iso_to_ms("NEW.timestamp_utc")},
+    {ref("artifacts", "artifact_id", "NEW.parent_id")},
+    {ref("artifacts", "artifact_id", "NEW.supersedes_id")},
+    {ref("artifacts", "artifact_id", "NEW.superseded_by_id")},
+    {ref("artifacts", "artifact_id", "NEW.pyn_id")},
+    COALESCE(NEW.sid_count, 0),
+    COALESCE(NEW.cid_count, 0),
+    {ref("labels", "label", "NEW.capability")},
+    COALESCE({case_map("NEW.standalone_status", STATUS_CODES)}, 0),
+    {ref("labels", "label", "NEW.use_env_first")},
+    {ref("labels", "label", "NEW.use_env_last")},
+    NEW.use_env_seen_json,
+    (SELECT id FROM metadata_blobs WHERE hash = meta_hash(NEW.metadata_json))
+  );
+END;
+"""
+
+def is_v2(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'scan_events'").fetchone()
+    return bool(row) and row[0] == "view"
+
+def insert_timing(conn: sqlite3.Connection) -> str:
+    # Triggers on a view must be INSTEAD OF; every one of them fires per insert.
+    return "INSTEAD OF INSERT" if is_v2(conn) else "AFTER INSERT"
+
+def metadata_ids(conn: sqlite3.Connection, key: str, value) -> list[int]:
+    """Blob ids whose metadata has `key` == value (indexed for code_hash_full)."""
+    return [r[0] for r in conn.execute(
+        f"SELECT id FROM metadata_blobs WHERE {meta_json('json', key)} = ?", (value,)
+    )]
+
+def create_schema(conn: sqlite3.Connection) -> None:
+    conn.executescript(TABLES_SQL + VIEW_SQL + INSERT_TRIGGER_SQL)
@@ -0,0 +1,203 @@
+"""
+Log shipping between registries on different machines.
+
+  registry.py export-since <rowid> --out mac1.jsonl.gz   (on the scanner)
+  registry.py import mac1.jsonl.gz                      (on the merge target)
+
+An export is gzip JSON lines: one header object, then one compact array per
+scan_events row past the watermark, in rowid order. Imported scan_ids are
+namespaced as "<origin>:<scan_id>" so two machines' YYYYMMDD-NNNNN counters
+never collide; rows that already carry a prefix keep it, so exports can be
+forwarded through an intermediate registry.
+
+Import is idempotent: rows are checked against ux_scan_events_scan_artifact
+(the scan_id, artifact_type, artifact_id key) a batch at a time and only new
+ones are written, through registry.write_rows like any other append. The
+highest source rowid applied per origin is kept in import_state, committed
+with each batch, so an interrupted import resumes where it stopped.
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import re
+import socket
+import sqlite3
+import sys
+from typing import IO, Iterator
+
+import registry  # attribute access at call time only; registry -> migrations imports us
+
+FORMAT = "registry-log/1"
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS import_state (
+  origin        TEXT    PRIMARY KEY,
+  last_rowid    INTEGER NOT NULL, -- highest source rowid applied from this origin
+  rows_imported INTEGER NOT NULL DEFAULT 0,
+  updated_utc   TEXT    NOT NULL
+);
+"""
+
+# Starts with a letter so a prefixed scan_id never sorts inside a local
+# YYYYMMDD- range (see registry.seed_scan_counter).
+ORIGIN_RE = re.compile(r"^[A-Za-z][A-Za-z0-9_.-]*$")
+
+# Everything a row needs to be re-inserted; same order as registry.INSERT_SQL.
+COLUMNS = [
+    "timestamp_utc", "scan_id", "artifact_type", "artifact_id",
+    "parent_id", "supersedes_id", "superseded_by_id", "pyn_id",
+    "sid_count", "cid_count", "capability", "standalone_status", "metadata_json",
+    "use_env_first", "use_env_last", "use_env_seen_json",
+]
+
+def ensure_shipping(conn: sqlite3.Connection) -> None:
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'import_state'").fetchone():
+        return
+    import migrations  # imports this module at load time
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        migrations.run_script(conn, SCHEMA_SQL)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+# --- origin
+
+def origin(conn: sqlite3.Connection) -> str:
+    """This registry's origin name; defaults to the host name on first use."""
+    row = conn.execute("SELECT value FROM registry_settings WHERE key = 'origin'").fetchone()
+    if row:
+        return row[0]
+    name = re.sub(r"[^A-Za-z0-9_.-]", "-", socket.gethostname().split(".")[0]) or "origin"
+    if not name[0].isalpha():
+        name = f"h{name}"
+    set_origin(conn, name)
+    return name
+
+def set_origin(conn: sqlite3.Connection, name: str) -> None:
+    if not ORIGIN_RE.match(name):
+        raise ValueError(f"origin must match {ORIGIN_RE.pattern}, got {name!r}")
+    conn.execute(
+        "INSERT INTO registry_settings (key, value) VALUES ('origin', ?) "
+        "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (name,),
+    )
+    conn.commit()
+
+def namespaced(scan_id: str, src_origin: str, local_origin: str) -> str:
+    if ":" not in scan_id:
+        return f"{src_origin}:{scan_id}"
+    if scan_id.startswith(f"{local_origin}:"):
+        # One of our own rows coming back from another registry.
+        return scan_id[len(local_origin) + 1:]
+    return scan_id
+
+# --- export
+
+def export_since(conn: sqlite3.Connection, since_rowid: int, out: IO[bytes]) -> tuple[int, int]:
+    """Write rows with rowid > since_rowid; returns (rows, new watermark)."""
+    upto = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM scan_events").fetchone()[0]
+    n = conn.execute(
+        "SELECT COUNT(*) FROM scan_events WHERE rowid > ? AND rowid <= ?", (since_rowid, upto)
+    ).fetchone()[0]
+    header = {
+        "format": FORMAT, "origin": origin(conn), "columns": ["rowid", *COLUMNS],
+        "from_rowid": since_rowid, "to_rowid": upto, "rows": n,
+    }
+    with gzip.open(out, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(header, separators=(",", ":")) + "\n")
+        cur = conn.execute(
+            f"SELECT rowid, {', '.join(COLUMNS)} FROM scan_events WHERE rowid > ? AND rowid <= ? ORDER BY rowid",
+            (since_rowid, upto),
+        )
+        for row in cur:
+            f.write(json.dumps(row, separators=(",", ":")) + "\n")
+    return n, upto
+
+# --- import
+
+def read_export(f: IO[bytes]) -> tuple[dict, Iterator[list]]:
+    lines = gzip.open(f, "rt", encoding="utf-8")
+    header = json.loads(next(lines))
+    if header.get("format") != FORMAT:
+        raise ValueError(f"not a registry export (format {header.get('format')!r})")
+    if not ORIGIN_RE.match(header.get("origin") or ""):
+        raise ValueError(f"bad origin in export header: {header.get('origin')!r}")
+    return header, (json.loads(line) for line in lines if line.strip())
+
+def import_watermark(conn: sqlite3.Connection, src_origin: str) -> int:
+    row = conn.execute("SELECT last_rowid FROM import_state WHERE origin = ?", (src_origin,)).fetchone()
+    return row[0] if row else 0
+
+def existing_keys(conn: sqlite3.Connection, params: list[tuple]) -> set[tuple]:
+    # A batch spans few scans; one ux_scan_events_scan_artifact range per scan_id.
+    scan_ids = sorted({p[1] for p in params})
+    marks = ", ".join("?" for _ in scan_ids)
+    return set(conn.execute(
+        f"SELECT scan_id, artifact_type, artifact_id FROM scan_events WHERE scan_id IN ({marks})", scan_ids
+    ).fetchall())
+
+def import_batch(conn: sqlite3.Connection, src_origin: str, batch: list[list], local: str) -> int:
+    params = [
+        (r[1], namespaced(r[2], src_origin, local), *r[3:len(COLUMNS) + 1])
+        for r in batch
+    ]
+    have = existing_keys(conn, params)
+    new = []
+    for p in params:
+        key = (p[1], p[2], p[3])
+        if key not in have:
+            have.add(key)
+            new.append(p)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if new:
+            registry.write_rows(conn, new)
+        conn.execute(
+            """
+            INSERT INTO import_state (origin, last_rowid, rows_imported, updated_utc) VALUES (?, ?, ?, ?)
+            ON CONFLICT (origin) DO UPDATE SET
+              last_rowid = MAX(last_rowid, excluded.last_rowid),
+              rows_imported = rows_imported + excluded.rows_imported,
+              updated_utc = excluded.updated_utc
+            """,
+            (src_origin, batch[-1][0], len(new), registry.iso_utc_ms(registry.now_utc())),
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(new)
+
+def import_file(conn: sqlite3.Connection, f: IO[bytes], batch_size: int | None = None) -> dict:
+    batch_size = batch_size or registry.BATCH_SIZE
+    header, rows = read_export(f)
+    src_origin = header["origin"]
+    local = origin(conn)
+    if src_origin == local:
+        raise ValueError(f"export comes from this registry (origin {local!r})")
+    cols = header.get("columns") or []
+    if cols != ["rowid", *COLUMNS]:
+        raise ValueError(f"unsupported export columns: {cols}")
+
+    mark = import_watermark(conn, src_origin)
+    if header["from_rowid"] > mark:
+        print(f"WARNING: {src_origin}: export starts after rowid {header['from_rowid']}, "
+              f"last imported is {mark}; rows in between are missing", file=sys.stderr)
+
+    seen = new = 0
+    batch: list[list] = []
+    for r in rows:
+        seen += 1
+        if r[0] <= mark:
+            continue  # already applied by an earlier import
+        batch.append(r)
+        if len(batch) >= batch_size:
+            new += import_batch(conn, src_origin, batch, local)
+            batch = []
+    if batch:
+        new += import_batch(conn, src_origin, batch, local)
+    return {"origin": src_origin, "rows": seen, "new": new, "watermark": max(mark, header["to_rowid"])}
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Stress check for the scan_id allocator.
+
+Runs several appender processes in parallel against one registry, half of
+them through registry.py and half through scan_append.py, then checks that
+every appended row received its own scan_id and that none of them hit
+ux_scan_events_scan_artifact.
+
+  python3 modules/registry/stress_scan_ids.py --workers 8 --appends 200
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import multiprocessing as mp
+import pathlib
+import sqlite3
+import sys
+import tempfile
+import time
+
+import registry
+import scan_append
+
+def worker(db: str, worker_n: int, appends: int) -> int:
+    failures = 0
+    for i in range(appends):
+        argv = ["--artifact-type", "PYN", "--artifact-id", "STRESS_PYN"]
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                if worker_n % 2:
+                    rc = scan_append.main(["--db", db, *argv])
+                else:
+                    rc = registry.main(["--db", db, "append", *argv])
+        except sqlite3.Error as e:
+            print(f"worker {worker_n} append {i}: {e}", file=sys.stderr)
+            rc = 1
+        failures += rc != 0
+    return failures
+
+def main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(description="Parallel appenders against the scan_id allocator.")
+    p.add_argument("--db", help="Registry to hammer (default: a fresh temp db)")
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--appends", type=int, default=200, help="Appends per worker")
+    args = p.parse_args(argv)
+
+    tmp = None
+    if args.db:
+        db = pathlib.Path(args.db)
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        db = pathlib.Path(tmp.name) / "registry.sqlite"
+
+    with registry.connect(db) as conn:
+        registry.init_db(conn)
+        before = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM scan_events").fetchone()[0]
+
+    t0 = time.perf_counter()
+    with mp.Pool(args.workers) as pool:
+        failures = sum(pool.starmap(
+            worker, [(str(db), n, args.appends) for n in range(args.workers)]
+        ))
+    elapsed = time.perf_counter() - t0
+
+    with registry.connect(db) as conn:
+        rows, distinct = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT scan_id) FROM scan_events WHERE rowid > ?",
+            (before,),
+        ).fetchone()
+    if tmp:
+        tmp.cleanup()
+
+    expected = args.workers * args.appends
+    print(f"{rows} appends in {elapsed:.2f}s ({rows / elapsed:,.0f}/sec), "
+          f"{failures} failed, {rows - distinct} duplicate scan_ids")
+    ok = failures == 0 and rows == expected and rows == distinct
+    print("OK" if ok else "FAIL")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))